@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线批量分析脚本
+不启动 Flask，流式读取语料（每行一首，或 JSONL），并行分析后逐行写出 NDJSON 结果。
+
+用法示例：
+    python analyze_corpus.py poems.txt -o results.ndjson --workers 8
+    cat poems.jsonl | python analyze_corpus.py - --format jsonl > results.ndjson
+
+JSONL 每行为 {"text": "...", "rhymebook": "2", "id": ...}，rhymebook 与 id 可省略。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, TextIO
+
+from app_pkg.services.analysis import wrap_analysis_result
+from app_pkg.services.batch import default_worker_count, iter_analyze
+
+
+def read_items(stream: TextIO, fmt: str, rhymebook: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取输入，产出 {id, text, rhymebook}；空行跳过，无法解析的 JSON 行原样交给分析环节报错。"""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if fmt == 'jsonl' or (fmt == 'auto' and line.startswith('{')):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield {"id": line_no, "text": None, "rhymebook": rhymebook}
+                continue
+            if not isinstance(record, dict):
+                record = {"text": None}
+            yield {
+                "id": record.get("id", line_no),
+                "text": record.get("text"),
+                "rhymebook": str(record.get("rhymebook", rhymebook)),
+            }
+        else:
+            yield {"id": line_no, "text": line, "rhymebook": rhymebook}
+
+
+def summarize(data: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ("cipai_name", "author", "score", "length", "split_length", "multiple_matches")
+    summary = {key: data[key] for key in keys if key in data}
+    if "issues" in data:
+        summary["issue_count"] = len(data["issues"])
+    if "matching_cipai" in data:
+        summary["matching_cipai"] = [
+            {k: m.get(k) for k in ("cipai_name", "author", "score")} for m in data["matching_cipai"]
+        ]
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="离线批量分析诗词语料，输出 NDJSON")
+    parser.add_argument('input', help="输入文件路径，- 表示标准输入")
+    parser.add_argument('-o', '--output', default='-', help="输出文件路径，默认标准输出")
+    parser.add_argument('--format', choices=('auto', 'text', 'jsonl'), default='auto',
+                        help="输入格式：text 每行一首，jsonl 每行一个对象，auto 按行首是否为 { 判断")
+    parser.add_argument('--rhymebook', default='2', help="默认韵书：1 词林正韵，2 中华新韵")
+    parser.add_argument('--workers', type=int, default=default_worker_count(), help="并行进程数")
+    parser.add_argument('--chunk-size', type=int, default=64, help="每个分块的条数")
+    parser.add_argument('--summary', action='store_true', help="只输出词牌、得分等摘要字段")
+    parser.add_argument('--progress-interval', type=float, default=2.0, help="吞吐量报告间隔（秒）")
+    args = parser.parse_args()
+
+    # 输入输出路径相对于调用者的当前目录，须在切换目录前转为绝对路径
+    input_path = None if args.input == '-' else os.path.abspath(args.input)
+    output_path = None if args.output == '-' else os.path.abspath(args.output)
+    # 数据文件使用相对路径，切换到项目根目录
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    in_stream = sys.stdin if input_path is None else open(input_path, 'r', encoding='utf-8')
+    out_stream = sys.stdout if output_path is None else open(output_path, 'w', encoding='utf-8')
+
+    start = time.perf_counter()
+    last_report = start
+    done = 0
+    failed = 0
+    try:
+        items = read_items(in_stream, args.format, args.rhymebook)
+        for item, result in iter_analyze(items, workers=args.workers, chunk_size=args.chunk_size):
+            wrapped = wrap_analysis_result(result)
+            if not wrapped["success"]:
+                failed += 1
+            elif args.summary:
+                wrapped["data"] = summarize(wrapped["data"])
+            wrapped["id"] = item["id"]
+            out_stream.write(json.dumps(wrapped, ensure_ascii=False) + '\n')
+            done += 1
+
+            now = time.perf_counter()
+            if now - last_report >= args.progress_interval:
+                out_stream.flush()
+                rate = done / (now - start)
+                print(f"已处理 {done} 首（失败 {failed}），{rate:.1f} 首/秒", file=sys.stderr)
+                last_report = now
+    finally:
+        out_stream.flush()
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"完成：共 {done} 首（失败 {failed}），用时 {elapsed:.1f} 秒，{rate:.1f} 首/秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
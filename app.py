@@ -1,15 +1,40 @@
 from app_pkg import create_app
+import argparse
+import os
+import signal
 import socket
+import sys
 
 
-app = create_app()
+# 批量分析的进程池（forkserver / spawn）会以 __mp_main__ 的名义重新导入本文件，子进程中不创建应用
+if __name__ != '__mp_main__':
+    app = create_app()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="启动诗词分析 Web 服务")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=5000, help="监听端口")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="工作进程数；大于 1 时由父进程预加载数据后 fork 出多个进程共享监听端口")
+    parser.add_argument('--threads', type=int, default=4, help="每个进程处理请求的线程数")
+    parser.add_argument('--connection-limit', type=int, default=100, help="每个进程同时打开的连接数上限")
+    parser.add_argument('--backlog', type=int, default=1024, help="监听队列长度")
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help="工作进程处理满这么多请求后平滑退出并由新进程替换，0 表示不限")
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help="在 --max-requests 上随机增加 0 到该值，错开各进程的替换时间")
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help="平滑退出时等待进行中请求完成的最长时间（秒）")
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
     from waitress import serve
 
-    host = '0.0.0.0'
-    port = 5000
+    args = parse_args()
+    host = args.host
+    port = args.port
 
     # Compose local and LAN URLs for convenience
     urls = [f"http://127.0.0.1:{port}"]
@@ -28,4 +53,22 @@ if __name__ == '__main__':
         "Application started. Available at: " + ", ".join(urls)
     )
 
-    serve(app, host=host, port=port)
\ No newline at end of file
+    adjustments = dict(threads=args.threads, connection_limit=args.connection_limit, backlog=args.backlog)
+    # 多进程依赖 fork，Windows 上只能单进程运行
+    if (args.workers > 1 or args.max_requests) and hasattr(os, 'fork'):
+        from app_pkg.server import PreforkServer, bind_socket
+
+        server = PreforkServer(
+            app,
+            bind_socket(host, port, args.backlog),
+            workers=max(args.workers, 1),
+            max_requests=args.max_requests,
+            max_requests_jitter=args.max_requests_jitter,
+            graceful_timeout=args.graceful_timeout,
+            **adjustments,
+        )
+        server.run()
+    else:
+        # SIGTERM 时正常退出，让 atexit 中的清理（批量分析进程池、日志队列）得以执行
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        serve(app, host=host, port=port, **adjustments)
\ No newline at end of file
@@ -1,8 +1,12 @@
+import hmac
 import os
 import logging
-from logging.handlers import RotatingFileHandler
+import random
+from logging.handlers import QueueHandler, RotatingFileHandler
 from flask import Flask, request, g
 
+from .services.logqueue import ACCESS_LOGGER_NAME, StructuredFormatter, start_queue_logging
+
 
 def create_app() -> Flask:
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -15,79 +19,220 @@ def create_app() -> Flask:
     from .routes import bp as main_bp
     app.register_blueprint(main_bp)
 
-    # ----- Logging setup -----
-    logs_dir = os.path.join(base_dir, 'logs')
-    os.makedirs(logs_dir, exist_ok=True)
+    # ----- Batch analysis -----
+    from .services.batch import default_worker_count
+    app.config.setdefault('ANALYZE_BATCH_WORKERS', default_worker_count())
+    app.config.setdefault('ANALYZE_BATCH_MAX_ITEMS', 1000)
+
+    # ----- /analyze result cache -----
+    from .services.cache import VersionedLRUCache, latest_generation, pin_generation, unpin_generation
+    from .services.datafiles import data_signature
+
+    def _data_version():
+        """结果缓存与分析会话的数据版本：重载换入的版本号；关闭热重载时另加数据文件签名，文件改动后同样作废。"""
+        if app.config.get('DATA_RELOAD_INTERVAL', 2.0) > 0:
+            return latest_generation().number
+        return latest_generation().number, data_signature()
+
+    app.config.setdefault('ANALYZE_CACHE_MAX_ENTRIES', 2048)
+    app.config.setdefault('ANALYZE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    app.config.setdefault('ANALYZE_CACHE_TTL', 3600)
+    # 数据重载换入新版本（或关闭热重载时数据文件变化）后自动清空
+    app.extensions['analyze_cache'] = VersionedLRUCache(
+        version_fn=_data_version,
+        max_entries=app.config['ANALYZE_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['ANALYZE_CACHE_MAX_BYTES'],
+        ttl=app.config['ANALYZE_CACHE_TTL'],
+    )
+
+    # ----- Analysis sessions -----
+    # /analyze 的中间结果（文本版式、声调标注、候选词牌），供 /select_yunjiao 等后续请求按 session_id 复用
+    app.config.setdefault('SESSION_MAX_ENTRIES', 4096)
+    app.config.setdefault('SESSION_MAX_BYTES', 32 * 1024 * 1024)
+    app.config.setdefault('SESSION_TTL', 1800)
+    # 候选词牌按行号保存，数据版本变化后一并作废
+    app.extensions['analysis_sessions'] = VersionedLRUCache(
+        version_fn=_data_version,
+        max_entries=app.config['SESSION_MAX_ENTRIES'],
+        max_bytes=app.config['SESSION_MAX_BYTES'],
+        ttl=app.config['SESSION_TTL'],
+    )
 
-    # Rotating file handler
-    file_handler = RotatingFileHandler(
-        os.path.join(logs_dir, 'app.log'),
-        maxBytes=5 * 1024 * 1024,  # 5 MB
-        backupCount=5,
-        encoding='utf-8',
+    # ----- Data hot reload -----
+    # 每 DATA_RELOAD_INTERVAL 秒检查数据文件，变化后在后台重建受影响的加载函数与索引并整体换入；设为 0 关闭。
+    # 每个请求固定在开始时的数据版本上，结果缓存与分析会话也按版本区分
+    from .services.batch import retire_executor
+    from .services.registry import start_data_registry
+    app.config.setdefault('DATA_RELOAD_INTERVAL', 2.0)
+    registry = start_data_registry(app.config['DATA_RELOAD_INTERVAL'])
+    # 批量分析的工作进程各自缓存了数据，换入新版本后改用新进程池
+    registry.add_listener(lambda generation: retire_executor())
+    app.extensions['data_registry'] = registry
+
+    # ----- Metrics (/metrics) -----
+    from .services import metrics as metrics_mod
+    metrics = metrics_mod.create_http_metrics()
+    metrics.add_collector(metrics_mod.loader_cache_families)
+    metrics.add_collector(metrics_mod.index_size_families)
+    metrics.add_collector(
+        lambda: metrics_mod.result_cache_families(app.extensions['analyze_cache'], 'analyze')
     )
-    formatter = logging.Formatter(
-        '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+    metrics.add_collector(
+        lambda: metrics_mod.result_cache_families(app.extensions['analysis_sessions'], 'sessions')
     )
-    file_handler.setFormatter(formatter)
+    metrics.add_collector(lambda: metrics_mod.data_registry_families(registry))
+    app.extensions['metrics'] = metrics
 
-    # Attach handlers (avoid duplicates when reloading)
-    if not any(isinstance(h, RotatingFileHandler) for h in app.logger.handlers):
-        app.logger.addHandler(file_handler)
+    # ----- Logging setup -----
+    logs_dir = os.path.join(base_dir, 'logs')
+    os.makedirs(logs_dir, exist_ok=True)
 
-    # Ensure console output in addition to file
-    if not any(isinstance(h, logging.StreamHandler) for h in app.logger.handlers):
+    # 请求线程只把日志记录放入队列；格式化、写文件（含 5 MB 轮转）与写控制台都在后台监听线程中完成。
+    # 同一进程多次 create_app 时沿用已启动的监听线程
+    if not any(isinstance(h, QueueHandler) for h in app.logger.handlers):
+        # Rotating file handler
+        file_handler = RotatingFileHandler(
+            os.path.join(logs_dir, 'app.log'),
+            maxBytes=5 * 1024 * 1024,  # 5 MB
+            backupCount=5,
+            encoding='utf-8',
+        )
+        formatter = StructuredFormatter(
+            '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+        )
+        file_handler.setFormatter(formatter)
+
+        # Console output in addition to file (replaces Flask's default handler)
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
-        app.logger.addHandler(console_handler)
+
+        start_queue_logging(app.logger, [file_handler, console_handler])
 
     app.logger.setLevel(logging.INFO)
 
+    # 静态文件的访问日志按比例抽样
+    app.config.setdefault('ACCESS_LOG_STATIC_SAMPLE_RATE', 0.01)
+    access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
+
     # Also route third-party logs (e.g., waitress) to the same level
     logging.getLogger('waitress').setLevel(logging.INFO)
 
     # Immediate init log to confirm logging is working even before serving
     app.logger.info("Application initialized. Logging configured. Waiting for server to start...")
 
+    # ----- Background data warm-up -----
+    # 关闭时数据在首个请求中按需加载，/readyz 始终报告就绪
+    app.config.setdefault('WARMUP_ON_START', True)
+    if app.config['WARMUP_ON_START']:
+        from .routes import _cipai_list_payload
+        from .services.warmup import Warmup, default_warmup_steps
+        warmup = Warmup(default_warmup_steps() + [('cipai_list_payload', _cipai_list_payload)])
+        app.extensions['warmup'] = warmup
+        warmup.start()
+
+    # ----- Opt-in request profiling -----
+    # 按 PROFILE_SAMPLE_RATE 抽样剖析请求（无需令牌）；配置了 PROFILE_TOKEN 时，
+    # 请求头 PROFILE_HEADER 的值与之相同的请求也会被剖析。未配置令牌时忽略该请求头，/profiles 接口也不开放
+    from .services.profiling import ProfileStore, start_profiler
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_HEADER', 'X-Profile')
+    app.config.setdefault('PROFILE_TOKEN', None)
+    app.config.setdefault('PROFILE_DIR', os.path.join(base_dir, 'logs', 'profiles'))
+    app.config.setdefault('PROFILE_MAX_FILES', 50)
+    app.extensions['profiles'] = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES'])
+
+    def _should_profile() -> bool:
+        if request.path.startswith(('/static/', '/profiles', '/metrics')):
+            return False
+        token = app.config['PROFILE_TOKEN']
+        header = request.headers.get(app.config['PROFILE_HEADER'])
+        if token and header and hmac.compare_digest(header, token):
+            return True
+        rate = app.config['PROFILE_SAMPLE_RATE']
+        return rate > 0 and random.random() < rate
+
     # ----- Per-request access logging -----
     @app.before_request
     def _log_request_start():
+        g._previous_generation = pin_generation()
         try:
             import time
             g._request_start_time = time.perf_counter()
         except Exception:
             g._request_start_time = None
+        # 以路由模板作为标签，未匹配的路径归为一类，避免标签数量无限增长
+        g._metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics_mod.record_request_start(metrics, g._metrics_route)
+        g._profiler = start_profiler() if _should_profile() else None
 
     @app.after_request
     def _log_request_end(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
         try:
             import time
             duration_ms = None
             if getattr(g, '_request_start_time', None) is not None:
                 duration_ms = (time.perf_counter() - g._request_start_time) * 1000.0
 
-            # Skip very noisy static requests at INFO level
+            route = getattr(g, '_metrics_route', None)
+            # 静态文件请求量大，只抽样记录；sample_rate 字段便于按比例还原总数
             is_static = request.path.startswith('/static/')
-            if duration_ms is not None:
-                msg = (
-                    f"{request.remote_addr} {request.method} {request.path} "
-                    f"{response.status_code} {duration_ms:.1f}ms"
+            static_rate = app.config['ACCESS_LOG_STATIC_SAMPLE_RATE']
+            if not is_static or (static_rate > 0 and random.random() < static_rate):
+                entry = {
+                    "remote_addr": request.remote_addr,
+                    "method": request.method,
+                    "path": request.path,
+                    "route": route,
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 1) if duration_ms is not None else None,
+                }
+                for key in ('text_length', 'match_count'):
+                    value = g.get(key)
+                    if value is not None:
+                        entry[key] = value
+                if is_static:
+                    entry["sample_rate"] = static_rate
+                access_logger.info(
+                    "%s %s %s", request.method, request.path, response.status_code,
+                    extra={"access": entry},
                 )
-            else:
-                msg = (
-                    f"{request.remote_addr} {request.method} {request.path} "
-                    f"{response.status_code}"
+
+            if route is not None:
+                metrics_mod.record_request_end(
+                    metrics, route, request.method, response.status_code,
+                    duration_ms / 1000.0 if duration_ms is not None else None,
                 )
 
-            if is_static:
-                app.logger.debug(msg)
-            else:
-                app.logger.info(msg)
+            if profiler is not None:
+                name = app.extensions['profiles'].save(profiler, {
+                    "method": request.method,
+                    "path": request.path,
+                    "route": route,
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 3) if duration_ms is not None else None,
+                    "content_length": request.content_length,
+                })
+                response.headers['X-Profile-Id'] = name
         except Exception:
             # Never fail the response due to logging
             pass
         return response
 
+    @app.teardown_request
+    def _track_request_teardown(exc):
+        if '_previous_generation' in g:
+            unpin_generation(g.pop('_previous_generation'))
+        # after_request 未执行（如响应处理中出错）时也要停止剖析
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        route = getattr(g, '_metrics_route', None)
+        if route is not None:
+            metrics_mod.record_request_teardown(metrics, route, exc is not None)
+
     return app
 
 
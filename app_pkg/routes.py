@@ -1,16 +1,30 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
-import re
-import ast
+from flask import Blueprint, render_template, request, jsonify, current_app, send_file, g
+import gzip
+import hashlib
+import hmac
+import json
+import os
 
 from .services.analysis import (
     estimate_poetry,
-    load_rhymebook_with_yunbu,
+    analyze_with_pattern,
+    load_tone_table,
     load_yunjiao,
-    preprocess_text,
-    load_cipai,
-    create_fillword_framework,
+    build_yunjiao_option,
+    load_cipai_patterns,
+    get_cipai_key_index,
     get_cipai_summary_list,
+    get_fillword_frameworks,
+    wrap_analysis_result,
 )
+from .services.batch import analyze_batch
+from .services.candidates import get_candidate_index, suggest_for_slot
+from .services.cache import current_generation, pin_generation, single_flight_cache, unpin_generation
+from .services.layout import build_text_layout
+from .services.live import apply_edits, format_sse, get_live_state, live_events, start_live_state
+from .services.search import get_cipai_search_index
+from .services.sessions import remember_session, restore_session, session_id_for
+from .services.patterns import encode_tone_pattern
 
 
 bp = Blueprint('main', __name__)
@@ -24,86 +38,226 @@ def fail(error_message: str):
     return jsonify({"success": False, "data": None, "error": error_message})
 
 
+def _note_analysis(text: str, envelope) -> None:
+    """记下文本长度与匹配到的词牌数，供访问日志使用。"""
+    g.text_length = len(text)
+    data = envelope.get("data") if envelope.get("success") else None
+    if not data:
+        g.match_count = 0
+    elif data.get("multiple_matches"):
+        g.match_count = len(data.get("matching_cipai") or [])
+    else:
+        g.match_count = 1
+
+
+# 后续请求只带 session_id、未附原文，而会话已被淘汰时返回 410，客户端据此改为提交完整参数
+SESSION_EXPIRED = "分析会话已过期，请重新提交文本"
+
+
+def _lookup_session(data):
+    """按请求中的 session_id 取分析会话；未提供时返回 (None, False)，已过期时返回 (None, True)。
+
+    请求同时带有 text 与 rhymebook 时，本进程中没有的会话（多进程模式下多由其他工作进程创建）按原文重建，不算过期。
+    """
+    session_id = data.get('session_id')
+    if not isinstance(session_id, str) or not session_id:
+        return None, False
+    session = restore_session(current_app.extensions['analysis_sessions'], session_id,
+                              data.get('text'), data.get('rhymebook', '2'))
+    return session, session is None
+
+
+def _etag_for(body: bytes) -> str:
+    return hashlib.md5(body).hexdigest()
+
+
+def _conditional(response, etag=None):
+    """为响应加上强 ETag；请求的 If-None-Match 命中时返回 304。"""
+    if etag is None:
+        etag = _etag_for(response.get_data())
+    if etag in request.if_none_match:
+        not_modified = current_app.response_class(status=304)
+        not_modified.set_etag(etag)
+        return not_modified
+    response.set_etag(etag)
+    return response
+
+
 @bp.route('/')
 def index():
     return render_template('index.html')
 
 
+@bp.route('/readyz')
+def readyz():
+    """负载均衡的就绪探针：数据预热完成前返回 503。"""
+    warmup = current_app.extensions.get('warmup')
+    if warmup is None:
+        return ok({"state": "disabled", "ready": True})
+    status = warmup.status()
+    if status["ready"]:
+        return ok(status)
+    response = jsonify({"success": False, "data": status, "error": "数据预热未完成"})
+    response.status_code = 503
+    return response
+
+
 @bp.route('/analyze', methods=['POST'])
 def analyze():
     data = request.get_json()
     text = data.get('text', '')
     rhymebook = data.get('rhymebook', '2')
+    auto_select = bool(data.get('auto_select', False))
 
     if not text.strip():
         return fail("请输入要分析的诗词文本")
 
-    result = estimate_poetry(text, rhymebook)
-    
-    # 统一包装
-    if isinstance(result, dict) and result.get("error"):
-        return fail(result.get("error"))
-    if isinstance(result, dict) and result.get("success") is False:
-        return fail(result.get("message") or "分析失败")
+    # 结果缓存按去掉空白后的文本 + 韵书 + auto_select + 数据版本区分
+    cache = current_app.extensions['analyze_cache']
+    cache_key = None
+    if isinstance(rhymebook, str):
+        cache_key = (build_text_layout(text).text_cleaned, rhymebook, auto_select, current_generation().number)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            envelope, cached_text, body, etag = cached
+            _note_analysis(text, envelope)
+            if envelope["success"]:
+                # 会话可能先于结果缓存被淘汰，按需重建
+                session_id = remember_session(
+                    current_app.extensions['analysis_sessions'], text, rhymebook, envelope["data"])
+            if cached_text == text or not envelope["success"]:
+                response = current_app.response_class(body, mimetype='application/json')
+                return _conditional(response, etag)
+            # 仅空白不同：沿用缓存结果，替换 original_text 与会话 id
+            envelope = dict(envelope)
+            envelope["data"] = dict(envelope["data"], original_text=text, session_id=session_id)
+            return _conditional(jsonify(envelope))
+
+    result = estimate_poetry(text, rhymebook, auto_select=auto_select)
+    envelope = wrap_analysis_result(result)
+    _note_analysis(text, envelope)
+    if envelope["success"] and isinstance(rhymebook, str):
+        envelope["data"]["session_id"] = remember_session(
+            current_app.extensions['analysis_sessions'], text, rhymebook, envelope["data"])
+    response = jsonify(envelope)
+    body = response.get_data()
+    etag = _etag_for(body)
+    # 数据文件加载失败等错误不缓存
+    if cache_key is not None and not (isinstance(result, dict) and result.get("error")):
+        cache.set(cache_key, (envelope, text, body, etag), size=len(body))
+    return _conditional(response, etag)
+
+
+@bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return ok({
+        "analyze": current_app.extensions['analyze_cache'].stats(),
+        "sessions": current_app.extensions['analysis_sessions'].stats(),
+        "data": current_app.extensions['data_registry'].status(),
+    })
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的进程内指标。"""
+    body = current_app.extensions['metrics'].render()
+    return current_app.response_class(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _profiles_denied():
+    """未配置 PROFILE_TOKEN 时接口不开放（404）；请求头或 token 参数与令牌不符时返回 403。"""
+    token = current_app.config.get('PROFILE_TOKEN')
+    if not token:
+        return fail("未开启剖析结果查看"), 404
+    supplied = request.headers.get(current_app.config['PROFILE_HEADER']) or request.args.get('token') or ''
+    if not hmac.compare_digest(supplied, token):
+        return fail("无权查看剖析结果"), 403
+    return None
+
+
+@bp.route('/profiles', methods=['GET'])
+def list_profiles():
+    """最近的请求剖析采集（新的在前）。"""
+    denied = _profiles_denied()
+    if denied is not None:
+        return denied
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+    return ok({"profiles": current_app.extensions['profiles'].list(limit)})
+
+
+@bp.route('/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """下载 pstats 格式的 .prof 文件；format=text 时返回按 sort 排序的文本摘要。"""
+    denied = _profiles_denied()
+    if denied is not None:
+        return denied
+    store = current_app.extensions['profiles']
+    path = store.path_for(name)
+    if path is None:
+        return fail("未找到该剖析结果"), 404
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'ncalls', 'pcalls'):
+            sort = 'cumulative'
+        limit = min(max(request.args.get('limit', 40, type=int), 1), 500)
+        return current_app.response_class(store.summary(name, sort, limit),
+                                          content_type='text/plain; charset=utf-8')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=os.path.basename(path))
+
+
+@bp.route('/analyze_batch', methods=['POST'])
+def analyze_batch_route():
+    data = request.get_json(silent=True) or {}
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return fail("请提供要分析的 items 数组")
+
+    max_items = current_app.config['ANALYZE_BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return fail(f"单次最多分析 {max_items} 条")
 
-    # 去掉内部的 success/message 字段
-    if isinstance(result, dict):
-        data = dict(result)
-        data.pop("success", None)
-        data.pop("message", None)
-        return ok(data)
-    return ok(result)
+    try:
+        results = analyze_batch(items, workers=current_app.config['ANALYZE_BATCH_WORKERS'])
+    except Exception as e:
+        return fail(f"批量分析失败: {str(e)}")
+    return ok({"results": [wrap_analysis_result(result) for result in results]})
 
 
 @bp.route('/select_yunjiao', methods=['POST'])
 def select_yunjiao():
+    """切换韵脚模式。带 session_id 时复用 /analyze 会话中的文本版式；同时附上 text 与 rhymebook 时，
+    会话不在本进程中也会按原文重建，而不是返回 410。
+    """
     data = request.get_json()
-    text = data.get('text', '')
-    rhymebook = data.get('rhymebook', '2')
+    session, expired = _lookup_session(data)
+    text = session.text if session is not None else data.get('text', '')
+    rhymebook = session.rhymebook if session is not None else data.get('rhymebook', '2')
     cipai_name = data.get('cipai_name', '')
     author = data.get('author', '')
     yunjiao_id = data.get('yunjiao_id', 0)
 
+    if expired and not text.strip():
+        return fail(SESSION_EXPIRED), 410
     if not all([text.strip(), cipai_name.strip(), author.strip()]):
         return fail("缺少必要参数")
 
     try:
-        tone_dict, yunbu_dict = load_rhymebook_with_yunbu(rhymebook)
+        char_yunbu = load_tone_table(rhymebook).char_yunbu
         yunjiao_dict = load_yunjiao()
 
-        text_drop, text_cleaned, length, split_length = preprocess_text(text)
+        layout = session.layout if session is not None else build_text_layout(text)
+        g.text_length = len(text)
 
         key = f"{cipai_name.strip()}|{author.strip()}"
         yunjiao_patterns = yunjiao_dict.get(key, [])
         if not yunjiao_patterns or yunjiao_id >= len(yunjiao_patterns):
             return fail("未找到指定的韵脚模式")
 
-        selected_positions = yunjiao_patterns[yunjiao_id]
-
-        text_drop_to_original_map = {}
-        text_drop_index = 0
-        for original_index, char in enumerate(text_cleaned):
-            if re.match(r'[\u4e00-\u9fa5]', char):
-                text_drop_to_original_map[text_drop_index] = original_index
-                text_drop_index += 1
-
-        yunjiao_words = [text_drop[pos-1] for pos in selected_positions if 0 < pos <= len(text_drop)]
-        yunjiao_yunbu = {}
-        yunjiao_detailed = []
-
-        for pos in selected_positions:
-            if 0 < pos <= len(text_drop):
-                word = text_drop[pos-1]
-                text_drop_pos = pos - 1
-                original_pos = text_drop_to_original_map.get(text_drop_pos, -1)
-                if original_pos >= 0:
-                    yunbu_list = [yunbu for yunbu, words in yunbu_dict.items() if word in words]
-                    yunjiao_detailed.append({
-                        "position": original_pos,
-                        "word": word,
-                        "yunbu": yunbu_list
-                    })
-                    yunjiao_yunbu[word] = yunbu_list
+        option = build_yunjiao_option(layout, yunjiao_id, yunjiao_patterns[yunjiao_id], char_yunbu)
+        yunjiao_words = option["words"]
+        yunjiao_yunbu = option["yunbu"]
+        yunjiao_detailed = option["detailed"]
 
         return ok({
             "yunjiao_words": yunjiao_words,
@@ -116,95 +270,164 @@ def select_yunjiao():
         return fail(f"处理韵脚选择时出错: {str(e)}")
 
 
+# 词牌列表响应的浏览器缓存时间（秒），过期后凭 ETag 重新验证
+CIPAI_LIST_MAX_AGE = 300
+
+
+@single_flight_cache(maxsize=1)
+def _cipai_list_payload():
+    """完整词牌列表的响应体只序列化一次，并预先 gzip 压缩，返回 (body, gzip_body, etag)。"""
+    cipai_list, default_index = get_cipai_summary_list()
+    body = _dump_envelope({"cipai_list": cipai_list, "default_index": default_index})
+    return body, gzip.compress(body, 6), _etag_for(body)
+
+
+def _dump_envelope(data) -> bytes:
+    return json.dumps(
+        {"success": True, "data": data, "error": None},
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode('utf-8')
+
+
+def _payload_response(body: bytes, etag: str, gzip_body=None):
+    """返回预先序列化的 JSON：支持 If-None-Match → 304，客户端接受 gzip 时返回压缩体。"""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    elif gzip_body is not None and 'gzip' in request.accept_encodings:
+        response = current_app.response_class(gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={CIPAI_LIST_MAX_AGE}'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @bp.route('/get_cipai_list', methods=['GET'])
 def get_cipai_list():
+    """词牌列表。可选参数 offset / limit 分页，cipai_name 只返回该词牌的各体。
+
+    不带参数时返回预先序列化的完整列表；default_index 为默认词牌在本次返回列表中的下标，不在其中时为 -1。
+    """
     try:
+        offset = request.args.get('offset', type=int)
+        limit = request.args.get('limit', type=int)
+        cipai_name = request.args.get('cipai_name', '').strip()
+
+        if offset is None and limit is None and not cipai_name:
+            body, gzip_body, etag = _cipai_list_payload()
+            return _payload_response(body, etag, gzip_body)
+
         cipai_list, default_index = get_cipai_summary_list()
-        return ok({"cipai_list": cipai_list, "default_index": default_index})
+        indices = range(len(cipai_list))
+        if cipai_name:
+            indices = [i for i in indices if cipai_list[i]['cipai_name'] == cipai_name]
+        total = len(indices)
+        start = max(offset or 0, 0)
+        stop = total if limit is None else start + max(limit, 0)
+        page = indices[start:stop]
+
+        body = _dump_envelope({
+            "cipai_list": [cipai_list[i] for i in page],
+            "default_index": page.index(default_index) if default_index in page else -1,
+            "total": total,
+            "offset": start,
+        })
+        gzip_body = gzip.compress(body, 6) if len(body) > 1024 else None
+        return _payload_response(body, _etag_for(body), gzip_body)
     except Exception as e:
         return fail(f"获取词牌列表失败: {str(e)}")
 
 
+@bp.route('/search_cipai', methods=['GET'])
+def search_cipai():
+    """词牌联想搜索：q 可为词牌名（前缀或片段）、别名、作者、拼音首字母或全拼；q 为空时返回默认词牌。"""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    try:
+        if not query:
+            cipai_list, default_index = get_cipai_summary_list()
+            default = cipai_list[default_index] if cipai_list else None
+            return ok({"query": query, "results": [], "default": default})
+        return ok({"query": query, "results": get_cipai_search_index().search(query, limit)})
+    except Exception as e:
+        return fail(f"搜索词牌失败: {str(e)}")
+
+
 @bp.route('/get_fillword_framework', methods=['POST'])
 def get_fillword_framework():
+    """填词框架。unique_key（来自词牌列表）优先，找不到时取同名同作者的第一条；框架均已预先生成。"""
     data = request.get_json()
     cipai_name = data.get('cipai_name', '')
     author = data.get('author', '')
-    unique_key = data.get('unique_key', '')  # 新增：用于识别具体的记录
-    
+    unique_key = data.get('unique_key', '')
+
     if not all([cipai_name.strip(), author.strip()]):
         return fail("缺少词牌名或作者信息")
     try:
-        cipai_data = load_cipai()
-        matched_row = None
-        
-        # 如果提供了unique_key，使用更精确的匹配逻辑
-        if unique_key:
-            # 从unique_key解析出原始信息和序号
-            if '-' in unique_key and unique_key.split('-')[-1].isdigit():
-                # 格式: cipai_name|author|total_chars-suffix
-                base_key, suffix = unique_key.rsplit('-', 1)
-                try:
-                    suffix_num = int(suffix)
-                    # 找到符合条件的第suffix_num个记录
-                    count = 0
-                    for _, row in cipai_data.iterrows():
-                        row_cipai_name = str(row['词牌名']).strip()
-                        row_author = str(row['作者']).strip()
-                        row_total_chars = int(row['总数'])
-                        row_key = f"{row_cipai_name}|{row_author}|{row_total_chars}"
-                        
-                        if row_key == base_key:
-                            count += 1
-                            if count == suffix_num:
-                                matched_row = row
-                                break
-                except ValueError:
-                    pass  # 如果suffix不是数字，回退到原来的匹配方式
-            else:
-                # unique_key没有suffix，说明只有一个记录，直接匹配
-                for _, row in cipai_data.iterrows():
-                    row_cipai_name = str(row['词牌名']).strip()
-                    row_author = str(row['作者']).strip()
-                    row_total_chars = int(row['总数'])
-                    row_key = f"{row_cipai_name}|{row_author}|{row_total_chars}"
-                    
-                    if row_key == unique_key:
-                        matched_row = row
-                        break
-        
-        # 如果通过unique_key没有找到，回退到原来的匹配方式（取第一个匹配的）
-        if matched_row is None:
-            for _, row in cipai_data.iterrows():
-                if (str(row['词牌名']).strip() == cipai_name.strip() and 
-                    str(row['作者']).strip() == author.strip()):
-                    matched_row = row
-                    break
-        
+        matched_row = _framework_row(cipai_name, author, unique_key)
         if matched_row is None:
             return fail("未找到匹配的词牌")
 
-        tone_pattern = str(matched_row['韵律'])
-        tone_pattern_cleaned = re.sub("[^\u4e00-\u9fa5]", "", tone_pattern)
-        tone_pattern_list = list(re.sub(r"增韵", "", tone_pattern_cleaned))
+        return ok(dict(get_fillword_frameworks()[matched_row], cipai_name=cipai_name, author=author))
+    except Exception as e:
+        return fail(f"获取填词框架失败: {str(e)}")
 
-        split_length_str = str(matched_row['分段字数'])
-        try:
-            split_length = ast.literal_eval(split_length_str)
-        except Exception:
-            split_length = []
 
-        framework = create_fillword_framework(tone_pattern_list, split_length)
-        return ok({
-            "cipai_name": cipai_name,
-            "author": author,
-            "total_chars": int(matched_row['总数']),
-            "tone_pattern": tone_pattern_list,
-            "split_length": split_length,
-            "framework": framework
-        })
+def _framework_row(cipai_name: str, author: str, unique_key):
+    by_key, first_rows = get_cipai_key_index()
+    matched_row = by_key.get(unique_key) if isinstance(unique_key, str) and unique_key else None
+    if matched_row is None:
+        matched_row = first_rows.get((cipai_name.strip(), author.strip()))
+    return matched_row
+
+
+@bp.route('/suggest', methods=['POST'])
+def suggest():
+    """填词候选：填词框架中 position（从 0 起）开始 length（1 或 2）个字合乎平仄的字或词，按词频排序。
+
+    末字为韵脚（按 yunjiao_id 选定的韵脚模式）时，候选限定为 filled 中已填韵脚字的韵部，或由 yunbu 指定。
+    """
+    data = request.get_json(silent=True) or {}
+    cipai_name = data.get('cipai_name', '')
+    author = data.get('author', '')
+    rhymebook = data.get('rhymebook', '2')
+    filled = data.get('filled') or []
+    yunbu = data.get('yunbu') or []
+
+    if not all([cipai_name.strip(), author.strip()]):
+        return fail("缺少词牌名或作者信息")
+    try:
+        position = int(data.get('position', 0))
+        length = int(data.get('length', 1))
+        yunjiao_id = int(data.get('yunjiao_id', 0))
+        limit = min(max(int(data.get('limit', 20)), 1), 100)
+    except (TypeError, ValueError):
+        return fail("position、length、limit 须为整数")
+    if isinstance(filled, str):
+        filled = list(filled)
+    if isinstance(yunbu, str):
+        yunbu = [yunbu]
+
+    try:
+        row = _framework_row(cipai_name, author, data.get('unique_key', ''))
+        if row is None:
+            return fail("未找到匹配的词牌")
+        entry = get_fillword_frameworks()[row]
+        store = load_cipai_patterns()
+        patterns = load_yunjiao().get(f"{store.names[row]}|{store.authors[row]}", [])
+        positions = patterns[yunjiao_id] if 0 <= yunjiao_id < len(patterns) else []
+        return ok(suggest_for_slot(
+            get_candidate_index(rhymebook), load_tone_table(rhymebook).char_yunbu, entry["tone_pattern"], entry["split_length"],
+            [pos - 1 for pos in positions if pos > 0], position, length,
+            [c if isinstance(c, str) else '' for c in filled], [y for y in yunbu if isinstance(y, str)], limit,
+        ))
+    except ValueError as e:
+        return fail(str(e))
     except Exception as e:
-        return fail(f"获取填词框架失败: {str(e)}")
+        return fail(f"获取候选失败: {str(e)}")
 
 
 @bp.route('/get_char_tone', methods=['POST'])
@@ -214,8 +437,7 @@ def get_char_tone():
     if not char:
         return fail("缺少字符参数")
     try:
-        tone_dict, _ = load_rhymebook_with_yunbu('2')
-        tone = tone_dict.get(char, '未知')
+        tone = load_tone_table('2').tone(char)
         if tone in ['平', '仄']:
             result_tone = tone
         elif tone == '未知':
@@ -234,11 +456,23 @@ def get_char_tone():
 
 @bp.route('/analyze_with_selected_cipai', methods=['POST'])
 def analyze_with_selected_cipai():
+    """按选定的词牌分析。
+
+    带 session_id 时只需再给出候选的 row_index，文本版式与声调标注取自 /analyze 会话
+    （同时附上 text 与 rhymebook 时，会话不在本进程中也会按原文重建）；否则提交完整的 text、rhymebook 与 selected_cipai。
+    """
     data = request.get_json()
+    session, expired = _lookup_session(data)
+    if session is not None:
+        return _analyze_session_selection(session, data)
+
     text = data.get('text', '')
     rhymebook = data.get('rhymebook', '2')
     selected_cipai = data.get('selected_cipai', {})
-    
+
+    if expired and not text.strip():
+        return fail(SESSION_EXPIRED), 410
+
     if not text.strip():
         return fail("请输入要分析的诗词文本")
     
@@ -246,118 +480,112 @@ def analyze_with_selected_cipai():
         return fail("请选择一个词牌")
     
     try:
-        from .services.analysis import (
-            load_rhymebook_with_yunbu,
-            load_yunjiao,
-            load_cipai_intro,
-            preprocess_text,
-            mark_tone,
-            get_score_tone
-        )
-        import re
-        
-        # 加载必要的数据
-        tone_dict, yunbu_dict = load_rhymebook_with_yunbu(rhymebook)
-        yunjiao_dict = load_yunjiao()
-        try:
-            cipai_intro_dict = load_cipai_intro()
-        except Exception:
-            cipai_intro_dict = {}
-        
-        # 预处理文本
-        text_drop, text_cleaned, length, split_length = preprocess_text(text)
-        
-        # 使用选择的词牌进行分析
         guess_cipai = selected_cipai['cipai_name']
         author = selected_cipai['author']
-        tone_database = selected_cipai['rhythm']
-        
-        # 处理韵律模式
-        tone_database = re.sub("[^\u4e00-\u9fa5]", "", tone_database)
-        tone_database = list(re.sub(r"增韵", "", tone_database))
-        tone_text = mark_tone(text_drop, tone_dict)
-        score, issue_data = get_score_tone(tone_text, tone_database)
-        
-        # 处理韵脚信息
-        yunjiao_options = []
-        yunjiao_words = []
-        yunjiao_yunbu = {}
-        yunjiao_detailed = []
-        
-        if guess_cipai and author:
-            key = f"{guess_cipai.strip()}|{author.strip()}"
-            yunjiao_patterns = yunjiao_dict.get(key, [])
-            if yunjiao_patterns:
-                # 为韵脚计算 text_drop -> 原文索引映射
-                text_drop_to_original_map = {}
-                text_drop_index = 0
-                for original_index, char in enumerate(text_cleaned):
-                    if re.match(r'[\u4e00-\u9fa5]', char):
-                        text_drop_to_original_map[text_drop_index] = original_index
-                        text_drop_index += 1
-
-                for i, positions in enumerate(yunjiao_patterns):
-                    pattern_words = [text_drop[pos - 1] for pos in positions if 0 < pos <= len(text_drop)]
-                    pattern_detailed = []
-                    pattern_yunbu = {}
-                    for pos in positions:
-                        if 0 < pos <= len(text_drop):
-                            word = text_drop[pos - 1]
-                            text_drop_pos = pos - 1
-                            original_pos = text_drop_to_original_map.get(text_drop_pos, -1)
-                            if original_pos >= 0:
-                                yunbu_list = [yunbu for yunbu, words in yunbu_dict.items() if word in words]
-                                pattern_detailed.append({
-                                    "position": original_pos,
-                                    "word": word,
-                                    "yunbu": yunbu_list
-                                })
-                                pattern_yunbu[word] = yunbu_list
-
-                    yunjiao_options.append({
-                        "id": i,
-                        "positions": positions,
-                        "words": pattern_words,
-                        "yunbu": pattern_yunbu,
-                        "detailed": pattern_detailed
-                    })
-
-                if yunjiao_options:
-                    first_option = yunjiao_options[0]
-                    yunjiao_words = first_option["words"]
-                    yunjiao_yunbu = first_option["yunbu"]
-                    yunjiao_detailed = first_option["detailed"]
-        
-        # 获取词牌介绍
-        cipai_intro = ""
-        if guess_cipai and cipai_intro_dict:
-            cipai_intro = cipai_intro_dict.get(guess_cipai.strip(), "")
-        
-        return ok({
-            "text": text_cleaned,
-            "original_text": text,
-            "processed_text": text_drop,
-            "cipai_name": guess_cipai,
-            "cipai_intro": cipai_intro,
-            "author": author,
-            "score": round(score, 2),
-            "issues": [
-                {"word": w, "actual": a, "expected": e, "position": p}
-                for (w, a), e, p in issue_data
-            ],
-            "yunjiao_words": yunjiao_words,
-            "yunjiao_yunbu": yunjiao_yunbu,
-            "yunjiao_detailed": yunjiao_detailed,
-            "yunjiao_options": yunjiao_options,
-            "tone_text": tone_text,
-            "length": length,
-            "split_length": split_length,
-        })
+
+        # 优先使用预编译的词牌谱；旧客户端未携带 row_index 时回退为清洗 rhythm 字符串
+        store = load_cipai_patterns()
+        row = None
+        if selected_cipai.get('row_index') is not None:
+            row = store.find_row(str(guess_cipai).strip(), str(author).strip(), selected_cipai['row_index'])
+        if row is not None:
+            tone_pattern = store.tones(row)
+        else:
+            tone_pattern = encode_tone_pattern(selected_cipai['rhythm'])
+
+        envelope = wrap_analysis_result(analyze_with_pattern(text, rhymebook, guess_cipai, author, tone_pattern))
+        _note_analysis(text, envelope)
+        if envelope["success"] and isinstance(rhymebook, str):
+            envelope["data"]["session_id"] = remember_session(
+                current_app.extensions['analysis_sessions'], text, rhymebook)
+        return jsonify(envelope)
         
     except Exception as e:
         return fail(f"分析失败: {str(e)}")
 
 
+def _analyze_session_selection(session, data):
+    selected_cipai = data.get('selected_cipai') or {}
+    row = data.get('row_index', selected_cipai.get('row_index'))
+    try:
+        store = load_cipai_patterns()
+        if not isinstance(row, int) or not 0 <= row < len(store):
+            return fail("请选择一个词牌")
+        if session.candidates and row not in session.candidates:
+            return fail("所选词牌不在本次分析的候选中")
+
+        envelope = wrap_analysis_result(analyze_with_pattern(
+            session.text, session.rhymebook, store.names[row], store.authors[row], store.tones(row),
+            layout=session.layout, tone_text=session.tone_text,
+        ))
+        _note_analysis(session.text, envelope)
+        if envelope["success"]:
+            envelope["data"]["session_id"] = session_id_for(session.text, session.rhymebook)
+        return jsonify(envelope)
+    except Exception as e:
+        return fail(f"分析失败: {str(e)}")
+
+
+@bp.route('/analyze_live', methods=['POST'])
+def analyze_live():
+    """边写边查：在上一次的分析状态上应用编辑，以 Server-Sent Events 流式返回变化的部分。
+
+    参数：session_id（来自 /analyze 或上一次的 done 事件）、edits（[{start, end, text}, ...]，针对会话原文），
+    可选 row_index（检查所用的词牌，默认按字数与分段匹配）与 yunjiao_id；连续编辑时回传 done 事件中的这三项。
+    可选 text 与 rhymebook 为会话原文（edits 应用之前）及韵书：会话不在本进程中（多进程模式下由其他工作进程创建）时按它重建。
+    事件依次为 match（仅首次或分段变化时，完整结果）、tones、issues、yunjiao、done，见 services/live.py。
+    参数错误在开始推送前以普通 JSON 返回；会话已过期且未附原文时返回 410，客户端改为重新提交 /analyze。
+    """
+    data = request.get_json(silent=True) or {}
+    session, expired = _lookup_session(data)
+    if expired:
+        return fail(SESSION_EXPIRED), 410
+    if session is None:
+        return fail("缺少 session_id")
+    row = data.get('row_index')
+    yunjiao_id = data.get('yunjiao_id', 0)
+    if not (row is None or isinstance(row, int)) or not isinstance(yunjiao_id, int):
+        return fail("row_index、yunjiao_id 须为整数")
+
+    try:
+        text = apply_edits(session.text, data.get('edits') or [])
+    except ValueError as e:
+        return fail(str(e))
+    if not text.strip():
+        return fail("请输入要分析的诗词文本")
+    g.text_length = len(text)
+
+    sessions = current_app.extensions['analysis_sessions']
+    started = None
+    try:
+        state = get_live_state(sessions, session_id_for(session.text, session.rhymebook), row, yunjiao_id)
+        if state is None:
+            state, started = start_live_state(session, row, yunjiao_id)
+    except ValueError as e:
+        return fail(str(e))
+    except Exception as e:
+        return fail(f"分析失败: {str(e)}")
+
+    # 响应体在视图返回后才生成，请求结束时的解除固定已经发生，这里在生成期间重新固定到本次请求的数据版本
+    generation = current_generation()
+
+    def stream():
+        previous = pin_generation(generation)
+        try:
+            for event, payload in live_events(sessions, state, text, started):
+                yield format_sse(event, payload)
+        except Exception as e:
+            yield format_sse('error', {"error": f"分析失败: {str(e)}"})
+        finally:
+            unpin_generation(previous)
+
+    response = current_app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 经由 nginx 反向代理时不缓冲，事件逐条送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @bp.route('/get_char_tones', methods=['POST'])
 def get_char_tones():
     data = request.get_json()
@@ -375,11 +603,8 @@ def get_char_tones():
         return fail("缺少字符参数")
 
     try:
-        tone_dict, _ = load_rhymebook_with_yunbu('2')
-
         items = []
-        for ch in text:
-            tone = tone_dict.get(ch, '未知')
+        for ch, tone in load_tone_table('2').mark(text):
             if tone in ['平', '仄']:
                 result_tone = tone
             elif tone == '未知':
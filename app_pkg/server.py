@@ -0,0 +1,261 @@
+import gc
+import itertools
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from typing import Dict, Any, Callable, Iterable, Optional, Set
+
+from waitress import create_server
+from waitress import wasyncore
+
+from .services.batch import default_worker_count, shutdown_executor
+from .services.logqueue import forward_worker_logging, restart_queue_logging_after_fork, stop_queue_logging
+
+
+logger = logging.getLogger(__name__)
+
+# 子进程过早退出（如启动即失败）时，间隔一段时间再补，避免反复 fork
+RESPAWN_BACKOFF = 1.0
+# 父进程检查子进程状态的间隔（秒）
+POLL_INTERVAL = 0.5
+# 平滑退出时只关闭空闲超过该时间（秒）的连接，刚建立、请求尚未到达的连接仍会得到处理
+DRAIN_IDLE = 1.0
+
+
+def bind_socket(host: str, port: int, backlog: int = 1024) -> socket.socket:
+    """绑定并监听 host:port，返回可由多个进程共享的监听套接字。"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Worker:
+    """在单个子进程中运行 waitress，收到 SIGTERM 或处理满 max_requests 个请求后平滑退出。
+
+    平滑退出：不再接受新连接，已收到的请求处理完并写完响应后关闭空闲连接；
+    超过 graceful_timeout 仍未结束时直接退出。
+    """
+
+    def __init__(self, app: Callable, sock: socket.socket, max_requests: int = 0,
+                 graceful_timeout: float = 30.0, **adjustments: Any) -> None:
+        self.app = app
+        self.sock = sock
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.adjustments = adjustments
+        self.draining = False
+        self._handled = itertools.count(1)
+
+    def wsgi(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        if self.max_requests and next(self._handled) >= self.max_requests and not self.draining:
+            logger.info("工作进程 %d 已处理 %d 个请求，退出后由新进程替换", os.getpid(), self.max_requests)
+            self.draining = True
+        return self.app(environ, start_response)
+
+    def _on_sigterm(self, signum: int, frame: Any) -> None:
+        self.draining = True
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        # Ctrl-C 与 SIGHUP 由父进程处理，再以 SIGTERM 通知子进程
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        server = create_server(self.wsgi, sockets=[self.sock], **self.adjustments)
+        adj = server.adj
+        deadline: Optional[float] = None
+        while True:
+            wasyncore.loop(timeout=adj.asyncore_loop_timeout, map=server._map,
+                           use_poll=adj.asyncore_use_poll, count=1)
+            if not self.draining:
+                continue
+            if deadline is None:
+                # 停止 accept；监听套接字仍由父进程与其他子进程持有，新连接留在 backlog 中由它们接收
+                server.accepting = False
+                deadline = time.monotonic() + self.graceful_timeout
+            idle_before = time.time() - DRAIN_IDLE
+            for channel in list(server.active_channels.values()):
+                if (not channel.requests and channel.request is None and not channel.total_outbufs_len
+                        and channel.last_activity < idle_before):
+                    channel.will_close = True
+            if not server.active_channels:
+                break
+            if time.monotonic() > deadline:
+                logger.warning("工作进程 %d 平滑退出超时，仍有 %d 个连接", os.getpid(), len(server.active_channels))
+                break
+        server.task_dispatcher.shutdown(timeout=1)
+        return 0
+
+
+class PreforkServer:
+    """父进程预先加载数据，再 fork 出 workers 个子进程共享同一监听套接字。
+
+    子进程通过写时复制共享父进程中已加载的词牌谱、韵书与索引；父进程只负责补齐退出的子进程、转发信号，
+    不处理请求。数据文件变化时由父进程重载（见 DataRegistry），换入后替换全部子进程，
+    新进程继承新数据，旧进程处理完手上的请求后退出。
+
+    信号：SIGTERM / SIGINT 平滑停止（再次收到则立即结束子进程），SIGHUP 平滑替换全部子进程。
+    """
+
+    def __init__(self, app: Any, sock: socket.socket, workers: int = 2, max_requests: int = 0,
+                 max_requests_jitter: int = 0, graceful_timeout: float = 30.0, **adjustments: Any) -> None:
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.adjustments = adjustments
+        # 每个子进程各自按需创建批量分析进程池，默认由各子进程平分 CPU，避免总进程数成倍增长
+        app.config['ANALYZE_BATCH_WORKERS'] = default_worker_count(workers)
+        # 当前子进程 pid -> 启动时间
+        self.children: Dict[int, float] = {}
+        # 已通知退出、尚未结束的子进程
+        self.retiring: Set[int] = set()
+        self._stopping = False
+        self._force = False
+        self._restart = False
+        self._spawn_after = 0.0
+
+    def request_restart(self) -> None:
+        self._restart = True
+
+    def _on_stop(self, signum: int, frame: Any) -> None:
+        if self._stopping:
+            self._force = True
+        self._stopping = True
+
+    def _on_hup(self, signum: int, frame: Any) -> None:
+        self._restart = True
+
+    def preload(self) -> None:
+        """等待预热完成，再冻结已有对象，避免子进程中的垃圾回收扫描时写入共享页面。"""
+        warmup = self.app.extensions.get('warmup')
+        if warmup is not None and not warmup.wait():
+            logger.warning("数据预热未全部成功，子进程将在首次使用时加载: %s", warmup.status().get('errors'))
+        self._freeze()
+
+    @staticmethod
+    def _freeze() -> None:
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def spawn(self) -> int:
+        registry = self.app.extensions.get('data_registry')
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            # 错开各子进程的回收时间，避免同时重启
+            max_requests += random.randint(0, self.max_requests_jitter)
+        if registry is not None:
+            with registry.paused():
+                pid = os.fork()
+        else:
+            pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+
+        code = 1
+        try:
+            restart_queue_logging_after_fork()
+            if registry is not None:
+                registry.detach_after_fork()
+            worker = Worker(self.app, self.sock, max_requests=max_requests,
+                            graceful_timeout=self.graceful_timeout, **self.adjustments)
+            code = worker.run()
+        except BaseException:
+            logger.exception("工作进程 %d 异常退出", os.getpid())
+        finally:
+            # os._exit 不执行 atexit，进程池与日志队列在这里显式关闭
+            shutdown_executor(wait=True)
+            stop_queue_logging()
+            os._exit(code)
+
+    def _signal(self, pids: Iterable[int], signum: int) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            expected = pid in self.retiring
+            self.retiring.discard(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and not expected and not self._stopping:
+                logger.warning("工作进程 %d 意外退出（状态 %d），将重新启动", pid, code)
+                if started is not None and time.monotonic() - started < RESPAWN_BACKOFF:
+                    self._spawn_after = time.monotonic() + RESPAWN_BACKOFF
+
+    def _replace_all(self) -> None:
+        """先启动新的子进程，再让旧进程平滑退出，替换期间始终有进程在接受连接。"""
+        old = [pid for pid in self.children if pid not in self.retiring]
+        self._freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        self.retiring.update(old)
+        self._signal(old, signal.SIGTERM)
+        logger.info("已启动 %d 个新工作进程，旧进程处理完当前请求后退出", self.workers)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        registry = self.app.extensions.get('data_registry')
+        if registry is not None:
+            registry.add_listener(lambda generation: self.request_restart())
+
+        # 子进程的日志交给父进程写入，日志文件只有父进程打开和轮转
+        forward_worker_logging()
+        self.preload()
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("父进程 %d 已启动 %d 个工作进程", os.getpid(), self.workers)
+
+        while not self._stopping:
+            self._reap()
+            if self._restart:
+                self._restart = False
+                self._replace_all()
+            # 子进程因处理满 max_requests 个请求或异常退出后补齐
+            active = len(self.children) - len(self.retiring)
+            while active < self.workers and time.monotonic() >= self._spawn_after and not self._stopping:
+                self.spawn()
+                active += 1
+            time.sleep(POLL_INTERVAL)
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        logger.info("正在停止 %d 个工作进程", len(self.children))
+        self._signal(list(self.children), signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline and not self._force:
+            self._reap()
+            time.sleep(0.1)
+        if self.children:
+            self._signal(list(self.children), signal.SIGKILL)
+            while self.children:
+                try:
+                    pid, _ = os.waitpid(-1, 0)
+                except ChildProcessError:
+                    break
+                self.children.pop(pid, None)
+        self.sock.close()
@@ -1,15 +1,37 @@
 import json
+import logging
 import os
-import re
-import ast
-from functools import lru_cache
-from typing import Tuple, List, Dict, Any, Optional
+from typing import Tuple, List, Dict, Any, Mapping, Optional
 
-import pandas as pd
-from flask import current_app
+import numpy as np
 
+from .cache import single_flight_cache
+from .datafiles import CIPAI_PATH, CIPAI_INTRO_PATH, YUNJIAO_PATH, RHYMEBOOK_PATHS, SNAPSHOT_PATH
+from .layout import TextLayout, build_text_layout
+from .patterns import (
+    CipaiPatternStore,
+    TONE_CODES,
+    TONE_NAMES,
+    TONE_ZHONG,
+    score_candidates,
+)
+from .records import CipaiRow, read_cipai_rows, read_cipai_intro_rows, read_yunjiao_rows
+from .snapshot import DataSnapshot, open_fresh_snapshot, write_snapshot
+from .tonetable import ToneTable
 
-def build_tone_dict(rhymebook_data: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+
+# 精确匹配失败时返回的近似候选数
+APPROXIMATE_MATCH_LIMIT = 5
+
+# 不依赖 Flask 应用上下文；在应用内运行时会传递到 app.logger（名为 app_pkg）的处理器
+logger = logging.getLogger(__name__)
+
+
+def build_tone_dict(rhymebook_data: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, Tuple[str, ...]]]:
+    """返回 (tone_dict, yunbu_dict, char_yunbu)。
+
+    char_yunbu 为 字 -> 所属韵部元组 的倒排索引，韵部顺序与 yunbu_dict 的遍历顺序一致。
+    """
     tone_dict: Dict[str, str] = {}
     yunbu_dict: Dict[str, set] = {}
     for item in rhymebook_data:
@@ -23,16 +45,22 @@ def build_tone_dict(rhymebook_data: List[Dict[str, Any]]) -> Tuple[Dict[str, str
                 tone_dict[word] = '仄'
                 yunbu_dict[yunbu_name].add(word)
     yunbu_dict_list: Dict[str, List[str]] = {k: list(v) for k, v in yunbu_dict.items()}
-    return tone_dict, yunbu_dict_list
 
+    char_yunbu_list: Dict[str, List[str]] = {}
+    for yunbu_name, words in yunbu_dict_list.items():
+        for word in words:
+            char_yunbu_list.setdefault(word, []).append(yunbu_name)
+    char_yunbu: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in char_yunbu_list.items()}
+    return tone_dict, yunbu_dict_list, char_yunbu
 
-@lru_cache(maxsize=8)
-def load_rhymebook_with_yunbu(rhymebook_choice: str) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
-    rhymebook_map = {
-        '1': 'data/词林正韵.json',
-        '2': 'data/中华新韵.json'
-    }
-    rhymebook_path = rhymebook_map.get(rhymebook_choice, 'data/词林正韵.json')
+
+@single_flight_cache(maxsize=1)
+def load_data_snapshot() -> Optional[DataSnapshot]:
+    """当前进程使用的数据快照；没有可用快照时为 None，各加载函数回退到源文件。"""
+    return open_fresh_snapshot(SNAPSHOT_PATH)
+
+
+def _read_rhymebook(rhymebook_path: str) -> Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, Tuple[str, ...]]]:
     if not os.path.exists(rhymebook_path):
         raise FileNotFoundError(f"韵书文件未找到: {rhymebook_path}")
     with open(rhymebook_path, 'r', encoding='utf-8') as f:
@@ -40,42 +68,86 @@ def load_rhymebook_with_yunbu(rhymebook_choice: str) -> Tuple[Dict[str, str], Di
     return build_tone_dict(rhymebook_data)
 
 
-# 候选字功能已取消；不再基于外部词频或韵部给出替换建议。
+@single_flight_cache(maxsize=8)
+def load_tone_table(rhymebook_choice: str) -> ToneTable:
+    """韵书的数组表示，分析时的声调与韵部查询都从这里读取。
+
+    优先直接引用数据快照中的数组（各进程共享映射的内存）；否则解析 JSON 编译，不保留中间的字典。
+    """
+    if rhymebook_choice not in RHYMEBOOK_PATHS:
+        rhymebook_choice = '1'
+    snapshot = load_data_snapshot()
+    if snapshot is not None:
+        table = snapshot.tone_table(rhymebook_choice)
+        if table is not None:
+            return table
+    return ToneTable.from_dicts(*_read_rhymebook(RHYMEBOOK_PATHS[rhymebook_choice]))
+
+
+@single_flight_cache(maxsize=8)
+def load_rhymebook_with_yunbu(rhymebook_choice: str) -> Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, Tuple[str, ...]]]:
+    """(tone_dict, yunbu_dict, char_yunbu) 字典形式，由 load_tone_table 还原；分析接口本身不再使用。"""
+    return load_tone_table(rhymebook_choice).to_dicts()
 
 
-@lru_cache(maxsize=1)
-def load_cipai() -> pd.DataFrame:
-    cipai_path = 'data/cipai_with_statistics_qdcp.csv'
+# 填词候选（按声调、韵部与词频预先排序）见 candidates.py。
+
+
+def _read_cipai_rows() -> List[CipaiRow]:
+    cipai_path = CIPAI_PATH
     if not os.path.exists(cipai_path):
         raise FileNotFoundError(f"词牌谱文件未找到: {cipai_path}")
-    df = pd.read_csv(cipai_path)
-    df['词牌名'] = df['词牌名'].astype(str).str.strip()
-    df['作者'] = df['作者'].astype(str).str.strip()
-    return df
+    return read_cipai_rows(cipai_path)
+
+
+@single_flight_cache(maxsize=1)
+def load_cipai() -> List[CipaiRow]:
+    return _read_cipai_rows()
 
 
-@lru_cache(maxsize=1)
+@single_flight_cache(maxsize=1)
+def load_cipai_patterns() -> CipaiPatternStore:
+    """编译后的词牌谱，各接口统一从这里读取韵律与分段信息。
+
+    优先使用数据快照；否则直接读取 CSV 编译，不经过 load_cipai() 的缓存，避免常驻逐行记录。
+    """
+    snapshot = load_data_snapshot()
+    if snapshot is not None:
+        return snapshot.cipai_patterns()
+    return CipaiPatternStore.from_rows(_read_cipai_rows())
+
+
+@single_flight_cache(maxsize=1)
 def load_cipai_intro() -> Dict[str, str]:
-    intro_path = 'data/cipai_detail_with_intro.csv'
+    snapshot = load_data_snapshot()
+    if snapshot is not None:
+        return snapshot.cipai_intro()
+    return _read_cipai_intro()
+
+
+def _read_cipai_intro() -> Dict[str, str]:
+    intro_path = CIPAI_INTRO_PATH
     intro_dict: Dict[str, str] = {}
     if not os.path.exists(intro_path):
         return intro_dict
-    df = pd.read_csv(intro_path)
-    df['词牌名'] = df['词牌名'].astype(str).str.strip()
-    for _, row in df.iterrows():
-        intro_dict[str(row['词牌名']).strip()] = str(row['介绍']).strip()
+    for row in read_cipai_intro_rows(intro_path):
+        intro_dict[row.cipai_name] = row.intro
     return intro_dict
 
 
-@lru_cache(maxsize=2)
-def load_yunjiao(filepath: str = 'data/yunjiao.csv') -> Dict[str, List[List[int]]]:
+@single_flight_cache(maxsize=2)
+def load_yunjiao(filepath: str = YUNJIAO_PATH) -> Dict[str, List[List[int]]]:
+    snapshot = load_data_snapshot() if filepath == YUNJIAO_PATH else None
+    if snapshot is not None:
+        return snapshot.yunjiao()
+    return _read_yunjiao(filepath)
+
+
+def _read_yunjiao(filepath: str) -> Dict[str, List[List[int]]]:
     yunjiao_dict: Dict[str, List[List[int]]] = {}
-    df = pd.read_csv(filepath)
-    for _, row in df.iterrows():
-        cipai_name = str(row['词牌名']).strip()
-        author = str(row['作者']).strip()
-        key = f"{cipai_name}|{author}"
-        yunjiao_str = str(row['韵脚']).strip()
+    for row in read_yunjiao_rows(filepath):
+        key = f"{row.cipai_name}|{row.author}"
+        yunjiao_str = row.positions
         if yunjiao_str.startswith('"') and yunjiao_str.endswith('"'):
             yunjiao_str = yunjiao_str[1:-1]
         try:
@@ -90,35 +162,39 @@ def load_yunjiao(filepath: str = 'data/yunjiao.csv') -> Dict[str, List[List[int]
     return yunjiao_dict
 
 
-@lru_cache(maxsize=1)
+def build_data_snapshot(path: str = SNAPSHOT_PATH) -> int:
+    """从源文件重新编译全部数据并写成快照，返回快照字节数。"""
+    store = CipaiPatternStore.from_rows(_read_cipai_rows())
+    rhymebooks = {key: ToneTable.from_dicts(*_read_rhymebook(rhymebook_path))
+                  for key, rhymebook_path in RHYMEBOOK_PATHS.items()}
+    return write_snapshot(path, store, rhymebooks, _read_yunjiao(YUNJIAO_PATH), _read_cipai_intro())
+
+
+@single_flight_cache(maxsize=1)
 def get_cipai_summary_list() -> Tuple[List[Dict[str, Any]], int]:
     """构建去重排序后的词牌列表，并缓存结果。
     当发现词牌+作者+字数的记录大于1时，在词牌选择字符串中后面再加个-1，-2等。
 
     返回 (cipai_list, default_index)
     """
-    cipai_data = load_cipai()
+    store = load_cipai_patterns()
 
     cipai_list: List[Dict[str, Any]] = []
     
     # 第一步：统计每个 词牌名+作者+字数 组合的出现次数
     combination_counts: Dict[str, int] = {}
-    for _, row in cipai_data.iterrows():
-        cipai_name = str(row['词牌名']).strip()
-        author = str(row['作者']).strip()
-        total_chars = int(row['总数'])
-        
-        key = f"{cipai_name}|{author}|{total_chars}"
+    for i in range(len(store)):
+        key = f"{store.names[i]}|{store.authors[i]}|{int(store.totals[i])}"
         combination_counts[key] = combination_counts.get(key, 0) + 1
     
     # 第二步：为每个记录分配显示名称，如果有重复则添加序号
     seen_counts: Dict[str, int] = {}
     
-    for _, row in cipai_data.iterrows():
-        cipai_name = str(row['词牌名']).strip()
-        author = str(row['作者']).strip()
-        total_chars = int(row['总数'])
-        split_length = row['分段字数']
+    for i in range(len(store)):
+        cipai_name = store.names[i]
+        author = store.authors[i]
+        total_chars = int(store.totals[i])
+        split_length = str(list(store.split_length(i)))
 
         key = f"{cipai_name}|{author}|{total_chars}"
         
@@ -154,54 +230,56 @@ def get_cipai_summary_list() -> Tuple[List[Dict[str, Any]], int]:
     return cipai_list, default_index
 
 
+@single_flight_cache(maxsize=1)
+def get_cipai_key_index() -> Tuple[Dict[str, int], Dict[Tuple[str, str], int]]:
+    """词牌列表的 unique_key → 行号，以及 (词牌名, 作者) → 第一条记录的行号。
+
+    带序号的 unique_key 同时以不带序号的形式指向该组合的第一条，与旧的逐行比对结果一致。
+    """
+    cipai_list, _ = get_cipai_summary_list()
+    by_key: Dict[str, int] = {}
+    first_rows: Dict[Tuple[str, str], int] = {}
+    for item in sorted(cipai_list, key=lambda x: x['row_index']):
+        row = item['row_index']
+        by_key[item['unique_key']] = row
+        by_key.setdefault(f"{item['cipai_name']}|{item['author']}|{item['total_chars']}", row)
+        first_rows.setdefault((item['cipai_name'], item['author']), row)
+    return by_key, first_rows
+
+
+@single_flight_cache(maxsize=1)
+def get_fillword_frameworks() -> List[Dict[str, Any]]:
+    """预先为每条词牌谱生成的填词框架（含声调列表与分段字数），按行号索引；调用方不应修改。"""
+    store = load_cipai_patterns()
+    frameworks: List[Dict[str, Any]] = []
+    for i in range(len(store)):
+        tone_pattern = store.tone_list(i)
+        split_length = list(store.split_length(i))
+        frameworks.append({
+            "total_chars": int(store.totals[i]),
+            "tone_pattern": tone_pattern,
+            "split_length": split_length,
+            "framework": create_fillword_framework(tone_pattern, split_length),
+        })
+    return frameworks
+
+
 def preprocess_text(text: str) -> Tuple[str, str, int, List[int]]:
-    text_cleaned = re.sub(r'\s+', '', text)
-    text_drop = re.sub("[^\u4e00-\u9fa5]", "", text_cleaned)
-    length = len(text_drop)
-    
-    # 如果没有中文字符，返回空结果
-    if length == 0:
-        return text_drop, text_cleaned, 0, [0]
-    
-    sentences = re.split('[，。、？！]', text_cleaned)
-    split_length = [len(re.sub("[^\u4e00-\u9fa5]", "", sentence)) for sentence in sentences if sentence.strip()]
-    
-    # 如果分割结果为空（没有标点符号），则把整个文本作为一段
-    if not split_length or sum(split_length) == 0:
-        split_length = [length]
-    
-    return text_drop, text_cleaned, length, split_length
+    return build_text_layout(text).as_tuple()
 
 
-def guess_cipai_name(length: int, split_length: List[int], cipai_data: pd.DataFrame) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    for row in cipai_data.itertuples():
-        try:
-            if length == getattr(row, '总数') and str(split_length) == getattr(row, '分段字数'):
-                return getattr(row, '词牌名'), getattr(row, '作者'), getattr(row, '韵律')
-        except Exception:
-            continue
-    return None, None, None
+def guess_cipai_name(length: int, split_length: List[int], store: Optional[CipaiPatternStore] = None) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    store = store if store is not None else load_cipai_patterns()
+    rows = store.find(length, split_length)
+    if not rows:
+        return None, None, None
+    return store.names[rows[0]], store.authors[rows[0]], store.rhythm(rows[0])
 
 
-def find_matching_cipai(length: int, split_length: List[int], cipai_data: pd.DataFrame) -> List[Dict[str, Any]]:
+def find_matching_cipai(length: int, split_length: List[int], store: Optional[CipaiPatternStore] = None) -> List[Dict[str, Any]]:
     """根据字数和分段字数查找所有匹配的词牌"""
-    matches = []
-    for row in cipai_data.itertuples():
-        try:
-            if length == getattr(row, '总数') and str(split_length) == getattr(row, '分段字数'):
-                matches.append({
-                    'cipai_name': getattr(row, '词牌名'),
-                    'author': getattr(row, '作者'),
-                    'rhythm': getattr(row, '韵律'),
-                    'total_chars': getattr(row, '总数'),
-                    'split_length': getattr(row, '分段字数'),
-                    'zhong': getattr(row, '中'),
-                    'ping': getattr(row, '平'),
-                    'ze': getattr(row, '仄')
-                })
-        except Exception:
-            continue
-    return matches
+    store = store if store is not None else load_cipai_patterns()
+    return [store.record(i) for i in store.find(length, split_length)]
 
 
 def mark_tone(text: str, tone_dict: Dict[str, str]) -> List[Tuple[str, str]]:
@@ -224,132 +302,119 @@ def get_score_tone(tone_text: List[Tuple[str, str]], tone_database: List[str]) -
     return score_percent, issue_data
 
 
-def estimate_poetry(text: str, rhymebook: str) -> Dict[str, Any]:
-    try:
-        tone_dict, yunbu_dict = load_rhymebook_with_yunbu(rhymebook)
-    except Exception as e:
-        return {"error": f"加载韵书文件出错: {e}"}
+def get_score_tone_codes(tone_text: List[Tuple[str, str]], tone_pattern: np.ndarray) -> Tuple[float, List[Tuple[Tuple[str, str], str, int]]]:
+    """与 get_score_tone 相同，但韵律为 CipaiPatternStore 中的声调编码数组。"""
+    score = 0
+    issue_data: List[Tuple[Tuple[str, str], str, int]] = []
+    for index, (item, code) in enumerate(zip(tone_text, tone_pattern.tolist())):
+        if code == TONE_ZHONG or TONE_CODES.get(item[1]) == code:
+            score += 1
+        else:
+            issue_data.append((item, TONE_NAMES[code], index))
+    total = len(tone_pattern)
+    score_percent = (score / total * 100) if total else 0
+    return score_percent, issue_data
 
-    try:
-        cipai_data = load_cipai()
-    except Exception as e:
-        return {"error": f"加载词牌谱文件出错: {e}"}
 
-    try:
-        yunjiao_dict = load_yunjiao()
-    except Exception as e:
-        return {"error": f"加载韵脚文件出错: {e}"}
+def build_yunjiao_options(
+    layout: TextLayout,
+    cipai_name: str,
+    author: str,
+    char_yunbu: Mapping[str, Tuple[str, ...]],
+    yunjiao_dict: Dict[str, List[List[int]]],
+) -> List[Dict[str, Any]]:
+    yunjiao_options: List[Dict[str, Any]] = []
+    if not (cipai_name and author):
+        return yunjiao_options
+
+    key = f"{cipai_name.strip()}|{author.strip()}"
+    yunjiao_patterns = yunjiao_dict.get(key, [])
+    for i, positions in enumerate(yunjiao_patterns):
+        yunjiao_options.append(build_yunjiao_option(layout, i, positions, char_yunbu))
+    return yunjiao_options
+
+
+def build_yunjiao_option(
+    layout: TextLayout,
+    option_id: int,
+    positions: List[int],
+    char_yunbu: Mapping[str, Tuple[str, ...]],
+) -> Dict[str, Any]:
+    """一种韵脚模式（韵脚为从 1 开始的汉字序号）对应的韵脚字、韵部及其在原文中的位置。"""
+    text_drop = layout.text_drop
+    pattern_words = [text_drop[pos - 1] for pos in positions if 0 < pos <= len(text_drop)]
+    pattern_detailed = []
+    pattern_yunbu: Dict[str, List[str]] = {}
+    for pos in positions:
+        if 0 < pos <= len(text_drop):
+            word = text_drop[pos - 1]
+            original_pos = layout.original_position(pos - 1)
+            if original_pos >= 0:
+                yunbu_list = list(char_yunbu.get(word, ()))
+                pattern_detailed.append({
+                    "position": original_pos,
+                    "word": word,
+                    "yunbu": yunbu_list
+                })
+                pattern_yunbu[word] = yunbu_list
+
+    return {
+        "id": option_id,
+        "positions": positions,
+        "words": pattern_words,
+        "yunbu": pattern_yunbu,
+        "detailed": pattern_detailed
+    }
+
+
+def analyze_with_pattern(
+    text: str,
+    rhymebook: str,
+    cipai_name: str,
+    author: str,
+    tone_pattern: np.ndarray,
+    layout: Optional[TextLayout] = None,
+    tone_text: Optional[List[Tuple[str, str]]] = None,
+) -> Dict[str, Any]:
+    """用指定词牌的声调编码分析文本，返回与 estimate_poetry 单一匹配时相同结构的结果。
 
+    layout 与 tone_text 可由分析会话提供，省去重新预处理与标注声调。
+    """
+    table = load_tone_table(rhymebook)
+    yunjiao_dict = load_yunjiao()
     try:
         cipai_intro_dict = load_cipai_intro()
     except Exception:
         cipai_intro_dict = {}
 
-    text_drop, text_cleaned, length, split_length = preprocess_text(text)
-    
-    # 先查找所有匹配的词牌
-    matching_cipai = find_matching_cipai(length, split_length, cipai_data)
-    
-    if not matching_cipai:
-        # Log for debugging when no matching cipai is found
-        try:
-            current_app.logger.info(
-                f"Cipai match failed. total_chars={length}, split_length={split_length}"
-            )
-        except Exception:
-            pass
-        return {
-            "success": False,
-            "message": "未能匹配到词牌名，请检查输入文本或词牌谱数据。",
-            "text": text,
-            "processed_text": text_drop,
-            "length": length,
-            "split_length": split_length
-        }
-    
-    # 如果有多个匹配的词牌，返回选择界面
-    if len(matching_cipai) > 1:
-        return {
-            "success": True,
-            "multiple_matches": True,
-            "matching_cipai": matching_cipai,
-            "text": text_cleaned,
-            "original_text": text,
-            "processed_text": text_drop,
-            "length": length,
-            "split_length": split_length
-        }
-    
-    # 如果只有一个匹配，使用原有逻辑
-    selected_cipai = matching_cipai[0]
-    guess_cipai = selected_cipai['cipai_name']
-    author = selected_cipai['author']
-    tone_database = selected_cipai['rhythm']
+    if layout is None:
+        layout = build_text_layout(text)
+    text_drop, text_cleaned, length, split_length = layout.as_tuple()
 
-    tone_database = re.sub("[^\u4e00-\u9fa5]", "", tone_database)
-    tone_database = list(re.sub(r"增韵", "", tone_database))
-    tone_text = mark_tone(text_drop, tone_dict)
-    score, issue_data = get_score_tone(tone_text, tone_database)
+    if tone_text is None:
+        tone_text = table.mark(text_drop)
+    score, issue_data = get_score_tone_codes(tone_text, tone_pattern)
 
-    yunjiao_options: List[Dict[str, Any]] = []
+    yunjiao_options = build_yunjiao_options(layout, cipai_name, author, table.char_yunbu, yunjiao_dict)
     yunjiao_words: List[str] = []
     yunjiao_yunbu: Dict[str, List[str]] = {}
     yunjiao_detailed: List[Dict[str, Any]] = []
-
-    if guess_cipai and author:
-        key = f"{guess_cipai.strip()}|{author.strip()}"
-        yunjiao_patterns = yunjiao_dict.get(key, [])
-        if yunjiao_patterns:
-            # 为韵脚计算 text_drop -> 原文索引映射
-            text_drop_to_original_map: Dict[int, int] = {}
-            text_drop_index = 0
-            for original_index, char in enumerate(text_cleaned):
-                if re.match(r'[\u4e00-\u9fa5]', char):
-                    text_drop_to_original_map[text_drop_index] = original_index
-                    text_drop_index += 1
-
-            for i, positions in enumerate(yunjiao_patterns):
-                pattern_words = [text_drop[pos - 1] for pos in positions if 0 < pos <= len(text_drop)]
-                pattern_detailed = []
-                pattern_yunbu: Dict[str, List[str]] = {}
-                for pos in positions:
-                    if 0 < pos <= len(text_drop):
-                        word = text_drop[pos - 1]
-                        text_drop_pos = pos - 1
-                        original_pos = text_drop_to_original_map.get(text_drop_pos, -1)
-                        if original_pos >= 0:
-                            yunbu_list = [yunbu for yunbu, words in yunbu_dict.items() if word in words]
-                            pattern_detailed.append({
-                                "position": original_pos,
-                                "word": word,
-                                "yunbu": yunbu_list
-                            })
-                            pattern_yunbu[word] = yunbu_list
-
-                yunjiao_options.append({
-                    "id": i,
-                    "positions": positions,
-                    "words": pattern_words,
-                    "yunbu": pattern_yunbu,
-                    "detailed": pattern_detailed
-                })
-
-            if yunjiao_options:
-                first_option = yunjiao_options[0]
-                yunjiao_words = first_option["words"]
-                yunjiao_yunbu = first_option["yunbu"]
-                yunjiao_detailed = first_option["detailed"]
+    if yunjiao_options:
+        first_option = yunjiao_options[0]
+        yunjiao_words = first_option["words"]
+        yunjiao_yunbu = first_option["yunbu"]
+        yunjiao_detailed = first_option["detailed"]
 
     cipai_intro = ""
-    if guess_cipai and cipai_intro_dict:
-        cipai_intro = cipai_intro_dict.get(guess_cipai.strip(), "")
+    if cipai_name and cipai_intro_dict:
+        cipai_intro = cipai_intro_dict.get(cipai_name.strip(), "")
 
     return {
         "success": True,
         "text": text_cleaned,
         "original_text": text,
         "processed_text": text_drop,
-        "cipai_name": guess_cipai,
+        "cipai_name": cipai_name,
         "cipai_intro": cipai_intro,
         "author": author,
         "score": round(score, 2),
@@ -367,6 +432,127 @@ def estimate_poetry(text: str, rhymebook: str) -> Dict[str, Any]:
     }
 
 
+def rank_matching_cipai(text_drop: str, rhymebook: str, rows: List[int], store: Optional[CipaiPatternStore] = None) -> List[Dict[str, Any]]:
+    """为多个候选词牌批量打分，返回按得分排序的候选列表（含 score 与 issue_positions）。"""
+    store = store if store is not None else load_cipai_patterns()
+    text_codes = load_tone_table(rhymebook).tone_codes(text_drop)
+    ranked = []
+    for item in score_candidates(text_codes, store, rows):
+        record = store.record(item['row_index'])
+        record['score'] = item['score']
+        record['issue_positions'] = item['issue_positions']
+        ranked.append(record)
+    return ranked
+
+
+def approximate_matching_cipai(text_drop: str, rhymebook: str, nearest: List[Tuple[int, int]], store: Optional[CipaiPatternStore] = None) -> List[Dict[str, Any]]:
+    """近似候选的记录列表，带 distance；总字数与文本相同的候选另附 score 与 issue_positions。"""
+    store = store if store is not None else load_cipai_patterns()
+    text_codes = load_tone_table(rhymebook).tone_codes(text_drop)
+    scored = {item['row_index']: item for item in score_candidates(text_codes, store, [row for row, _ in nearest])}
+    matches = []
+    for row, distance in nearest:
+        record = store.record(row)
+        record['distance'] = distance
+        if row in scored:
+            record['score'] = scored[row]['score']
+            record['issue_positions'] = scored[row]['issue_positions']
+        matches.append(record)
+    return matches
+
+
+def estimate_poetry(text: str, rhymebook: str, auto_select: bool = False) -> Dict[str, Any]:
+    """分析文本。匹配到多个词牌时返回按得分排序的候选；auto_select 为真时直接分析得分最高者。"""
+    try:
+        load_tone_table(rhymebook)
+    except Exception as e:
+        return {"error": f"加载韵书文件出错: {e}"}
+
+    try:
+        store = load_cipai_patterns()
+    except Exception as e:
+        return {"error": f"加载词牌谱文件出错: {e}"}
+
+    try:
+        load_yunjiao()
+    except Exception as e:
+        return {"error": f"加载韵脚文件出错: {e}"}
+
+    text_drop, text_cleaned, length, split_length = build_text_layout(text).as_tuple()
+    
+    # 先查找所有匹配的词牌
+    matching_rows = store.find(length, split_length)
+    
+    if not matching_rows:
+        # 精确匹配失败时，按分段字数的编辑距离给出近似候选，交由用户选择
+        nearest = store.nearest(length, split_length, k=APPROXIMATE_MATCH_LIMIT) if length else []
+        if nearest:
+            logger.info(
+                "Cipai exact match failed, %d approximate candidates. total_chars=%s, split_length=%s",
+                len(nearest), length, split_length,
+            )
+            return {
+                "success": True,
+                "multiple_matches": True,
+                "approximate": True,
+                "matching_cipai": approximate_matching_cipai(text_drop, rhymebook, nearest, store),
+                "text": text_cleaned,
+                "original_text": text,
+                "processed_text": text_drop,
+                "length": length,
+                "split_length": split_length
+            }
+
+        # Log for debugging when no matching cipai is found
+        logger.info("Cipai match failed. total_chars=%s, split_length=%s", length, split_length)
+        return {
+            "success": False,
+            "message": "未能匹配到词牌名，请检查输入文本或词牌谱数据。",
+            "text": text,
+            "processed_text": text_drop,
+            "length": length,
+            "split_length": split_length
+        }
+    
+    # 如果只有一个匹配，直接分析
+    if len(matching_rows) == 1:
+        row = matching_rows[0]
+        return analyze_with_pattern(text, rhymebook, store.names[row], store.authors[row], store.tones(row))
+
+    # 多个匹配：一次性为全部候选打分并排序
+    matching_cipai = rank_matching_cipai(text_drop, rhymebook, matching_rows, store)
+    if auto_select:
+        row = matching_cipai[0]['row_index']
+        result = analyze_with_pattern(text, rhymebook, store.names[row], store.authors[row], store.tones(row))
+        result["auto_selected"] = True
+        result["matching_cipai"] = matching_cipai
+        return result
+
+    return {
+        "success": True,
+        "multiple_matches": True,
+        "matching_cipai": matching_cipai,
+        "text": text_cleaned,
+        "original_text": text,
+        "processed_text": text_drop,
+        "length": length,
+        "split_length": split_length
+    }
+
+
+def wrap_analysis_result(result: Any) -> Dict[str, Any]:
+    """将 estimate_poetry 的结果统一包装为 {success, data, error}，并去掉内部的 success/message 字段。"""
+    if isinstance(result, dict) and result.get("error"):
+        return {"success": False, "data": None, "error": result.get("error")}
+    if isinstance(result, dict) and result.get("success") is False:
+        return {"success": False, "data": None, "error": result.get("message") or "分析失败"}
+    if isinstance(result, dict):
+        result = dict(result)
+        result.pop("success", None)
+        result.pop("message", None)
+    return {"success": True, "data": result, "error": None}
+
+
 def create_fillword_framework(tone_pattern: List[str], split_length: List[int]) -> Dict[str, Any]:
     if not split_length:
         total_length = len(tone_pattern)
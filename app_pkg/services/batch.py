@@ -0,0 +1,155 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+from .analysis import (
+    estimate_poetry,
+    load_tone_table,
+    load_cipai_patterns,
+    load_yunjiao,
+    load_cipai_intro,
+)
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def default_worker_count(server_workers: int = 1) -> int:
+    """批量分析进程池的大小：优先取 POETRY_BATCH_WORKERS；否则为 CPU 数，
+    多进程模式下由 server_workers 个服务进程平分（每个进程各有一个进程池），至少为 1（即不启用进程池）。
+    """
+    try:
+        return max(1, int(os.environ.get('POETRY_BATCH_WORKERS', '')))
+    except ValueError:
+        return max(1, (os.cpu_count() or 1) // max(server_workers, 1))
+
+
+def warm_caches() -> None:
+    """预先加载分析所需的全部数据，供工作进程启动时调用。"""
+    for rhymebook in ('1', '2'):
+        load_tone_table(rhymebook)
+    load_cipai_patterns().shape_tree
+    load_yunjiao()
+    try:
+        load_cipai_intro()
+    except Exception:
+        pass
+
+
+def _mp_context():
+    """进程池一律不用 fork：服务端是多线程的，fork 出的子进程会继承其他线程持有的锁（如预热线程正在构建的形状树锁）而卡死。"""
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    # forkserver 进程只预先导入本模块（不导入启动脚本），子进程由它 fork 出来，无需各自重新导入依赖
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def analyze_item(item: Any) -> Dict[str, Any]:
+    """分析单条 {text, rhymebook} 输入；任何异常都转为该条目的 error，不影响其他条目。"""
+    if not isinstance(item, dict):
+        return {"error": "条目格式错误，应为包含 text 的对象"}
+    text = item.get('text', '')
+    if not isinstance(text, str) or not text.strip():
+        return {"error": "请输入要分析的诗词文本"}
+    rhymebook = str(item.get('rhymebook', '2'))
+    try:
+        return estimate_poetry(text, rhymebook, auto_select=bool(item.get('auto_select', False)))
+    except Exception as e:
+        return {"error": f"分析失败: {e}"}
+
+
+def analyze_chunk(items: List[Any]) -> List[Dict[str, Any]]:
+    return [analyze_item(item) for item in items]
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(), initializer=warm_caches)
+            _executor_workers = workers
+        return _executor
+
+
+def shutdown_executor(wait: bool = False) -> None:
+    """关闭常驻进程池；进程随后以 os._exit 退出时须 wait=True，否则进程池子进程收不到退出通知。"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown_executor)
+
+
+def retire_executor() -> None:
+    """数据重载后调用：旧进程池处理完已提交的任务后退出，下次批量分析时以新数据启动新进程池。"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def analyze_batch(items: Iterable[Any], workers: int = 1) -> List[Dict[str, Any]]:
+    """按输入顺序返回每条的 estimate_poetry 结果。
+
+    workers 大于 1 时在常驻进程池中并行执行，每个工作进程各自持有预热好的数据缓存。
+    """
+    items = list(items)
+    if workers <= 1 or len(items) < 2:
+        return [analyze_item(item) for item in items]
+    executor = _get_executor(workers)
+    chunksize = max(1, len(items) // (workers * 4))
+    return list(executor.map(analyze_item, items, chunksize=chunksize))
+
+
+def iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_analyze(
+    items: Iterable[Any],
+    workers: int = 1,
+    chunk_size: int = 64,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+    """流式分析任意长的输入，按输入顺序逐条产出 (item, result)。
+
+    同时提交给进程池的分块数不超过 max_in_flight（默认 workers * 2），
+    因此内存占用与输入总量无关。进程池为本次调用独占，结束时关闭。
+    """
+    chunks = iter_chunks(items, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from zip(chunk, analyze_chunk(chunk))
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    pending: deque = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(), initializer=warm_caches) as executor:
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(analyze_chunk, chunk)))
+            if len(pending) >= max_in_flight:
+                done_chunk, future = pending.popleft()
+                yield from zip(done_chunk, future.result())
+        while pending:
+            done_chunk, future = pending.popleft()
+            yield from zip(done_chunk, future.result())
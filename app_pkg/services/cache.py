@@ -0,0 +1,278 @@
+import functools
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，同时按条目数与总字节数限制容量，可选 TTL（秒）。
+
+    写入时由调用方给出条目大小；max_entries 为 0 时缓存关闭。
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, size, expires_at)
+        self._data: 'OrderedDict[Hashable, Tuple[Any, int, Optional[float]]]' = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, size: int = 1) -> None:
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        expires_at = self._clock() + self.ttl if self.ttl else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class VersionedLRUCache(LRUCache):
+    """数据版本变化时自动清空的 LRU 缓存。
+
+    version_fn 返回当前数据版本（如数据文件的 mtime 签名），最多每 check_interval 秒检查一次。
+    """
+
+    def __init__(self, version_fn: Callable[[], Hashable], check_interval: float = 1.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._version_fn = version_fn
+        self._check_interval = check_interval
+        self._version = version_fn()
+        self._next_check = self._clock() + check_interval
+        self.invalidations = 0
+
+    def _check_version(self) -> None:
+        now = self._clock()
+        if now < self._next_check:
+            return
+        self._next_check = now + self._check_interval
+        version = self._version_fn()
+        if version != self._version:
+            self._version = version
+            self.invalidations += 1
+            self.clear()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        self._check_version()
+        return super().get(key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+class LoaderCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    # 等待其他线程完成同一加载的次数
+    waits: int
+    maxsize: int
+    currsize: int
+
+
+# 所有 single_flight_cache 装饰的加载函数，按 __qualname__ 登记
+LOADERS: Dict[str, Callable[..., Any]] = {}
+
+_generation_numbers = itertools.count()
+
+
+class DataGeneration:
+    """各加载函数缓存结果的一个版本，按加载函数名分别保存。
+
+    数据重载时 fork 出新版本：受影响的加载函数换成空字典，其余加载函数与旧版本共用同一个字典（写时复制）；
+    在新版本中重建完成后由 publish_generation 整体替换。
+    """
+
+    def __init__(self, results: Dict[str, 'OrderedDict[Hashable, Any]']) -> None:
+        self.number = next(_generation_numbers)
+        self.results = results
+
+    def fork(self, invalidate: Iterable[str]) -> 'DataGeneration':
+        results = dict(self.results)
+        for name in invalidate:
+            results[name] = OrderedDict()
+        return DataGeneration(results)
+
+
+_latest_generation = DataGeneration({})
+_pinned = threading.local()
+
+
+def latest_generation() -> DataGeneration:
+    return _latest_generation
+
+
+def current_generation() -> DataGeneration:
+    """当前线程看到的版本：用 pin_generation 固定过时为固定的版本，否则为最新版本。"""
+    generation = getattr(_pinned, 'generation', None)
+    return generation if generation is not None else _latest_generation
+
+
+def pin_generation(generation: Optional[DataGeneration] = None) -> Optional[DataGeneration]:
+    """把当前线程固定到 generation（默认为最新版本），使一次请求内的各加载函数结果彼此一致。
+
+    返回之前的固定值，交给 unpin_generation 恢复。
+    """
+    previous = getattr(_pinned, 'generation', None)
+    _pinned.generation = generation if generation is not None else _latest_generation
+    return previous
+
+
+def unpin_generation(previous: Optional[DataGeneration]) -> None:
+    _pinned.generation = previous
+
+
+def publish_generation(generation: DataGeneration) -> None:
+    """把 generation 设为最新版本；已固定到旧版本的线程不受影响。"""
+    global _latest_generation
+    _latest_generation = generation
+
+
+def single_flight_cache(maxsize: int = 128) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """与 lru_cache 用法相同的缓存装饰器，但同一参数的并发调用只执行一次。
+
+    首个调用方执行加载，其余调用方在该参数的锁上等待并直接取用结果；
+    加载抛出异常时不缓存，等待者会各自重试。提供 cache_info()、cache_clear() 与 cache_peek()。
+    结果按 DataGeneration 分版本保存，读取当前线程所见的版本。
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        name = fn.__qualname__
+        _latest_generation.results.setdefault(name, OrderedDict())
+        # 进行中的加载按 (版本号, 参数) 区分，后台重建不会与请求线程互相等待
+        inflight: Dict[Tuple[int, Hashable], threading.Lock] = {}
+        lock = threading.Lock()
+        counters = {"hits": 0, "misses": 0, "waits": 0}
+
+        def results_for(generation: DataGeneration) -> 'OrderedDict[Hashable, Any]':
+            results = generation.results.get(name)
+            if results is None:
+                results = generation.results.setdefault(name, OrderedDict())
+            return results
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            key = args + tuple(sorted(kwargs.items())) if kwargs else args
+            generation = current_generation()
+            flight_key = (generation.number, key)
+            with lock:
+                results = results_for(generation)
+                if key in results:
+                    results.move_to_end(key)
+                    counters["hits"] += 1
+                    return results[key]
+                key_lock = inflight.get(flight_key)
+                if key_lock is None:
+                    key_lock = inflight[flight_key] = threading.Lock()
+                else:
+                    counters["waits"] += 1
+            with key_lock:
+                with lock:
+                    if key in results:
+                        counters["hits"] += 1
+                        return results[key]
+                    counters["misses"] += 1
+                try:
+                    value = fn(*args, **kwargs)
+                    with lock:
+                        results[key] = value
+                        while len(results) > maxsize:
+                            results.popitem(last=False)
+                    return value
+                finally:
+                    with lock:
+                        if inflight.get(flight_key) is key_lock:
+                            del inflight[flight_key]
+
+        def cache_info() -> LoaderCacheInfo:
+            with lock:
+                return LoaderCacheInfo(counters["hits"], counters["misses"], counters["waits"],
+                                       maxsize, len(results_for(current_generation())))
+
+        def cache_clear() -> None:
+            with lock:
+                results_for(current_generation()).clear()
+
+        def cache_peek(*args: Any, **kwargs: Any) -> Optional[Any]:
+            """已缓存时返回结果，否则返回 None；不触发加载，也不计入命中统计。"""
+            key = args + tuple(sorted(kwargs.items())) if kwargs else args
+            with lock:
+                return results_for(current_generation()).get(key)
+
+        def cache_keys() -> Tuple[Hashable, ...]:
+            with lock:
+                return tuple(results_for(current_generation()))
+
+        wrapper.cache_info = cache_info  # type: ignore[attr-defined]
+        wrapper.cache_clear = cache_clear  # type: ignore[attr-defined]
+        wrapper.cache_peek = cache_peek  # type: ignore[attr-defined]
+        wrapper.cache_keys = cache_keys  # type: ignore[attr-defined]
+        LOADERS[name] = wrapper
+        return wrapper
+
+    return decorator
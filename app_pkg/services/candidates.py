@@ -0,0 +1,180 @@
+import heapq
+from typing import Tuple, List, Dict, Any, Mapping, Optional, Sequence
+
+from .analysis import load_tone_table
+from .cache import single_flight_cache
+from .datafiles import WORD_FREQUENCY_PATH
+from .records import read_word_frequency_rows
+
+
+# 词谱中的“中”：该位置平仄不限
+ANY_TONE = '中'
+PHRASE_LENGTH = 2
+
+# GB2312 一级汉字（常用字）的编码范围
+_GB2312_LEVEL1 = (0xB0A1, 0xD7F9)
+
+CharKey = Tuple[str, Optional[str]]
+
+
+def _is_common(char: str) -> bool:
+    try:
+        encoded = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return False
+    return len(encoded) == 2 and _GB2312_LEVEL1[0] <= ((encoded[0] << 8) | encoded[1]) <= _GB2312_LEVEL1[1]
+
+
+@single_flight_cache(maxsize=1)
+def load_word_frequency() -> Dict[str, int]:
+    """词组 -> 词频；同一词组出现多次时累加。"""
+    frequency: Dict[str, int] = {}
+    for row in read_word_frequency_rows(WORD_FREQUENCY_PATH):
+        frequency[row.phrase] = frequency.get(row.phrase, 0) + row.frequency
+    return frequency
+
+
+def _merge(tables: List[Sequence[str]], rank: Dict[str, int], limit: int) -> List[str]:
+    """按同一排序合并多张已排序的表，去重后取前 limit 项。"""
+    if len(tables) == 1:
+        return list(tables[0][:limit])
+    merged: List[str] = []
+    seen = set()
+    for item in heapq.merge(*tables, key=rank.__getitem__):
+        if item not in seen:
+            seen.add(item)
+            merged.append(item)
+            if len(merged) >= limit:
+                break
+    return merged
+
+
+class CandidateIndex:
+    """预先排好序的填词候选表，查询时只需取切片。
+
+    - chars[(声调, 韵部)]：该韵部中该声调的字；韵部为 None 时不限韵部，声调为“中”时不限声调
+    - phrases[(形状, 末字韵部)]：形状为两字的声调（如“平仄”，“中”表示该字不限），末字韵部为 None 时不限
+
+    排序依据：词频分析.csv 中的词组（仅约 250 个）及其所含的字按词频排在最前（单字取所在词组的词频之和），
+    其余绝大多数字按是否常用字（GB2312 一级字）→ 韵书中的顺序排列，并非完整的字频排序。
+    """
+
+    def __init__(self, chars: Dict[CharKey, Tuple[str, ...]], phrases: Dict[CharKey, Tuple[str, ...]],
+                 char_rank: Dict[str, int], phrase_rank: Dict[str, int]) -> None:
+        self.chars = chars
+        self.phrases = phrases
+        self._char_rank = char_rank
+        self._phrase_rank = phrase_rank
+
+    @classmethod
+    def build(cls, tone_dict: Dict[str, str], char_yunbu: Dict[str, Tuple[str, ...]],
+              frequency: Dict[str, int]) -> 'CandidateIndex':
+        char_frequency: Dict[str, int] = {}
+        for phrase, count in frequency.items():
+            for char in phrase:
+                char_frequency[char] = char_frequency.get(char, 0) + count
+
+        order = {char: i for i, char in enumerate(tone_dict)}
+        ranked = sorted(tone_dict, key=lambda c: (-char_frequency.get(c, 0), not _is_common(c), order[c]))
+        chars: Dict[CharKey, List[str]] = {}
+        for char in ranked:
+            tone = tone_dict[char]
+            for yunbu in (None,) + char_yunbu.get(char, ()):
+                chars.setdefault((tone, yunbu), []).append(char)
+                chars.setdefault((ANY_TONE, yunbu), []).append(char)
+
+        # 只收两字且两字都在韵书中的词组
+        phrase_list = [p for p in frequency if len(p) == PHRASE_LENGTH and all(c in tone_dict for c in p)]
+        phrase_list.sort(key=lambda p: (-frequency[p], order[p[0]], order[p[1]]))
+        phrases: Dict[CharKey, List[str]] = {}
+        for phrase in phrase_list:
+            first, last = tone_dict[phrase[0]], tone_dict[phrase[1]]
+            for shape in {first + last, ANY_TONE + last, first + ANY_TONE, ANY_TONE + ANY_TONE}:
+                for yunbu in (None,) + char_yunbu.get(phrase[1], ()):
+                    phrases.setdefault((shape, yunbu), []).append(phrase)
+
+        return cls(
+            {key: tuple(value) for key, value in chars.items()},
+            {key: tuple(value) for key, value in phrases.items()},
+            {char: i for i, char in enumerate(ranked)},
+            {phrase: i for i, phrase in enumerate(phrase_list)},
+        )
+
+    def suggest_chars(self, tone: str, yunbu: Sequence[str] = (), limit: int = 20) -> List[str]:
+        keys = [(tone, name) for name in yunbu] if yunbu else [(tone, None)]
+        return _merge([self.chars.get(key, ()) for key in keys], self._char_rank, limit)
+
+    def suggest_phrases(self, shape: str, yunbu: Sequence[str] = (), limit: int = 20) -> List[str]:
+        keys = [(shape, name) for name in yunbu] if yunbu else [(shape, None)]
+        return _merge([self.phrases.get(key, ()) for key in keys], self._phrase_rank, limit)
+
+
+@single_flight_cache(maxsize=8)
+def get_candidate_index(rhymebook: str) -> CandidateIndex:
+    # 字典只在构建期间使用，构建完即释放
+    tone_dict, _, char_yunbu = load_tone_table(rhymebook).to_dicts()
+    return CandidateIndex.build(tone_dict, char_yunbu, load_word_frequency())
+
+
+def _sentence_bounds(split_length: Sequence[int], total: int, position: int) -> Tuple[int, int]:
+    """position 所在分句的 [起, 止)；没有分段信息时视为一整句。"""
+    start = 0
+    for length in split_length:
+        if position < start + length:
+            return start, start + length
+        start += length
+    return 0, total
+
+
+def suggest_for_slot(
+    index: CandidateIndex,
+    char_yunbu: Mapping[str, Tuple[str, ...]],
+    tone_pattern: Sequence[str],
+    split_length: Sequence[int],
+    rhyme_positions: Sequence[int],
+    position: int,
+    length: int = 1,
+    filled: Sequence[str] = (),
+    yunbu: Sequence[str] = (),
+    limit: int = 20,
+) -> Dict[str, Any]:
+    """填词框架中从 position（从 0 起）开始 length 个字的候选。
+
+    rhyme_positions 为韵脚（从 0 起）；末字落在韵脚上时，候选限定为已填韵脚字所在的韵部，
+    也可由 yunbu 直接指定。filled 为各位置已填的字（空串表示未填）。位置不合法时抛出 ValueError。
+    """
+    if length not in (1, PHRASE_LENGTH):
+        raise ValueError("length 只能为 1 或 2")
+    if not 0 <= position <= len(tone_pattern) - length:
+        raise ValueError("位置超出词牌字数")
+    if length > 1:
+        _, sentence_end = _sentence_bounds(split_length, len(tone_pattern), position)
+        if position + length > sentence_end:
+            raise ValueError("该位置所在分句不足两字")
+
+    last = position + length - 1
+    rhyme_set = set(rhyme_positions)
+    is_rhyme = last in rhyme_set
+    rhyme_yunbu: Tuple[str, ...] = tuple(yunbu)
+    if not rhyme_yunbu and is_rhyme:
+        # 以第一个已填且可查到韵部的韵脚字为准
+        for pos in sorted(rhyme_set):
+            if pos != last and pos < len(filled) and filled[pos]:
+                rhyme_yunbu = char_yunbu.get(filled[pos], ())
+                if rhyme_yunbu:
+                    break
+
+    tones = list(tone_pattern[position:position + length])
+    if length == 1:
+        candidates = index.suggest_chars(tones[0], rhyme_yunbu, limit)
+    else:
+        candidates = index.suggest_phrases(''.join(tones), rhyme_yunbu, limit)
+    return {
+        "position": position,
+        "length": length,
+        "tones": tones,
+        "rhyme": is_rhyme,
+        "yunbu": list(rhyme_yunbu),
+        "rhyme_positions": sorted(rhyme_set),
+        "candidates": candidates,
+    }
@@ -0,0 +1,39 @@
+import os
+from typing import Optional, Sequence, Tuple
+
+
+# 数据文件路径（相对项目根目录）
+CIPAI_PATH = 'data/cipai_with_statistics_qdcp.csv'
+CIPAI_INTRO_PATH = 'data/cipai_detail_with_intro.csv'
+YUNJIAO_PATH = 'data/yunjiao.csv'
+# 候选词排序用的词频表；不在快照中，也不参与分析结果缓存的版本签名
+WORD_FREQUENCY_PATH = 'data/词频分析.csv'
+# 常用词牌别名表，补充词牌介绍中解析出的别名；只用于检索，不在快照中
+CIPAI_ALIAS_PATH = 'data/cipai_alias.csv'
+RHYMEBOOK_PATHS = {
+    '1': 'data/词林正韵.json',
+    '2': 'data/中华新韵.json'
+}
+
+# 预编译的数据快照（由 build_snapshot.py 生成），设为空字符串可禁用
+SNAPSHOT_PATH = os.environ.get('POETRY_DATA_SNAPSHOT', 'data/snapshot.bin')
+
+DATA_FILES: Tuple[str, ...] = (
+    CIPAI_PATH,
+    CIPAI_INTRO_PATH,
+    YUNJIAO_PATH,
+    *RHYMEBOOK_PATHS.values(),
+)
+
+
+def file_signature(path: str) -> Tuple[str, Optional[int], Optional[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, st.st_mtime_ns, st.st_size
+
+
+def data_signature(paths: Sequence[str] = DATA_FILES) -> Tuple[Tuple[str, Optional[int], Optional[int]], ...]:
+    """数据文件的 (路径, mtime_ns, 大小) 签名，任一文件变化时签名随之改变。"""
+    return tuple(file_signature(path) for path in paths)
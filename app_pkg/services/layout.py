@@ -0,0 +1,91 @@
+from array import array
+from functools import lru_cache
+from typing import Tuple, List
+
+
+# 分句使用的标点，与 preprocess_text 原先的 re.split('[，。、？！]') 一致
+SENTENCE_DELIMITERS = frozenset('，。、？！')
+
+
+class TextLayout:
+    """一次遍历得到的文本版式信息，供各分析接口共享。
+
+    - text_cleaned：去掉空白后的文本
+    - text_drop：只保留汉字（U+4E00–U+9FA5）的文本
+    - offsets：text_drop 第 i 个字在 text_cleaned 中的下标
+    - split_length：各分句的汉字数
+    - punctuation_positions：分句标点在 text_cleaned 中的下标
+
+    实例会被缓存复用，调用方不应修改其中的数据。
+    """
+
+    __slots__ = ('text_cleaned', 'text_drop', 'offsets', 'split_length', 'punctuation_positions')
+
+    def __init__(self, text_cleaned: str, text_drop: str, offsets: array,
+                 split_length: Tuple[int, ...], punctuation_positions: Tuple[int, ...]) -> None:
+        self.text_cleaned = text_cleaned
+        self.text_drop = text_drop
+        self.offsets = offsets
+        self.split_length = split_length
+        self.punctuation_positions = punctuation_positions
+
+    @property
+    def length(self) -> int:
+        return len(self.text_drop)
+
+    def original_position(self, drop_index: int) -> int:
+        """text_drop 下标对应的 text_cleaned 下标，越界时返回 -1。"""
+        if 0 <= drop_index < len(self.offsets):
+            return self.offsets[drop_index]
+        return -1
+
+    def as_tuple(self) -> Tuple[str, str, int, List[int]]:
+        """与 preprocess_text 相同的返回值 (text_drop, text_cleaned, length, split_length)。"""
+        return self.text_drop, self.text_cleaned, self.length, list(self.split_length)
+
+
+def _scan(text: str) -> TextLayout:
+    cleaned_chars: List[str] = []
+    han_chars: List[str] = []
+    offsets = array('I')
+    split_length: List[int] = []
+    punctuation_positions: List[int] = []
+
+    sentence_han = 0
+    sentence_nonempty = False
+    for char in text:
+        if char.isspace():
+            continue
+        position = len(cleaned_chars)
+        cleaned_chars.append(char)
+        if char in SENTENCE_DELIMITERS:
+            punctuation_positions.append(position)
+            if sentence_nonempty:
+                split_length.append(sentence_han)
+            sentence_han = 0
+            sentence_nonempty = False
+            continue
+        sentence_nonempty = True
+        if '一' <= char <= '龥':
+            han_chars.append(char)
+            offsets.append(position)
+            sentence_han += 1
+    if sentence_nonempty:
+        split_length.append(sentence_han)
+
+    length = len(han_chars)
+    if length == 0:
+        # 没有中文字符
+        split_length = [0]
+    elif not split_length or sum(split_length) == 0:
+        # 没有标点符号时把整个文本作为一段
+        split_length = [length]
+
+    return TextLayout(''.join(cleaned_chars), ''.join(han_chars), offsets,
+                      tuple(split_length), tuple(punctuation_positions))
+
+
+@lru_cache(maxsize=256)
+def build_text_layout(text: str) -> TextLayout:
+    """按文本内容缓存的 TextLayout；同一首词的后续请求（换韵脚、选词牌）直接复用。"""
+    return _scan(text)
@@ -0,0 +1,271 @@
+import bisect
+import json
+from typing import Tuple, List, Dict, Any, Iterator, NamedTuple, Optional
+
+from .analysis import (
+    analyze_with_pattern,
+    estimate_poetry,
+    load_cipai_patterns,
+    load_tone_table,
+    rank_matching_cipai,
+    wrap_analysis_result,
+)
+from .cache import LRUCache, current_generation
+from .layout import build_text_layout
+from .patterns import TONE_CODES, TONE_NAMES, TONE_ZHONG
+from .sessions import AnalysisSession, session_id_for, session_size
+
+
+class LiveState(NamedTuple):
+    """边写边查的检查状态：分析会话加上按某个词牌、某种韵脚模式得出的得分、问题与韵脚。
+
+    每次编辑只重算变化范围内的声调、问题与韵脚，得到新的 LiveState；旧状态不修改。
+    """
+    session: AnalysisSession
+    # 检查所用的词牌行号；文本匹配不到词牌时为 None，只跟踪声调标注
+    row: Optional[int]
+    yunjiao_id: int
+    # 合乎平仄的字数（得分的分子）与词牌总字数（分母）
+    matched: int
+    total: int
+    # 按位置排序的问题，issue_positions 与之一一对应，供二分查找
+    issues: Tuple[Dict[str, Any], ...]
+    issue_positions: Tuple[int, ...]
+    # 所选韵脚模式中落在文本内的韵脚（从 1 起的汉字序号）及其明细，一一对应
+    rhyme_positions: Tuple[int, ...]
+    rhyme_detailed: Tuple[Dict[str, Any], ...]
+
+    @property
+    def score(self) -> float:
+        return round(self.matched / self.total * 100, 2) if self.total else 0
+
+
+def live_key(session_id: str, row: Optional[int], yunjiao_id: int) -> Tuple[str, str, Optional[int], int]:
+    """检查状态在会话缓存中的键，与分析会话（以 session_id 为键）共用同一缓存。"""
+    return ('live', session_id, row, yunjiao_id)
+
+
+def live_state_size(state: LiveState) -> int:
+    return session_size(state.session) + 160 * (len(state.issues) + len(state.rhyme_detailed))
+
+
+def get_live_state(sessions: LRUCache, session_id: str, row: Optional[int], yunjiao_id: int) -> Optional[LiveState]:
+    state = sessions.get(live_key(session_id, row, yunjiao_id))
+    if state is None or state.session.generation != current_generation().number:
+        return None
+    return state
+
+
+def apply_edits(text: str, edits: Any) -> str:
+    """依次应用 [{start, end, text}, ...]（也可为单个对象）：把 [start, end) 换成 text，下标按字符计。
+
+    每条编辑的下标针对前一条编辑之后的文本；格式错误或越界时抛出 ValueError。
+    """
+    if isinstance(edits, dict):
+        edits = [edits]
+    if not isinstance(edits, list):
+        raise ValueError("edits 应为编辑数组")
+    for edit in edits:
+        if not isinstance(edit, dict):
+            raise ValueError("编辑格式错误，应为包含 start、end、text 的对象")
+        start, end, insert = edit.get('start'), edit.get('end', edit.get('start')), edit.get('text', '')
+        if not (isinstance(start, int) and isinstance(end, int) and isinstance(insert, str)):
+            raise ValueError("编辑的 start、end 须为整数，text 须为字符串")
+        if not 0 <= start <= end <= len(text):
+            raise ValueError("编辑范围超出文本长度")
+        text = text[:start] + insert + text[end:]
+    return text
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """公共前缀长度；按切片二分比较，逐段比较在 C 中完成。"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def changed_range(old: str, new: str) -> Tuple[int, int, int]:
+    """(start, old_end, new_end)：old[start:old_end] 换成 new[start:new_end]，两端其余部分相同。"""
+    start = _common_prefix(old, new)
+    suffix = _common_prefix(old[start:][::-1], new[start:][::-1])
+    return start, len(old) - suffix, len(new) - suffix
+
+
+def _check_row(session: AnalysisSession, row: int, yunjiao_id: int) -> Tuple[LiveState, Dict[str, Any]]:
+    """按词牌 row 完整分析一次，返回检查状态与 analyze_with_pattern 的结果。"""
+    store = load_cipai_patterns()
+    result = analyze_with_pattern(
+        session.text, session.rhymebook, store.names[row], store.authors[row], store.tones(row),
+        layout=session.layout, tone_text=session.tone_text,
+    )
+    result["row_index"] = row
+    issues = tuple(result["issues"])
+    total = int(store.totals[row])
+    options = result["yunjiao_options"]
+    if not 0 <= yunjiao_id < len(options):
+        yunjiao_id = 0
+    rhyme_positions: Tuple[int, ...] = ()
+    rhyme_detailed: Tuple[Dict[str, Any], ...] = ()
+    if options:
+        option = options[yunjiao_id]
+        length = session.layout.length
+        rhyme_positions = tuple(pos for pos in option["positions"] if 0 < pos <= length)
+        rhyme_detailed = tuple(option["detailed"])
+        result["yunjiao_words"] = option["words"]
+        result["yunjiao_yunbu"] = option["yunbu"]
+        result["yunjiao_detailed"] = option["detailed"]
+    result["selected_yunjiao_id"] = yunjiao_id
+    # 与 get_score_tone_codes 相同，只逐字对照到文本与词牌中较短者为止
+    matched = min(total, session.layout.length) - len(issues)
+    state = LiveState(session, row, yunjiao_id, matched, total, issues,
+                      tuple(issue["position"] for issue in issues), rhyme_positions, rhyme_detailed)
+    return state, result
+
+
+def _match(session: AnalysisSession, previous_row: Optional[int], yunjiao_id: int) -> Tuple[LiveState, Dict[str, Any]]:
+    """重新匹配词牌：仍匹配之前的词牌时沿用，否则取得分最高者。
+
+    匹配不到时（如正在输入、字数暂时不对）仍按之前的词牌逐字检查，与 /analyze_with_selected_cipai 相同；
+    之前也没有词牌时返回与 /analyze 相同的结果（含近似候选）。
+    """
+    store = load_cipai_patterns()
+    layout = session.layout
+    rows = store.find(layout.length, list(layout.split_length)) if layout.length else []
+    if not rows and previous_row is not None:
+        return _check_row(session, previous_row, yunjiao_id)
+    if not rows:
+        result = estimate_poetry(session.text, session.rhymebook)
+        candidates = [item['row_index'] for item in result.get('matching_cipai') or []
+                      if item.get('row_index') is not None]
+        return LiveState(session._replace(candidates=tuple(candidates)), None, 0, 0, 0, (), (), (), ()), result
+
+    ranked = rank_matching_cipai(layout.text_drop, session.rhymebook, rows, store) if len(rows) > 1 else []
+    if previous_row in rows:
+        row = previous_row
+    else:
+        row = ranked[0]['row_index'] if ranked else rows[0]
+        yunjiao_id = 0
+    if ranked:
+        session = session._replace(candidates=tuple(rows))
+    state, result = _check_row(session, row, yunjiao_id)
+    if ranked:
+        result["auto_selected"] = True
+        result["matching_cipai"] = ranked
+    return state, result
+
+
+def start_live_state(session: AnalysisSession, row: Optional[int] = None, yunjiao_id: int = 0) -> Tuple[LiveState, Dict[str, Any]]:
+    """由 /analyze 的会话开始检查。row 为空时按字数与分段匹配词牌，多个匹配时取得分最高者。
+
+    row 不合法或不在会话的候选词牌中时抛出 ValueError。
+    """
+    if row is None:
+        return _match(session, None, yunjiao_id)
+    store = load_cipai_patterns()
+    if not 0 <= row < len(store):
+        raise ValueError("row_index 超出词牌谱范围")
+    if session.candidates and row not in session.candidates:
+        raise ValueError("所选词牌不在本次分析的候选中")
+    return _check_row(session, row, yunjiao_id)
+
+
+def _recheck_range(state: LiveState, session: AnalysisSession, start: int, end: int) -> LiveState:
+    """字数与分段不变时，只重算 [start, end) 内的问题与韵脚，其余沿用旧状态。"""
+    tone_text = session.tone_text
+    pattern = load_cipai_patterns().tones(state.row)[start:end].tolist()
+    new_issues: List[Dict[str, Any]] = []
+    for offset, code in enumerate(pattern):
+        position = start + offset
+        word, tone = tone_text[position]
+        if code != TONE_ZHONG and TONE_CODES.get(tone) != code:
+            new_issues.append({"word": word, "actual": tone, "expected": TONE_NAMES[code], "position": position})
+
+    lo = bisect.bisect_left(state.issue_positions, start)
+    hi = bisect.bisect_left(state.issue_positions, end)
+    issues = state.issues[:lo] + tuple(new_issues) + state.issues[hi:]
+    issue_positions = state.issue_positions[:lo] + tuple(issue["position"] for issue in new_issues) + state.issue_positions[hi:]
+    matched = state.matched + (hi - lo) - len(new_issues)
+
+    # 韵脚：变化范围内的字重查韵部；范围外的字只在原文位置（标点、空白增删引起）变化时更新
+    layout = session.layout
+    char_yunbu = load_tone_table(session.rhymebook).char_yunbu
+    detailed = list(state.rhyme_detailed)
+    for k, pos in enumerate(state.rhyme_positions):
+        index = pos - 1
+        original_pos = layout.original_position(index)
+        if start <= index < end:
+            word = layout.text_drop[index]
+            detailed[k] = {"position": original_pos, "word": word, "yunbu": list(char_yunbu.get(word, ()))}
+        elif detailed[k]["position"] != original_pos:
+            detailed[k] = dict(detailed[k], position=original_pos)
+    return state._replace(session=session, matched=matched, issues=issues, issue_positions=issue_positions,
+                          rhyme_detailed=tuple(detailed))
+
+
+def live_events(sessions: LRUCache, state: LiveState, text: str,
+                started: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """把检查状态更新到新文本 text，依次产出 (事件名, 数据)：
+
+    - match：完整的分析结果（与 /analyze 的响应相同），仅在开始检查或分段字数变化、重新匹配词牌时产出
+    - tones：text_drop 中 [start, end) 范围的新声调标注（替换旧标注中的 [start, old_end)）
+    - issues：该范围内的新问题（替换旧问题中位置落在该范围内的），以及更新后的得分
+    - yunjiao：有变化的韵脚明细（index 为其在 yunjiao_detailed 中的下标），以及全部韵脚字与韵部
+    - done：新的 session_id 及后续编辑所需的 row_index、yunjiao_id
+
+    新的会话与检查状态写入 sessions，下一次编辑以 done 中的 session_id 为基础。
+    """
+    if started is not None:
+        yield 'match', wrap_analysis_result(started)
+
+    old = state.session
+    if text != old.text:
+        layout = build_text_layout(text)
+        start, old_end, new_end = changed_range(old.layout.text_drop, layout.text_drop)
+        marks = load_tone_table(old.rhymebook).mark(layout.text_drop[start:new_end])
+        tone_text = old.tone_text[:start] + marks + old.tone_text[old_end:]
+        session = AnalysisSession(text, old.rhymebook, layout, tone_text, old.candidates, current_generation().number)
+        yield 'tones', {"start": start, "old_end": old_end, "end": new_end, "tone_text": marks,
+                        "length": layout.length}
+
+        if layout.split_length != old.layout.split_length:
+            state, result = _match(session._replace(candidates=()), state.row, state.yunjiao_id)
+            yield 'match', wrap_analysis_result(result)
+        elif state.row is None:
+            state = state._replace(session=session)
+        else:
+            # 分段不变则总字数不变，变化范围前后的字与词牌谱的对应关系不变；
+            # start == new_end 时汉字未变，只有标点或空白变化，韵脚明细中的原文位置可能平移
+            previous_detailed = state.rhyme_detailed
+            state = _recheck_range(state, session, start, new_end)
+            if start < new_end:
+                lo = bisect.bisect_left(state.issue_positions, start)
+                hi = bisect.bisect_left(state.issue_positions, new_end)
+                yield 'issues', {"start": start, "end": new_end, "issues": list(state.issues[lo:hi]),
+                                 "score": state.score, "issue_count": len(state.issues)}
+            changed = [dict(entry, index=k) for k, entry in enumerate(state.rhyme_detailed)
+                       if entry is not previous_detailed[k]]
+            if changed:
+                yield 'yunjiao', {
+                    "changed": changed,
+                    "words": [entry["word"] for entry in state.rhyme_detailed],
+                    "yunbu": {entry["word"]: entry["yunbu"] for entry in state.rhyme_detailed},
+                }
+
+    session = state.session
+    session_id = session_id_for(session.text, session.rhymebook)
+    if sessions.get(session_id) is None:
+        sessions.set(session_id, session, size=session_size(session))
+    sessions.set(live_key(session_id, state.row, state.yunjiao_id), state, size=live_state_size(state))
+    yield 'done', {"session_id": session_id, "row_index": state.row, "yunjiao_id": state.yunjiao_id,
+                   "score": state.score, "length": session.layout.length,
+                   "split_length": list(session.layout.split_length)}
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """一条 Server-Sent Events 消息。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
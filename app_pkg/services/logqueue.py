@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Dict, Any, Optional
+
+
+# 访问日志使用的 logger，传递到 app.logger（app_pkg）的队列处理器
+ACCESS_LOGGER_NAME = 'app_pkg.access'
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+_listener_lock = threading.Lock()
+_logger: Optional[logging.Logger] = None
+# 多进程模式下工作进程把日志记录发往父进程的队列，以及父进程中读取该队列的监听线程
+_worker_queue: Any = None
+_worker_listener: Optional[QueueListener] = None
+_forwarding = False
+
+
+class StructuredFormatter(logging.Formatter):
+    """普通日志沿用文本格式；带 access 字段的访问日志输出为一行 JSON。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        access = getattr(record, 'access', None)
+        if access is None:
+            return super().format(record)
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+        entry: Dict[str, Any] = {"ts": f"{timestamp}.{int(record.msecs):03d}", "level": record.levelname}
+        entry.update(access)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+
+class DeferredQueueHandler(QueueHandler):
+    """只把日志记录放入队列，格式化留给监听线程。
+
+    标准 QueueHandler 会在调用线程中先格式化消息（为跨进程传递做准备）；
+    这里的队列只在进程内使用，直接传递原记录即可。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_queue_logging(logger: logging.Logger, handlers: List[logging.Handler]) -> QueueListener:
+    """把 logger 的输出改为经由队列，由后台线程写入 handlers。
+
+    logger 上原有的处理器会被移除；同一进程内只启动一个监听线程，进程退出时写完队列中剩余的记录。
+    """
+    global _listener, _handler, _logger
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        _logger = logger
+        log_queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        _handler = DeferredQueueHandler(log_queue)
+        logger.addHandler(_handler)
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_queue_logging)
+        return _listener
+
+
+def forward_worker_logging() -> None:
+    """在 fork 工作进程之前由父进程调用：此后 fork 出的子进程把日志记录发往父进程，由父进程统一写入。
+
+    日志文件只由父进程打开和轮转，避免多个进程各自轮转同一文件时丢失记录。
+    父进程只从该队列读取、从不写入，因此 fork 时队列不会处于写入中途的状态。
+    """
+    global _worker_queue, _worker_listener
+    with _listener_lock:
+        if _listener is None or _worker_listener is not None:
+            return
+        _worker_queue = multiprocessing.Queue()
+        _worker_listener = QueueListener(_worker_queue, *_listener.handlers, respect_handler_level=True)
+        _worker_listener.start()
+
+
+def restart_queue_logging_after_fork() -> None:
+    """在 fork 出的子进程中调用：监听线程不会随 fork 复制。
+
+    父进程调用过 forward_worker_logging 时改为把记录发往父进程；否则用新队列在本进程重新启动监听线程。
+    """
+    global _listener, _listener_lock, _handler, _worker_listener, _forwarding
+    _listener_lock = threading.Lock()
+    if _listener is None or _handler is None or _logger is None:
+        return
+    if _worker_queue is not None:
+        # 跨进程传递需先格式化消息、去掉不可序列化的参数，使用标准 QueueHandler
+        _listener = None
+        _worker_listener = None
+        _logger.removeHandler(_handler)
+        _handler = QueueHandler(_worker_queue)
+        _logger.addHandler(_handler)
+        _forwarding = True
+        return
+    log_queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_queue_logging() -> None:
+    """写完队列中剩余的记录后停止监听线程；工作进程中则等待记录全部发往父进程。"""
+    global _listener, _worker_listener
+    with _listener_lock:
+        if _forwarding:
+            # 工作进程：os._exit 不会等待队列的后台发送线程，这里显式等待
+            _worker_queue.close()
+            _worker_queue.join_thread()
+            return
+        if _worker_listener is not None:
+            _worker_listener.stop()
+            _worker_listener = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
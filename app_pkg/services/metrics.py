@@ -0,0 +1,285 @@
+import bisect
+import math
+import threading
+from typing import Tuple, List, Dict, Any, Callable, Iterable, Optional
+
+from .analysis import (
+    get_cipai_key_index,
+    get_cipai_summary_list,
+    get_fillword_frameworks,
+    load_cipai_patterns,
+    load_tone_table,
+    load_yunjiao,
+)
+from .cache import LOADERS, LRUCache
+from .candidates import get_candidate_index
+from .datafiles import RHYMEBOOK_PATHS
+from .layout import build_text_layout
+from .search import get_cipai_search_index
+
+
+# 请求耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# 采集函数返回 (指标名, 类型, 说明, [(标签, 值)])
+Family = Tuple[str, str, str, List[Tuple[Labels, float]]]
+
+
+class _Shard:
+    """单个线程独占的计数分片；只有所属线程写入，导出时各分片相加。"""
+
+    __slots__ = ('counters', 'gauges', 'histograms')
+
+    def __init__(self) -> None:
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        # 每个直方图为 [各桶计数..., +Inf 桶计数, 总和]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isfinite(value) and value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按 Prometheus 文本格式导出。
+
+    写入路径无锁：每个线程写自己的分片（threading.local），只有线程首次写入时登记分片需要加锁；
+    导出时复制各分片的字典再求和，因此读到的是近似一致的快照。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def describe(self, name: str, metric_type: str, help_text: str) -> None:
+        self._meta[name] = (metric_type, help_text)
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0.0) + value
+
+    def add_gauge(self, name: str, labels: Labels = (), delta: float = 1.0) -> None:
+        gauges = self._shard().gauges
+        key = (name, labels)
+        gauges[key] = gauges.get(key, 0.0) + delta
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        histograms = self._shard().histograms
+        key = (name, labels)
+        hist = histograms.get(key)
+        if hist is None:
+            hist = histograms[key] = [0.0] * (len(self.buckets) + 2)
+        hist[bisect.bisect_left(self.buckets, value)] += 1
+        hist[-1] += value
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """登记导出时调用的采集函数，用于缓存命中率、索引大小等按需计算的指标。"""
+        self._collectors.append(collector)
+
+    def _merged(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[float]]]:
+        counters: Dict[Tuple[str, Labels], float] = {}
+        gauges: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0.0) + value
+            for key, value in shard.gauges.copy().items():
+                gauges[key] = gauges.get(key, 0.0) + value
+            for key, hist in shard.histograms.copy().items():
+                merged = histograms.setdefault(key, [0.0] * len(hist))
+                for i, value in enumerate(list(hist)):
+                    merged[i] += value
+        return counters, gauges, histograms
+
+    def render(self) -> str:
+        counters, gauges, histograms = self._merged()
+        families: Dict[str, List[str]] = {}
+
+        def lines_for(name: str) -> List[str]:
+            return families.setdefault(name, [])
+
+        for (name, labels), value in sorted(counters.items()):
+            lines_for(name).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), value in sorted(gauges.items()):
+            lines_for(name).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), hist in sorted(histograms.items()):
+            lines = lines_for(name)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, hist):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(bound)))} {_format_value(cumulative)}")
+            cumulative += hist[len(self.buckets)]
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {_format_value(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {repr(hist[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+
+        meta = dict(self._meta)
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                meta.setdefault(name, (metric_type, help_text))
+                lines = lines_for(name)
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        out: List[str] = []
+        for name in sorted(families):
+            if name in meta:
+                metric_type, help_text = meta[name]
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {metric_type}")
+            out.extend(families[name])
+        return '\n'.join(out) + '\n'
+
+
+# ----- HTTP 请求指标 -----
+
+REQUESTS_TOTAL = 'poetry_http_requests_total'
+REQUEST_ERRORS_TOTAL = 'poetry_http_request_exceptions_total'
+REQUEST_DURATION = 'poetry_http_request_duration_seconds'
+REQUESTS_IN_FLIGHT = 'poetry_http_requests_in_flight'
+
+
+def create_http_metrics() -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.describe(REQUESTS_TOTAL, 'counter', '按路由、方法与状态码统计的请求数')
+    registry.describe(REQUEST_ERRORS_TOTAL, 'counter', '抛出未处理异常的请求数')
+    registry.describe(REQUEST_DURATION, 'histogram', '按路由统计的请求耗时（秒）')
+    registry.describe(REQUESTS_IN_FLIGHT, 'gauge', '按路由统计的处理中请求数')
+    return registry
+
+
+def record_request_start(registry: MetricsRegistry, route: str) -> None:
+    registry.add_gauge(REQUESTS_IN_FLIGHT, (('route', route),), 1.0)
+
+
+def record_request_end(registry: MetricsRegistry, route: str, method: str, status: int, seconds: Optional[float]) -> None:
+    registry.inc(REQUESTS_TOTAL, (('route', route), ('method', method), ('status', str(status))))
+    if seconds is not None:
+        registry.observe(REQUEST_DURATION, (('route', route),), seconds)
+
+
+def record_request_teardown(registry: MetricsRegistry, route: str, failed: bool) -> None:
+    registry.add_gauge(REQUESTS_IN_FLIGHT, (('route', route),), -1.0)
+    if failed:
+        registry.inc(REQUEST_ERRORS_TOTAL, (('route', route),))
+
+
+# ----- 按需采集的缓存与索引指标 -----
+
+def loader_cache_families() -> List[Family]:
+    """各加载函数缓存（single_flight_cache 与 build_text_layout 的 lru_cache）的 cache_info。"""
+    infos: Dict[str, Dict[str, float]] = {}
+    for name, loader in sorted(LOADERS.items()):
+        info = loader.cache_info()
+        infos[name] = {"hits": info.hits, "misses": info.misses, "waits": info.waits, "currsize": info.currsize}
+    layout_info = build_text_layout.cache_info()
+    infos['build_text_layout'] = {"hits": layout_info.hits, "misses": layout_info.misses,
+                                  "waits": 0, "currsize": layout_info.currsize}
+
+    def family(key: str, name: str, metric_type: str, help_text: str) -> Family:
+        return (name, metric_type, help_text,
+                [((('loader', name),), values[key]) for name, values in infos.items()])
+
+    ratios = []
+    for name, values in infos.items():
+        lookups = values["hits"] + values["misses"]
+        ratios.append(((('loader', name),), values["hits"] / lookups if lookups else 0.0))
+    return [
+        family('hits', 'poetry_loader_cache_hits_total', 'counter', '加载函数缓存命中次数'),
+        family('misses', 'poetry_loader_cache_misses_total', 'counter', '加载函数缓存未命中（实际加载）次数'),
+        family('waits', 'poetry_loader_cache_waits_total', 'counter', '等待同一次进行中加载的调用次数'),
+        family('currsize', 'poetry_loader_cache_entries', 'gauge', '加载函数缓存中的条目数'),
+        ('poetry_loader_cache_hit_ratio', 'gauge', '加载函数缓存命中率', ratios),
+    ]
+
+
+def result_cache_families(cache: LRUCache, name: str) -> List[Family]:
+    stats = cache.stats()
+    labels: Labels = (('cache', name),)
+    return [
+        ('poetry_result_cache_hits_total', 'counter', '结果缓存命中次数', [(labels, stats["hits"])]),
+        ('poetry_result_cache_misses_total', 'counter', '结果缓存未命中次数', [(labels, stats["misses"])]),
+        ('poetry_result_cache_evictions_total', 'counter', '结果缓存淘汰次数', [(labels, stats["evictions"])]),
+        ('poetry_result_cache_entries', 'gauge', '结果缓存条目数', [(labels, stats["entries"])]),
+        ('poetry_result_cache_bytes', 'gauge', '结果缓存占用字节数', [(labels, stats["bytes"])]),
+        ('poetry_result_cache_hit_ratio', 'gauge', '结果缓存命中率', [(labels, stats["hit_ratio"])]),
+    ]
+
+
+def data_registry_families(registry: Any) -> List[Family]:
+    status = registry.status()
+    return [
+        ('poetry_data_generation', 'gauge', '当前数据版本号，每次重载加一', [((), status["generation"])]),
+        ('poetry_data_reloads_total', 'counter', '数据文件变化后成功重载的次数', [((), status["reloads"])]),
+        ('poetry_data_reload_failures_total', 'counter', '数据重载失败（保留原数据）的次数', [((), status["failures"])]),
+    ]
+
+
+def index_size_families() -> List[Family]:
+    """已加载的派生索引的大小；尚未加载的索引不报告，导出指标不会触发加载。"""
+    sizes: List[Tuple[Labels, float]] = []
+    store = load_cipai_patterns.cache_peek()
+    if store is not None:
+        sizes.append(((('index', 'cipai_patterns'),), len(store)))
+        sizes.append(((('index', 'shape_index'),), len(store.shape_index)))
+        if store.built_shape_tree is not None:
+            sizes.append(((('index', 'split_index'),), len(store.split_index)))
+            sizes.append(((('index', 'shape_tree'),), len(store.built_shape_tree)))
+    for key in RHYMEBOOK_PATHS:
+        table = load_tone_table.cache_peek(key)
+        if table is not None:
+            sizes.append(((('index', f'rhymebook_{key}_chars'),), len(table)))
+        candidates = get_candidate_index.cache_peek(key)
+        if candidates is not None:
+            sizes.append(((('index', f'candidate_tables_{key}'),), len(candidates.chars) + len(candidates.phrases)))
+    yunjiao = load_yunjiao.cache_peek()
+    if yunjiao is not None:
+        sizes.append(((('index', 'yunjiao'),), len(yunjiao)))
+    summary = get_cipai_summary_list.cache_peek()
+    if summary is not None:
+        sizes.append(((('index', 'cipai_summary'),), len(summary[0])))
+    key_index = get_cipai_key_index.cache_peek()
+    if key_index is not None:
+        sizes.append(((('index', 'cipai_unique_keys'),), len(key_index[0])))
+    frameworks = get_fillword_frameworks.cache_peek()
+    if frameworks is not None:
+        sizes.append(((('index', 'fillword_frameworks'),), len(frameworks)))
+    search_index = get_cipai_search_index.cache_peek()
+    if search_index is not None:
+        sizes.append(((('index', 'cipai_search_keys'),), len(search_index)))
+
+    families: List[Family] = [('poetry_index_entries', 'gauge', '内存中各派生索引的条目数', sizes)]
+    if store is not None:
+        families.append(('poetry_cipai_patterns_bytes', 'gauge', '编译后词牌谱数组占用的字节数',
+                         [((), store.nbytes)]))
+    return families
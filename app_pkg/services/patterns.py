@@ -0,0 +1,431 @@
+import ast
+import bisect
+import re
+import threading
+import zlib
+from typing import TYPE_CHECKING, Tuple, List, Dict, Any, Optional, Sequence, Iterable
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .records import CipaiRow
+
+
+# 声调编码：词牌韵律只含 平/仄/中，文本标注额外可能出现 未知
+TONE_PING = 0
+TONE_ZE = 1
+TONE_ZHONG = 2
+TONE_UNKNOWN = 3
+TONE_NAMES = ('平', '仄', '中', '未知')
+TONE_CODES = {name: code for code, name in enumerate(TONE_NAMES)}
+
+_SHAPE_TREE_LOCK = threading.Lock()
+
+
+def parse_split_length(value: Any) -> Tuple[int, ...]:
+    """将词牌谱中的 分段字数（如 "[7, 7]"）解析为整数元组，解析失败时返回空元组。"""
+    if isinstance(value, (list, tuple)):
+        return tuple(int(n) for n in value)
+    try:
+        parsed = ast.literal_eval(str(value))
+    except Exception:
+        return ()
+    if not isinstance(parsed, (list, tuple)):
+        return ()
+    try:
+        return tuple(int(n) for n in parsed)
+    except (TypeError, ValueError):
+        return ()
+
+
+def encode_tone_pattern(rhythm: str) -> np.ndarray:
+    """清洗韵律字符串（去掉非汉字与"增韵"），编码为 uint8 声调数组。"""
+    cleaned = re.sub(r"增韵", "", re.sub("[^一-龥]", "", str(rhythm)))
+    return np.fromiter(
+        (TONE_CODES.get(ch, TONE_UNKNOWN) for ch in cleaned),
+        dtype=np.uint8,
+        count=len(cleaned),
+    )
+
+
+def decode_tones(codes: Sequence[int]) -> List[str]:
+    return [TONE_NAMES[code] for code in codes]
+
+
+def _position_masks(seq: Sequence[int]) -> Dict[int, int]:
+    masks: Dict[int, int] = {}
+    for i, value in enumerate(seq):
+        masks[value] = masks.get(value, 0) | (1 << i)
+    return masks
+
+
+def sequence_distance(a: Sequence[int], b: Sequence[int], masks: Optional[Dict[int, int]] = None) -> int:
+    """两个整数序列的编辑距离（Myers 位并行算法，a 的每个位置对应一位）。
+
+    同一个 a 与多个 b 比较时可传入预先计算的 masks = _position_masks(a)。
+    """
+    m = len(a)
+    if m == 0:
+        return len(b)
+    if masks is None:
+        masks = _position_masks(a)
+    full = (1 << m) - 1
+    high_bit = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for value in b:
+        eq = masks.get(value, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & high_bit:
+            score += 1
+        elif mh & high_bit:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+class ShapeBKTree:
+    """分段字数序列的 BK 树，按编辑距离检索近似分段。"""
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self, shapes: Iterable[Tuple[int, ...]]) -> None:
+        # 节点为 [shape, {distance: child}]
+        self._root: Optional[list] = None
+        self._size = 0
+        for shape in shapes:
+            self.add(shape)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, shape: Tuple[int, ...]) -> None:
+        if self._root is None:
+            self._root = [shape, {}]
+            self._size = 1
+            return
+        masks = _position_masks(shape)
+        node = self._root
+        while True:
+            distance = sequence_distance(shape, node[0], masks)
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [shape, {}]
+                self._size += 1
+                return
+            node = child
+
+    def search(self, query: Sequence[int], radius: int) -> List[Tuple[int, Tuple[int, ...]]]:
+        """返回与 query 编辑距离不超过 radius 的所有 (distance, shape)。"""
+        if self._root is None:
+            return []
+        query = tuple(query)
+        masks = _position_masks(query)
+        found: List[Tuple[int, Tuple[int, ...]]] = []
+        stack = [self._root]
+        while stack:
+            shape, children = stack.pop()
+            distance = sequence_distance(query, shape, masks)
+            if distance <= radius:
+                found.append((distance, shape))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def shape_digest(length: int, split_length: Sequence[int]) -> int:
+    """(总字数, 分段字数) 的 32 位摘要（CRC32），跨进程、跨 Python 版本稳定，可写入快照。
+
+    分段字数逐个按单字节编码；词牌的分句都不超过 255 字，含更长分句的形状返回 -1，不会命中任何摘要。
+    """
+    try:
+        return zlib.crc32(bytes(split_length), length)
+    except ValueError:
+        return -1
+
+
+class ShapeIndex:
+    """(总字数, 分段字数) -> 行号 的只读索引，全部存放在数组中，可直接映射自数据快照。
+
+    每种形状按摘要排序存入 keys，rows[offsets[j]:offsets[j + 1]] 为第 j 种形状的行号。
+    查询时二分定位摘要，再核对该组第一行的实际形状，排除摘要碰撞。
+    """
+
+    __slots__ = ('keys', 'offsets', 'rows', '_key_view', '_offset_view', '_row_view')
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> None:
+        self.keys = keys
+        self.offsets = offsets
+        self.rows = rows
+        self._key_view = memoryview(keys)
+        self._offset_view = memoryview(offsets)
+        self._row_view = memoryview(rows)
+
+    @classmethod
+    def build(cls, groups: Dict[Tuple[int, Tuple[int, ...]], List[int]]) -> 'ShapeIndex':
+        ordered = sorted((shape_digest(length, split), rows) for (length, split), rows in groups.items())
+        keys = np.fromiter((key for key, _ in ordered), dtype=np.uint32, count=len(ordered))
+        offsets = np.zeros(len(ordered) + 1, dtype=np.int32)
+        offsets[1:] = np.cumsum([len(rows) for _, rows in ordered])
+        rows = np.fromiter((row for _, group in ordered for row in group), dtype=np.int32, count=int(offsets[-1]))
+        return cls(keys, offsets, rows)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.offsets.nbytes + self.rows.nbytes
+
+    def groups(self, length: int, split_length: Sequence[int]) -> List[List[int]]:
+        """摘要相同的各组行号（通常至多一组）。"""
+        key = shape_digest(length, split_length)
+        keys = self._key_view
+        start = bisect.bisect_left(keys, key)
+        end = start
+        while end < len(keys) and keys[end] == key:
+            end += 1
+        offsets = self._offset_view
+        return [self._row_view[offsets[j]:offsets[j + 1]].tolist() for j in range(start, end)]
+
+
+class CipaiPatternStore:
+    """预编译的词牌谱：所有韵律清洗后拼接为一个 uint8 数组，按偏移量切片访问。
+
+    第 i 条词牌的声调为 tone_codes[tone_offsets[i]:tone_offsets[i + 1]]，
+    分段字数同理存放在 split_values / split_offsets 中。
+    """
+
+    __slots__ = (
+        'names', 'authors', 'totals', 'zhong', 'ping', 'ze',
+        'tone_codes', 'tone_offsets', 'split_values', 'split_offsets',
+        'shape_index', '_split_index', '_shape_tree',
+    )
+
+    def __init__(
+        self,
+        names: List[str],
+        authors: List[str],
+        totals: np.ndarray,
+        zhong: np.ndarray,
+        ping: np.ndarray,
+        ze: np.ndarray,
+        tone_codes: np.ndarray,
+        tone_offsets: np.ndarray,
+        split_values: np.ndarray,
+        split_offsets: np.ndarray,
+        shape_index: Optional[ShapeIndex] = None,
+    ) -> None:
+        self.names = names
+        self.authors = authors
+        self.totals = totals
+        self.zhong = zhong
+        self.ping = ping
+        self.ze = ze
+        self.tone_codes = tone_codes
+        self.tone_offsets = tone_offsets
+        self.split_values = split_values
+        self.split_offsets = split_offsets
+        self.shape_index = shape_index if shape_index is not None else ShapeIndex.build(self._shape_groups())
+        self._split_index: Optional[Dict[Tuple[int, ...], List[int]]] = None
+        self._shape_tree: Optional[ShapeBKTree] = None
+
+    @classmethod
+    def from_rows(cls, rows: Sequence['CipaiRow']) -> 'CipaiPatternStore':
+        """由词牌谱记录（records.CipaiRow）编译。"""
+        count = len(rows)
+        names: List[str] = []
+        authors: List[str] = []
+        totals = np.zeros(count, dtype=np.int32)
+        zhong = np.zeros(count, dtype=np.int32)
+        ping = np.zeros(count, dtype=np.int32)
+        ze = np.zeros(count, dtype=np.int32)
+        tone_parts: List[np.ndarray] = []
+        tone_offsets = np.zeros(count + 1, dtype=np.int64)
+        split_parts: List[Tuple[int, ...]] = []
+        split_offsets = np.zeros(count + 1, dtype=np.int64)
+
+        for i, row in enumerate(rows):
+            names.append(row.cipai_name)
+            authors.append(row.author)
+            totals[i] = row.total
+            zhong[i] = row.zhong
+            ping[i] = row.ping
+            ze[i] = row.ze
+            codes = encode_tone_pattern(row.rhythm)
+            tone_parts.append(codes)
+            tone_offsets[i + 1] = tone_offsets[i] + len(codes)
+            split = row.split_length
+            split_parts.append(split)
+            split_offsets[i + 1] = split_offsets[i] + len(split)
+
+        tone_codes = np.concatenate(tone_parts) if tone_parts else np.zeros(0, dtype=np.uint8)
+        split_values = np.fromiter(
+            (n for split in split_parts for n in split),
+            dtype=np.int16,
+            count=int(split_offsets[-1]),
+        )
+        return cls(names, authors, totals, zhong, ping, ze,
+                   tone_codes, tone_offsets, split_values, split_offsets)
+
+    def _shape_groups(self) -> Dict[Tuple[int, Tuple[int, ...]], List[int]]:
+        shape_index: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        # 先转为 Python 列表再逐行切片，避免逐元素访问 numpy 标量
+        totals = self.totals.tolist()
+        offsets = self.split_offsets.tolist()
+        values = self.split_values.tolist()
+        for i in range(len(self)):
+            key = (totals[i], tuple(values[offsets[i]:offsets[i + 1]]))
+            shape_index.setdefault(key, []).append(i)
+        return shape_index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.totals, self.zhong, self.ping, self.ze, self.tone_codes,
+                  self.tone_offsets, self.split_values, self.split_offsets)
+        return sum(arr.nbytes for arr in arrays) + self.shape_index.nbytes
+
+    def tones(self, i: int) -> np.ndarray:
+        return self.tone_codes[self.tone_offsets[i]:self.tone_offsets[i + 1]]
+
+    def tone_list(self, i: int) -> List[str]:
+        return decode_tones(self.tones(i))
+
+    def rhythm(self, i: int) -> str:
+        return ''.join(self.tone_list(i))
+
+    def split_length(self, i: int) -> Tuple[int, ...]:
+        return tuple(int(n) for n in self.split_values[self.split_offsets[i]:self.split_offsets[i + 1]])
+
+    def find(self, length: int, split_length: Sequence[int]) -> List[int]:
+        split = list(split_length)
+        for rows in self.shape_index.groups(length, split):
+            row = rows[0]
+            if (self.totals[row] == length
+                    and self.split_values[self.split_offsets[row]:self.split_offsets[row + 1]].tolist() == split):
+                return rows
+        return []
+
+    @property
+    def split_index(self) -> Dict[Tuple[int, ...], List[int]]:
+        """分段字数 -> 行号，供近似匹配按分段检索；首次访问时构建。"""
+        if self._split_index is None:
+            with _SHAPE_TREE_LOCK:
+                if self._split_index is None:
+                    split_index: Dict[Tuple[int, ...], List[int]] = {}
+                    for (_, split), rows in self._shape_groups().items():
+                        split_index.setdefault(split, []).extend(rows)
+                    self._split_index = split_index
+        return self._split_index
+
+    @property
+    def shape_tree(self) -> ShapeBKTree:
+        """按需构建的分段 BK 树（首次访问时构建，约百毫秒；并发访问只构建一次）。"""
+        if self._shape_tree is None:
+            split_index = self.split_index
+            with _SHAPE_TREE_LOCK:
+                if self._shape_tree is None:
+                    self._shape_tree = ShapeBKTree(split_index.keys())
+        return self._shape_tree
+
+    @property
+    def built_shape_tree(self) -> Optional[ShapeBKTree]:
+        """已构建的 BK 树，尚未构建时为 None（不触发构建）。"""
+        return self._shape_tree
+
+    def nearest(self, length: int, split_length: Sequence[int], k: int = 5, max_distance: int = 2,
+                max_total_diff: int = 4) -> List[Tuple[int, int]]:
+        """精确匹配失败时的近似匹配，返回最多 k 个 (row, distance)。
+
+        distance 为分段字数序列的编辑距离；总字数与 length 相差超过 max_total_diff 的候选直接舍弃，
+        其余按 (distance + 总字数差, distance, 行号) 排序。半径从 0 逐步扩大到 max_distance，凑够 k 条即停止。
+        """
+        split_length = tuple(split_length)
+        candidates: List[Tuple[int, int, int]] = []
+        seen_shapes = set()
+        for radius in range(max_distance + 1):
+            for distance, shape in self.shape_tree.search(split_length, radius):
+                if shape in seen_shapes:
+                    continue
+                seen_shapes.add(shape)
+                for row in self.split_index[shape]:
+                    total_diff = abs(int(self.totals[row]) - length)
+                    if total_diff <= max_total_diff:
+                        candidates.append((distance + total_diff, distance, row))
+            if len(candidates) >= k:
+                break
+        candidates.sort()
+        return [(row, distance) for _, distance, row in candidates[:k]]
+
+    def find_row(self, cipai_name: str, author: str, row_index: Optional[int] = None) -> Optional[int]:
+        """给出行号时校验其词牌名/作者后返回；未给出行号时返回同名同作者的第一条。"""
+        if row_index is not None:
+            if (isinstance(row_index, int) and 0 <= row_index < len(self)
+                    and self.names[row_index] == cipai_name and self.authors[row_index] == author):
+                return row_index
+            return None
+        for i, (name, row_author) in enumerate(zip(self.names, self.authors)):
+            if name == cipai_name and row_author == author:
+                return i
+        return None
+
+    def record(self, i: int) -> Dict[str, Any]:
+        return {
+            'cipai_name': self.names[i],
+            'author': self.authors[i],
+            'rhythm': self.rhythm(i),
+            'total_chars': int(self.totals[i]),
+            'split_length': str(list(self.split_length(i))),
+            'zhong': int(self.zhong[i]),
+            'ping': int(self.ping[i]),
+            'ze': int(self.ze[i]),
+            'row_index': i,
+        }
+
+
+def encode_tone_text(tone_text: Sequence[Tuple[str, str]]) -> np.ndarray:
+    """将 mark_tone 的结果编码为 uint8 声调数组，未收录的字编码为 TONE_UNKNOWN。"""
+    return np.fromiter(
+        (TONE_CODES.get(tone, TONE_UNKNOWN) for _, tone in tone_text),
+        dtype=np.uint8,
+        count=len(tone_text),
+    )
+
+
+def score_candidates(text_codes: np.ndarray, store: CipaiPatternStore, rows: Sequence[int]) -> List[Dict[str, Any]]:
+    """一次矩阵运算为文本与所有等长候选词牌打分，按得分从高到低返回。
+
+    每项为 {"row_index", "score", "issue_positions"}；长度与文本不一致的候选会被跳过。
+    得分规则与 get_score_tone 一致：韵律为 中 或声调相同即计分。
+    """
+    length = len(text_codes)
+    rows = [row for row in rows if store.tone_offsets[row + 1] - store.tone_offsets[row] == length]
+    if not rows or length == 0:
+        return []
+
+    row_ids = np.asarray(rows, dtype=np.int64)
+    # (候选数, 字数) 的韵律矩阵，由偏移量一次性从拼接数组中取出
+    index = store.tone_offsets[row_ids][:, None] + np.arange(length, dtype=np.int64)
+    patterns = store.tone_codes[index]
+    issues = (patterns != TONE_ZHONG) & (patterns != text_codes[None, :])
+    scores = (length - issues.sum(axis=1)) / length * 100
+
+    ranked: List[Dict[str, Any]] = []
+    for k in np.argsort(-scores, kind='stable'):
+        ranked.append({
+            'row_index': int(row_ids[k]),
+            'score': round(float(scores[k]), 2),
+            'issue_positions': np.flatnonzero(issues[k]).tolist(),
+        })
+    return ranked
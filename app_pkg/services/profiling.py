@@ -0,0 +1,110 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+
+PROFILE_SUFFIX = '.prof'
+META_SUFFIX = '.json'
+# 采集文件名：时间戳-路由-进程号-序号，只允许这些字符，防止路径穿越
+_NAME_PATTERN = re.compile(r'^[0-9A-Za-z_.-]+$')
+
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    """开始剖析当前线程；已有其他剖析器在运行时（Python 3.12+ 全局唯一）返回 None。"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def _slug(path: str) -> str:
+    return re.sub(r'[^0-9A-Za-z]+', '_', path).strip('_')[:40] or 'root'
+
+
+class ProfileStore:
+    """保存剖析结果的目录，最多保留 max_files 份采集，超出时删除最旧的。
+
+    每份采集为一个 pstats 格式的 .prof 文件，加一个同名 .json 记录请求信息。目录在首次保存时创建。
+    """
+
+    def __init__(self, directory: str, max_files: int = 50) -> None:
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def save(self, profiler: cProfile.Profile, meta: Dict[str, Any]) -> str:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{_slug(meta.get('path', ''))}-{os.getpid()}-{seq}"
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, name)
+        profiler.dump_stats(base + PROFILE_SUFFIX)
+        with open(base + META_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, name=name, created=time.time()), f, ensure_ascii=False)
+        self._rotate()
+        return name
+
+    def _rotate(self) -> None:
+        with self._lock:
+            names = self._names()
+            for name in names[self.max_files:]:
+                for suffix in (PROFILE_SUFFIX, META_SUFFIX):
+                    try:
+                        os.remove(os.path.join(self.directory, name + suffix))
+                    except OSError:
+                        pass
+
+    def _names(self) -> List[str]:
+        """按修改时间从新到旧排列的采集名。"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(PROFILE_SUFFIX):
+                        entries.append((entry.stat().st_mtime_ns, entry.name[:-len(PROFILE_SUFFIX)]))
+        except OSError:
+            return []
+        entries.sort(reverse=True)
+        return [name for _, name in entries]
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        captures = []
+        for name in self._names()[:limit]:
+            meta: Dict[str, Any] = {"name": name}
+            try:
+                with open(os.path.join(self.directory, name + META_SUFFIX), 'r', encoding='utf-8') as f:
+                    meta.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+            try:
+                meta["size"] = os.path.getsize(os.path.join(self.directory, name + PROFILE_SUFFIX))
+            except OSError:
+                continue
+            captures.append(meta)
+        return captures
+
+    def path_for(self, name: str) -> Optional[str]:
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name + PROFILE_SUFFIX)
+        return path if os.path.isfile(path) else None
+
+    def summary(self, name: str, sort: str = 'cumulative', limit: int = 40) -> Optional[str]:
+        """pstats 的文本摘要，按 sort 排序取前 limit 行。"""
+        path = self.path_for(name)
+        if path is None:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
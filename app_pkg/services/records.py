@@ -0,0 +1,105 @@
+import csv
+import os
+from typing import Tuple, List, Dict, Iterator, NamedTuple
+
+from .patterns import parse_split_length
+
+
+class CipaiRow(NamedTuple):
+    """词牌谱的一行（cipai_with_statistics_*.csv）。"""
+    cipai_name: str
+    author: str
+    rhythm: str
+    zhong: int
+    ping: int
+    ze: int
+    total: int
+    split_length: Tuple[int, ...]
+
+
+class YunjiaoRow(NamedTuple):
+    """韵脚表的一行；positions 为未解析的 JSON 字符串。"""
+    cipai_name: str
+    author: str
+    positions: str
+
+
+class CipaiIntroRow(NamedTuple):
+    cipai_name: str
+    intro: str
+
+
+class CipaiAliasRow(NamedTuple):
+    """别名表（cipai_alias.csv）的一行；别名以顿号分隔。"""
+    cipai_name: str
+    aliases: Tuple[str, ...]
+
+
+class WordFrequencyRow(NamedTuple):
+    """词频表（词频分析.csv）的一行。"""
+    phrase: str
+    part_of_speech: str
+    frequency: int
+
+
+def iter_csv_rows(path: str) -> Iterator[Dict[str, str]]:
+    """逐行读取带表头的 UTF-8 CSV（兼容 BOM），缺失的字段为空字符串。"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"数据文件未找到: {path}")
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f, restval=''):
+            yield row
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        # 兼容 "14.0" 这类由表格软件导出的数值
+        return int(float(value))
+
+
+def read_cipai_rows(path: str) -> List[CipaiRow]:
+    return [
+        CipaiRow(
+            cipai_name=row['词牌名'].strip(),
+            author=row['作者'].strip(),
+            rhythm=row['韵律'],
+            zhong=_to_int(row['中']),
+            ping=_to_int(row['平']),
+            ze=_to_int(row['仄']),
+            total=_to_int(row['总数']),
+            split_length=parse_split_length(row['分段字数']),
+        )
+        for row in iter_csv_rows(path)
+    ]
+
+
+def read_yunjiao_rows(path: str) -> List[YunjiaoRow]:
+    return [
+        YunjiaoRow(row['词牌名'].strip(), row['作者'].strip(), row['韵脚'].strip())
+        for row in iter_csv_rows(path)
+    ]
+
+
+def read_cipai_intro_rows(path: str) -> List[CipaiIntroRow]:
+    return [
+        CipaiIntroRow(row['词牌名'].strip(), row['介绍'].strip())
+        for row in iter_csv_rows(path)
+    ]
+
+
+def read_cipai_alias_rows(path: str) -> List[CipaiAliasRow]:
+    return [
+        CipaiAliasRow(row['词牌名'].strip(), tuple(a.strip() for a in row['别名'].split('、') if a.strip()))
+        for row in iter_csv_rows(path)
+        if row['词牌名'].strip()
+    ]
+
+
+def read_word_frequency_rows(path: str) -> List[WordFrequencyRow]:
+    return [
+        WordFrequencyRow(row['词组'].strip(), row['词性'].strip(), _to_int(row['词频'] or '0'))
+        for row in iter_csv_rows(path)
+        if row['词组'].strip()
+    ]
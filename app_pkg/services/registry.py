@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Tuple, List, Dict, Any, Callable, Iterable, Iterator, Optional, Sequence, Set
+
+from .cache import LOADERS, DataGeneration, latest_generation, pin_generation, publish_generation, unpin_generation
+from .datafiles import (
+    CIPAI_ALIAS_PATH,
+    CIPAI_INTRO_PATH,
+    CIPAI_PATH,
+    RHYMEBOOK_PATHS,
+    SNAPSHOT_PATH,
+    WORD_FREQUENCY_PATH,
+    YUNJIAO_PATH,
+    file_signature,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# 数据文件 -> 直接读取它的加载函数（按 __qualname__）
+FILE_LOADERS: Dict[str, Tuple[str, ...]] = {
+    CIPAI_PATH: ('load_cipai', 'load_cipai_patterns'),
+    CIPAI_INTRO_PATH: ('load_cipai_intro',),
+    CIPAI_ALIAS_PATH: ('load_cipai_aliases',),
+    YUNJIAO_PATH: ('load_yunjiao',),
+    WORD_FREQUENCY_PATH: ('load_word_frequency',),
+    **{path: ('load_tone_table',) for path in RHYMEBOOK_PATHS.values()},
+}
+if SNAPSHOT_PATH:
+    FILE_LOADERS[SNAPSHOT_PATH] = ('load_data_snapshot',)
+
+# 加载函数 -> 由它派生、需要随之重建的索引
+DEPENDENTS: Dict[str, Tuple[str, ...]] = {
+    'load_cipai_patterns': ('get_cipai_summary_list', 'get_fillword_frameworks'),
+    'get_cipai_summary_list': ('get_cipai_key_index', 'get_cipai_search_index', '_cipai_list_payload'),
+    'load_cipai_intro': ('get_cipai_search_index',),
+    'load_cipai_aliases': ('get_cipai_search_index',),
+    'load_tone_table': ('load_rhymebook_with_yunbu', 'get_candidate_index'),
+    'load_word_frequency': ('get_candidate_index',),
+}
+
+Signature = Dict[str, Tuple[Optional[int], Optional[int]]]
+
+
+def affected_loaders(changed: Iterable[str]) -> List[str]:
+    """changed 中的数据文件变化后需要重建的加载函数，依赖在前。
+
+    任一源文件变化都会使数据快照过期，因此 load_data_snapshot 总在其中。
+    """
+    roots: List[str] = ['load_data_snapshot']
+    for path in changed:
+        roots.extend(FILE_LOADERS.get(path, ()))
+    # 沿 DEPENDENTS 做后序遍历，反转后即为依赖在前的拓扑顺序
+    ordered: List[str] = []
+    seen: Set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in seen:
+            return
+        seen.add(name)
+        for dependent in DEPENDENTS.get(name, ()):
+            visit(dependent)
+        ordered.append(name)
+
+    for name in reversed(roots):
+        visit(name)
+    ordered.reverse()
+    return ordered
+
+
+class DataRegistry:
+    """监视数据文件的 mtime，变化后在后台重建受影响的加载函数与索引，再整体换入。
+
+    重建在 fork 出的新 DataGeneration 中进行，完成前请求仍读取旧版本；请求开始时固定所见版本，
+    换入不会让进行中的请求读到新旧混合的数据。文件须在连续两次检查中保持不变才会重建，
+    以免读到写了一半的文件；重建失败时保留旧数据，直到文件再次变化。
+    """
+
+    def __init__(self, paths: Sequence[str] = tuple(FILE_LOADERS), interval: float = 2.0) -> None:
+        self.paths = tuple(paths)
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self._signature = self._scan()
+        self._pending: Optional[Signature] = None
+        self._failed: Optional[Signature] = None
+        self._listeners: List[Callable[[DataGeneration], None]] = []
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _scan(self) -> Signature:
+        return {path: file_signature(path)[1:] for path in self.paths}
+
+    def add_listener(self, listener: Callable[[DataGeneration], None]) -> None:
+        """登记新版本换入后调用的函数，用于清空结果缓存等不在加载函数中的派生数据。"""
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._run, name='data-registry', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """期间不进行重载；fork 前持有，保证子进程不会复制到重建了一半的数据和被占用的锁。"""
+        with self._reload_lock:
+            yield
+
+    def detach_after_fork(self) -> None:
+        """在 fork 出的子进程中调用：监视线程不随 fork 复制，子进程也不再自行监视，由父进程重载后替换子进程。"""
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("检查数据文件失败")
+
+    def poll(self) -> bool:
+        """检查一次数据文件；有变化且已稳定时重建并换入，返回是否换入了新版本。"""
+        with self._reload_lock:
+            return self._poll()
+
+    def _poll(self) -> bool:
+        signature = self._scan()
+        if signature == self._signature or signature == self._failed:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            # 首次看到变化，等下一次检查确认文件已写完
+            self._pending = signature
+            return False
+        self._pending = None
+        changed = [path for path in self.paths if signature[path] != self._signature[path]]
+        if self.reload(changed):
+            self._signature = signature
+            self._failed = None
+            return True
+        self._failed = signature
+        return False
+
+    def reload(self, changed: Sequence[str]) -> bool:
+        names = affected_loaders(changed)
+        current = latest_generation()
+        staged = current.fork(names)
+        start = time.perf_counter()
+        previous = pin_generation(staged)
+        try:
+            for name in names:
+                loader = LOADERS.get(name)
+                if loader is None:
+                    continue
+                # 只重建旧版本中已加载过的参数，其余留待首次使用时加载
+                for key in current.results.get(name, {}):
+                    if isinstance(key, tuple):
+                        loader(*key)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.exception("数据重载失败，继续使用原有数据。变化的文件: %s", ', '.join(changed))
+            return False
+        finally:
+            unpin_generation(previous)
+
+        publish_generation(staged)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.reloads += 1
+        self.last_error = None
+        self.last_reload = {"at": time.time(), "files": list(changed), "loaders": names,
+                            "elapsed_ms": elapsed_ms, "generation": staged.number}
+        logger.info("数据已重载（%s），重建 %d 个加载函数，用时 %.0fms",
+                    ', '.join(changed), len(names), elapsed_ms)
+        for listener in self._listeners:
+            try:
+                listener(staged)
+            except Exception:
+                logger.exception("数据重载后的回调失败")
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "generation": latest_generation().number,
+            "watching": self._thread is not None,
+            "interval": self.interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_reload": self.last_reload,
+            "last_error": self.last_error,
+        }
+
+
+_registry: Optional[DataRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def start_data_registry(interval: float) -> DataRegistry:
+    """同一进程只启动一个 DataRegistry；interval 不大于 0 时只创建、不监视。"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DataRegistry(interval=interval)
+            _registry.start()
+        return _registry
@@ -0,0 +1,208 @@
+import bisect
+import itertools
+import re
+from functools import lru_cache
+from typing import Tuple, List, Dict, Any, Optional
+
+from .analysis import get_cipai_summary_list, load_cipai_intro
+from .cache import single_flight_cache
+from .datafiles import CIPAI_ALIAS_PATH
+from .records import read_cipai_alias_rows
+
+
+# 匹配类型及其排序优先级（越小越靠前）
+MATCH_NAME = 'name'
+MATCH_ALIAS = 'alias'
+MATCH_AUTHOR = 'author'
+MATCH_PINYIN = 'pinyin'
+MATCH_INFIX = 'infix'
+_MATCH_RANK = {MATCH_NAME: 0, MATCH_ALIAS: 1, MATCH_AUTHOR: 2, MATCH_PINYIN: 3, MATCH_INFIX: 4}
+
+# GB2312 一级汉字按拼音排序，各声母首字的区位码
+_GB2312_INITIALS = (
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'),
+    (0xB7A2, 'f'), (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'),
+    (0xC0AC, 'l'), (0xC2E8, 'm'), (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'),
+    (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'), (0xCBFA, 't'), (0xCDDA, 'w'),
+    (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'),
+)
+_GB2312_CODES = [code for code, _ in _GB2312_INITIALS]
+_GB2312_LEVEL1_END = 0xD7F9
+
+# 多音字的全拼读法组合数上限，超出的组合不再收录
+_MAX_SPELLINGS = 16
+# 检索词中忽略的分隔符，如 "shui diao"、"xi'an"
+_QUERY_SEPARATORS = re.compile(r"[\s']+")
+
+_ALIAS_KEYWORDS = re.compile(r'(?:又名|别名|亦名|又称|亦称)([^。；]*)')
+_QUOTED = re.compile(r'''(?:^|[“"'《])([一-龥]{1,8})[”"'》]''')
+
+
+def _gb2312_initial(char: str) -> Optional[str]:
+    try:
+        encoded = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return None
+    if len(encoded) != 2:
+        return None
+    code = (encoded[0] << 8) | encoded[1]
+    if code < _GB2312_CODES[0] or code > _GB2312_LEVEL1_END:
+        return None
+    return _GB2312_INITIALS[bisect.bisect_right(_GB2312_CODES, code) - 1][1]
+
+
+@lru_cache(maxsize=1)
+def _pypinyin() -> Optional[Tuple[Any, Any]]:
+    """按需导入 pypinyin（导入约 0.2 秒并常驻较大的字典），只在构建索引时才需要。"""
+    try:
+        from pypinyin import lazy_pinyin, pinyin, Style
+    except ImportError:  # pypinyin 为可选依赖，缺失时退回 GB2312 一级汉字表
+        return None
+    return lazy_pinyin, pinyin, Style
+
+
+def pinyin_initials(text: str) -> Optional[str]:
+    """拼音首字母串，如 水调歌头 -> sdgt；无法确定任一字的首字母时返回 None。"""
+    pypinyin = _pypinyin()
+    if pypinyin is not None:
+        lazy_pinyin, _, Style = pypinyin
+        initials = lazy_pinyin(text, style=Style.FIRST_LETTER, errors=lambda _: None)
+        if len(initials) == len(text) and all(i and i.isalpha() for i in initials):
+            return ''.join(initials).lower()
+        return None
+    letters = [_gb2312_initial(char) for char in text]
+    if not letters or any(letter is None for letter in letters):
+        return None
+    return ''.join(letters)
+
+
+def pinyin_spellings(text: str) -> List[Tuple[str, ...]]:
+    """全拼音节的各种读法，如 长相思 -> (zhang, xiang, si)、(chang, xiang, si) 等。
+
+    逐字取多音字的全部读音再组合，最多 _MAX_SPELLINGS 种；未安装 pypinyin 或有字无法注音时返回空列表。
+    """
+    pypinyin = _pypinyin()
+    if pypinyin is None or not text:
+        return []
+    _, pinyin, Style = pypinyin
+    readings = []
+    for char in text:
+        options = [s for s in pinyin(char, style=Style.NORMAL, heteronym=True, errors=lambda _: [''])[0] if s.isalpha()]
+        if not options:
+            return []
+        readings.append(options)
+    return list(itertools.islice(itertools.product(*readings), _MAX_SPELLINGS))
+
+
+def parse_aliases(intro: str) -> List[str]:
+    """从词牌介绍中提取别名：取"又名/别名/又称"等之后到句号为止的片段。"""
+    aliases: List[str] = []
+    for segment in _ALIAS_KEYWORDS.findall(intro or ''):
+        if re.search(r'[“”"\'《》]', segment):
+            candidates = _QUOTED.findall(segment)
+        else:
+            # 无引号时别名以顿号分隔，到第一个逗号为止
+            candidates = re.split(r'[、]', segment.split('，')[0])
+        for alias in candidates:
+            alias = alias.strip()
+            if re.fullmatch(r'[一-龥]{2,8}', alias) and alias not in aliases:
+                aliases.append(alias)
+    return aliases
+
+
+class CipaiSearchIndex:
+    """词牌名、别名、作者、拼音（首字母与全拼，全拼也可从任一音节起检索）的有序前缀索引。
+
+    每个键对应一组记录（get_cipai_summary_list 中的下标），检索时对排序后的键
+    二分定位前缀区间，再按匹配类型、是否完全匹配、键长和列表顺序排序。
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], aliases: Dict[str, List[str]]) -> None:
+        self.records = records
+        groups_by_name: Dict[str, List[int]] = {}
+        groups_by_author: Dict[str, List[int]] = {}
+        for i, record in enumerate(records):
+            groups_by_name.setdefault(record['cipai_name'], []).append(i)
+            groups_by_author.setdefault(record['author'], []).append(i)
+
+        entries: List[Tuple[str, int, Tuple[int, ...]]] = []
+
+        def add(key: str, kind: str, group: List[int]) -> None:
+            if key:
+                entries.append((key.lower(), _MATCH_RANK[kind], tuple(group)))
+
+        def add_pinyin(text: str, group: List[int]) -> None:
+            add(pinyin_initials(text) or '', MATCH_PINYIN, group)
+            for syllables in pinyin_spellings(text):
+                add(''.join(syllables), MATCH_PINYIN, group)
+                add(''.join(s[0] for s in syllables), MATCH_PINYIN, group)
+                for start in range(1, len(syllables)):
+                    add(''.join(syllables[start:]), MATCH_INFIX, group)
+
+        for name, group in groups_by_name.items():
+            add(name, MATCH_NAME, group)
+            for start in range(1, len(name)):
+                add(name[start:], MATCH_INFIX, group)
+            add_pinyin(name, group)
+            for alias in aliases.get(name, []):
+                if alias != name:
+                    add(alias, MATCH_ALIAS, group)
+                    add_pinyin(alias, group)
+        for author, group in groups_by_author.items():
+            add(author, MATCH_AUTHOR, group)
+
+        # 多音字的不同读法可能得到相同的键
+        entries = sorted(set(entries))
+        self._keys = [key for key, _, _ in entries]
+        self._entries = entries
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        query = _QUERY_SEPARATORS.sub('', query or '').lower()
+        if not query or limit <= 0:
+            return []
+        best: Dict[int, Tuple[int, int, int, int]] = {}
+        kinds: Dict[int, int] = {}
+        start = bisect.bisect_left(self._keys, query)
+        for key, rank, group in self._entries[start:]:
+            if not key.startswith(query):
+                break
+            exact = 0 if key == query else 1
+            for record_index in group:
+                score = (rank, exact, len(key), record_index)
+                if record_index not in best or score < best[record_index]:
+                    best[record_index] = score
+                    kinds[record_index] = rank
+        ranked = sorted(best, key=best.__getitem__)[:limit]
+        kind_names = {rank: kind for kind, rank in _MATCH_RANK.items()}
+        return [dict(self.records[i], match=kind_names[kinds[i]]) for i in ranked]
+
+
+@single_flight_cache(maxsize=1)
+def load_cipai_aliases() -> Dict[str, List[str]]:
+    """别名表：词牌名 -> 别名列表，同一词牌出现多行时合并。"""
+    aliases: Dict[str, List[str]] = {}
+    for row in read_cipai_alias_rows(CIPAI_ALIAS_PATH):
+        merged = aliases.setdefault(row.cipai_name, [])
+        merged.extend(alias for alias in row.aliases if alias not in merged)
+    return aliases
+
+
+@single_flight_cache(maxsize=1)
+def get_cipai_search_index() -> CipaiSearchIndex:
+    cipai_list, _ = get_cipai_summary_list()
+    try:
+        intro_dict = load_cipai_intro()
+    except Exception:
+        intro_dict = {}
+    aliases = {name: parse_aliases(intro) for name, intro in intro_dict.items()}
+    try:
+        alias_table = load_cipai_aliases()
+    except Exception:
+        alias_table = {}
+    for name, names in alias_table.items():
+        merged = aliases.setdefault(name, [])
+        merged.extend(alias for alias in names if alias not in merged)
+    return CipaiSearchIndex(cipai_list, aliases)
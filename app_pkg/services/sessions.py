@@ -0,0 +1,72 @@
+import hashlib
+from typing import Tuple, List, Dict, Any, Iterable, NamedTuple, Optional
+
+from .analysis import load_tone_table
+from .cache import LRUCache, current_generation
+from .datafiles import RHYMEBOOK_PATHS
+from .layout import TextLayout, build_text_layout
+
+
+class AnalysisSession(NamedTuple):
+    """一次 /analyze 的中间结果，供换韵脚、选词牌等后续请求直接复用。
+
+    会话内容只由文本、韵书与数据版本决定，创建后不再修改，多个请求可以安全共享。
+    """
+    text: str
+    rhymebook: str
+    layout: TextLayout
+    tone_text: List[Tuple[str, str]]
+    # 多个匹配时可选的词牌行号；为空表示不限制
+    candidates: Tuple[int, ...]
+    # 创建时的数据版本；数据重载后行号可能改变，旧会话视为过期
+    generation: int
+
+
+def session_id_for(text: str, rhymebook: str) -> str:
+    """按原文与韵书计算会话 id：同一输入总是得到同一 id，结果缓存中的响应体可以直接带上它。"""
+    digest = hashlib.blake2b(f"{rhymebook}\x00{text}".encode('utf-8'), digest_size=12)
+    return digest.hexdigest()
+
+
+def session_size(session: AnalysisSession) -> int:
+    """会话占用内存的粗略估计（字节）：原文、版式与逐字声调约每字 200 字节。"""
+    return 512 + 200 * len(session.text) + 8 * len(session.candidates)
+
+
+def create_session(text: str, rhymebook: str, candidates: Iterable[int] = ()) -> AnalysisSession:
+    layout = build_text_layout(text)
+    return AnalysisSession(text, rhymebook, layout, load_tone_table(rhymebook).mark(layout.text_drop), tuple(candidates),
+                           current_generation().number)
+
+
+def get_session(sessions: LRUCache, session_id: str) -> Optional[AnalysisSession]:
+    """取仍然有效的会话；不存在或属于旧数据版本时返回 None。"""
+    session = sessions.get(session_id)
+    if session is None or session.generation != current_generation().number:
+        return None
+    return session
+
+
+def restore_session(sessions: LRUCache, session_id: str, text: Any = None, rhymebook: Any = None) -> Optional[AnalysisSession]:
+    """取 session_id 的会话；本进程中没有（已淘汰，或多进程模式下由其他工作进程创建）而请求带有原文时按原文重建。
+
+    会话 id 只由原文与韵书决定，重建的会话以原文对应的 id 保存。重建的会话不记录候选词牌（不限制所选词牌），
+    与提交完整参数时的校验一致；无法重建时返回 None。
+    """
+    session = get_session(sessions, session_id)
+    if session is not None or not isinstance(text, str) or not text.strip() or rhymebook not in RHYMEBOOK_PATHS:
+        return session
+    session = create_session(text, rhymebook)
+    sessions.set(session_id_for(text, rhymebook), session, size=session_size(session))
+    return session
+
+
+def remember_session(sessions: LRUCache, text: str, rhymebook: str, data: Optional[Dict[str, Any]] = None) -> str:
+    """确保 (text, rhymebook) 的会话存在并返回其 id；data 为分析结果，从中取候选词牌。"""
+    session_id = session_id_for(text, rhymebook)
+    if get_session(sessions, session_id) is None:
+        candidates = [item['row_index'] for item in (data or {}).get('matching_cipai') or []
+                      if item.get('row_index') is not None]
+        session = create_session(text, rhymebook, candidates)
+        sessions.set(session_id, session, size=session_size(session))
+    return session_id
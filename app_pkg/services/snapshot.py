@@ -0,0 +1,169 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Tuple, List, Dict, Any, Optional
+
+import numpy as np
+
+from .datafiles import DATA_FILES
+from .patterns import CipaiPatternStore, ShapeIndex
+from .tonetable import TABLE_ARRAYS, ToneTable
+
+
+# 快照文件格式：
+#   文件头  <8s I I Q>  魔数、格式版本、保留位、元数据长度
+#   元数据  UTF-8 JSON：来源文件签名、数组目录、字符串表与小型字典
+#   数组区  各 numpy 数组的原始字节，起始位置按 ALIGNMENT 对齐，读取时直接映射为只读数组
+SNAPSHOT_MAGIC = b'CIPAISNP'
+SNAPSHOT_FORMAT_VERSION = 3
+ALIGNMENT = 64
+_HEADER = struct.Struct('<8sIIQ')
+
+# 词牌谱中按行存放的数值数组
+_STORE_ARRAYS = ('totals', 'zhong', 'ping', 'ze', 'tone_codes', 'tone_offsets', 'split_values', 'split_offsets')
+# (总字数, 分段字数) -> 行号 的索引
+_SHAPE_ARRAYS = ('keys', 'offsets', 'rows')
+
+logger = logging.getLogger(__name__)
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(
+    path: str,
+    store: CipaiPatternStore,
+    rhymebooks: Dict[str, ToneTable],
+    yunjiao: Dict[str, List[List[int]]],
+    intro: Dict[str, str],
+    sources: Tuple[str, ...] = DATA_FILES,
+) -> int:
+    """把已编译的数据写成快照文件，返回写入的字节数。
+
+    先写临时文件再替换，运行中的进程仍可继续读取旧快照的映射。
+    """
+    arrays: Dict[str, np.ndarray] = {f"cipai.{name}": getattr(store, name) for name in _STORE_ARRAYS}
+    arrays.update({f"cipai.shape_{name}": getattr(store.shape_index, name) for name in _SHAPE_ARRAYS})
+    rhymebook_meta: Dict[str, Any] = {}
+    for key, table in rhymebooks.items():
+        rhymebook_meta[key] = {"yunbu_names": table.yunbu_names}
+        arrays.update({f"rhymebook.{key}.{name}": arr for name, arr in table.arrays().items()})
+
+    directory: Dict[str, List[Any]] = {}
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        offset = _align(offset)
+        directory[name] = [arr.dtype.str, int(arr.size), offset]
+        offset += arr.nbytes
+
+    source_info = []
+    for source in sources:
+        st = os.stat(source)
+        source_info.append([source, st.st_mtime_ns, st.st_size])
+
+    meta_bytes = json.dumps({
+        "created": time.time(),
+        "sources": source_info,
+        "arrays": directory,
+        "cipai": {"names": store.names, "authors": store.authors},
+        "rhymebooks": rhymebook_meta,
+        "yunjiao": yunjiao,
+        "intro": intro,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    data_start = _align(_HEADER.size + len(meta_bytes))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, 0, len(meta_bytes)))
+        f.write(meta_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + directory[name][2])
+            f.write(arr.tobytes())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+class DataSnapshot:
+    """映射到内存的数据快照；各方法返回与对应 CSV/JSON 加载函数相同结构的数据。"""
+
+    def __init__(self, path: str, buffer: mmap.mmap, meta: Dict[str, Any], data_start: int) -> None:
+        self.path = path
+        self.meta = meta
+        self._buffer = buffer
+        self._data_start = data_start
+
+    @classmethod
+    def open(cls, path: str) -> 'DataSnapshot':
+        """打开并校验快照，格式不符时抛出 ValueError。"""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < _HEADER.size:
+            raise ValueError("快照文件不完整")
+        magic, version, _, meta_length = _HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("不是数据快照文件")
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"快照格式版本 {version} 与当前版本 {SNAPSHOT_FORMAT_VERSION} 不一致")
+        meta = json.loads(buffer[_HEADER.size:_HEADER.size + meta_length].decode('utf-8'))
+        return cls(path, buffer, meta, _align(_HEADER.size + meta_length))
+
+    def is_fresh(self) -> bool:
+        """快照须比每个来源文件都新，且来源文件列表与大小未变。"""
+        snapshot_mtime = os.stat(self.path).st_mtime_ns
+        recorded = {path: size for path, _, size in self.meta.get("sources", [])}
+        if set(recorded) != set(DATA_FILES):
+            return False
+        for path, size in recorded.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_size != size or st.st_mtime_ns > snapshot_mtime:
+                return False
+        return True
+
+    def array(self, name: str) -> np.ndarray:
+        dtype, count, offset = self.meta["arrays"][name]
+        return np.frombuffer(self._buffer, dtype=np.dtype(dtype), count=count, offset=self._data_start + offset)
+
+    def cipai_patterns(self) -> CipaiPatternStore:
+        cipai = self.meta["cipai"]
+        shape_index = ShapeIndex(*(self.array(f"cipai.shape_{name}") for name in _SHAPE_ARRAYS))
+        return CipaiPatternStore(cipai["names"], cipai["authors"],
+                                 *(self.array(f"cipai.{name}") for name in _STORE_ARRAYS),
+                                 shape_index=shape_index)
+
+    def tone_table(self, key: str) -> Optional[ToneTable]:
+        """韵书的数组表示，数组直接引用映射的内存，不复制。"""
+        meta = self.meta["rhymebooks"].get(key)
+        if meta is None:
+            return None
+        return ToneTable(*(self.array(f"rhymebook.{key}.{name}") for name in TABLE_ARRAYS), meta["yunbu_names"])
+
+    def yunjiao(self) -> Dict[str, List[List[int]]]:
+        return self.meta["yunjiao"]
+
+    def cipai_intro(self) -> Dict[str, str]:
+        return self.meta["intro"]
+
+
+def open_fresh_snapshot(path: str) -> Optional[DataSnapshot]:
+    """快照存在、格式一致且未过期时返回 DataSnapshot，否则返回 None 由调用方回退到源文件。"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = DataSnapshot.open(path)
+    except (OSError, ValueError) as e:
+        logger.warning("忽略数据快照 %s: %s", path, e)
+        return None
+    if not snapshot.is_fresh():
+        logger.info("数据快照 %s 早于数据文件，改为读取源文件", path)
+        return None
+    return snapshot
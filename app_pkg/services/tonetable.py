@@ -0,0 +1,203 @@
+from collections.abc import Mapping
+from typing import Tuple, List, Dict, Iterator, Optional
+
+import numpy as np
+
+from .patterns import TONE_CODES, TONE_NAMES, TONE_UNKNOWN
+
+
+# 直接寻址覆盖的码位区间：CJK 统一汉字基本区
+CJK_BASE = 0x4E00
+CJK_END = 0xA000
+# 标注声调时译码表覆盖的码位上限：基本多文种平面
+BMP_END = 0x10000
+
+RhymebookDicts = Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, Tuple[str, ...]]]
+
+# 以数组形式保存（写入快照）的字段
+TABLE_ARRAYS = ('chars', 'tones', 'yunbu_sets', 'set_offsets', 'set_values', 'slots', 'slot_tones')
+
+# 声调编码字符 -> 名称，把译码表 translate 的结果还原为 平/仄/未知
+_TONE_NAME_OF = {chr(code): name for code, name in enumerate(TONE_NAMES)}
+
+
+class ToneTable:
+    """韵书的只读数组表示，查询直接读数组，不持有逐字的 Python 对象。
+
+    - chars：按韵书顺序排列的字（码位，uint32）
+    - tones：各字的声调编码（patterns.TONE_PING / TONE_ZE）
+    - yunbu_sets：各字所属韵部组合的编号；多数字只属一两个韵部，不同的组合只有数百种
+    - set_values[set_offsets[k]:set_offsets[k + 1]]：第 k 种组合包含的韵部在 yunbu_names 中的编号
+    - slots：CJK 基本区码位 -> 字的下标，-1 表示未收录；区外的少数字另查一个小字典
+    - slot_tones：CJK 基本区码位 -> 声调编码，未收录为 TONE_UNKNOWN，标注声调时一次查表
+
+    数组可直接映射自数据快照，多个进程共享同一份物理内存；fork 出的进程读取时也不会因引用计数写入而复制页面。
+    逐字查询经由 memoryview 取值，比对 numpy 数组逐个下标取值快得多；韵部组合的元组在加载时构造一次。
+    整段标注声调用 str.translate 查 码位 -> 声调编码字符 的译码表（64 KB 字符串），不为每个字构造码位整数。
+    """
+
+    __slots__ = TABLE_ARRAYS + ('yunbu_names', '_extra', '_slot_view', '_tone_view', '_tone_chars',
+                                '_set_view', '_set_tuples', '_char_yunbu')
+
+    def __init__(
+        self,
+        chars: np.ndarray,
+        tones: np.ndarray,
+        yunbu_sets: np.ndarray,
+        set_offsets: np.ndarray,
+        set_values: np.ndarray,
+        slots: np.ndarray,
+        slot_tones: np.ndarray,
+        yunbu_names: List[str],
+    ) -> None:
+        self.chars = chars
+        self.tones = tones
+        self.yunbu_sets = yunbu_sets
+        self.set_offsets = set_offsets
+        self.set_values = set_values
+        self.slots = slots
+        self.slot_tones = slot_tones
+        self.yunbu_names = yunbu_names
+        outside = np.flatnonzero((chars < CJK_BASE) | (chars >= CJK_END))
+        self._extra: Dict[int, int] = {int(chars[i]): int(i) for i in outside}
+        self._slot_view = memoryview(slots)
+        self._tone_view = memoryview(tones)
+        bmp_tones = np.full(BMP_END, TONE_UNKNOWN, dtype=np.uint8)
+        bmp_tones[CJK_BASE:CJK_END] = slot_tones
+        for code, i in self._extra.items():
+            if code < BMP_END:
+                bmp_tones[code] = tones[i]
+        self._tone_chars = bmp_tones.tobytes().decode('latin-1')
+        self._set_view = memoryview(yunbu_sets)
+        offsets = set_offsets.tolist()
+        values = set_values.tolist()
+        self._set_tuples: List[Tuple[str, ...]] = [
+            tuple(yunbu_names[j] for j in values[offsets[k]:offsets[k + 1]]) for k in range(len(offsets) - 1)
+        ]
+        self._char_yunbu = CharYunbuView(self)
+
+    @classmethod
+    def from_dicts(
+        cls,
+        tone_dict: Dict[str, str],
+        yunbu_dict: Dict[str, List[str]],
+        char_yunbu: Dict[str, Tuple[str, ...]],
+    ) -> 'ToneTable':
+        """由 build_tone_dict 的结果编译。"""
+        char_list = list(tone_dict)
+        yunbu_names = list(yunbu_dict)
+        yunbu_ids = {name: i for i, name in enumerate(yunbu_names)}
+        chars = np.fromiter((ord(c) for c in char_list), dtype=np.uint32, count=len(char_list))
+        tones = np.fromiter((TONE_CODES[tone_dict[c]] for c in char_list), dtype=np.uint8, count=len(char_list))
+        set_ids: Dict[Tuple[int, ...], int] = {}
+        yunbu_sets = np.fromiter(
+            (set_ids.setdefault(tuple(yunbu_ids[name] for name in char_yunbu.get(c, ())), len(set_ids))
+             for c in char_list),
+            dtype=np.uint16, count=len(char_list),
+        )
+        set_offsets = np.zeros(len(set_ids) + 1, dtype=np.int32)
+        set_offsets[1:] = np.cumsum([len(ids) for ids in set_ids])
+        set_values = np.fromiter((j for ids in set_ids for j in ids), dtype=np.uint16, count=int(set_offsets[-1]))
+        slots = np.full(CJK_END - CJK_BASE, -1, dtype=np.int32)
+        slot_tones = np.full(CJK_END - CJK_BASE, TONE_UNKNOWN, dtype=np.uint8)
+        inside = np.flatnonzero((chars >= CJK_BASE) & (chars < CJK_END))
+        slots[chars[inside] - CJK_BASE] = inside
+        slot_tones[chars[inside] - CJK_BASE] = tones[inside]
+        return cls(chars, tones, yunbu_sets, set_offsets, set_values, slots, slot_tones, yunbu_names)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in TABLE_ARRAYS}
+
+    def __len__(self) -> int:
+        return len(self.chars)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self.arrays().values())
+
+    def index(self, char: str) -> int:
+        """字在 chars 中的下标，未收录时为 -1。"""
+        if len(char) != 1:
+            return -1
+        code = ord(char)
+        if CJK_BASE <= code < CJK_END:
+            return self._slot_view[code - CJK_BASE]
+        return self._extra.get(code, -1)
+
+    def _tone_code(self, code: int) -> int:
+        """CJK 基本区以外的码位的声调编码。"""
+        i = self._extra.get(code, -1)
+        return self._tone_view[i] if i >= 0 else TONE_UNKNOWN
+
+    def tone_codes(self, text: str) -> np.ndarray:
+        """逐字的声调编码（uint8），未收录的字为 TONE_UNKNOWN，与 encode_tone_text(mark_tone(...)) 相同。"""
+        codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+        inside = (codes >= CJK_BASE) & (codes < CJK_END)
+        result = np.full(len(codes), TONE_UNKNOWN, dtype=np.uint8)
+        result[inside] = self.slot_tones[codes[inside] - CJK_BASE]
+        for i in np.flatnonzero(~inside).tolist():
+            result[i] = self._tone_code(int(codes[i]))
+        return result
+
+    def mark(self, text: str) -> List[Tuple[str, str]]:
+        """与 analysis.mark_tone 相同：[(字, 平/仄/未知), ...]。"""
+        codes = text.translate(self._tone_chars)
+        if not codes.isascii():
+            # 译码表之外（基本多文种平面以外）的字原样保留，此时逐字查询
+            return [(char, self.tone(char)) for char in text]
+        return list(zip(text, map(_TONE_NAME_OF.__getitem__, codes)))
+
+    def tone(self, char: str) -> str:
+        i = self.index(char)
+        return TONE_NAMES[self._tone_view[i]] if i >= 0 else TONE_NAMES[TONE_UNKNOWN]
+
+    def _yunbu_at(self, i: int) -> Tuple[str, ...]:
+        return self._set_tuples[self._set_view[i]]
+
+    def yunbu(self, char: str) -> Tuple[str, ...]:
+        i = self.index(char)
+        return self._yunbu_at(i) if i >= 0 else ()
+
+    @property
+    def char_yunbu(self) -> 'CharYunbuView':
+        return self._char_yunbu
+
+    def to_dicts(self) -> RhymebookDicts:
+        """还原为 build_tone_dict 的 (tone_dict, yunbu_dict, char_yunbu)，字与韵部的顺序与编译前一致。"""
+        char_list = [chr(code) for code in self.chars.tolist()]
+        tones = self.tones.tolist()
+        tone_dict = {char: TONE_NAMES[tone] for char, tone in zip(char_list, tones)}
+        yunbu_dict: Dict[str, List[str]] = {name: [] for name in self.yunbu_names}
+        char_yunbu: Dict[str, Tuple[str, ...]] = {}
+        for char, set_id in zip(char_list, self.yunbu_sets.tolist()):
+            names = self._set_tuples[set_id]
+            char_yunbu[char] = names
+            for name in names:
+                yunbu_dict[name].append(char)
+        return tone_dict, yunbu_dict, char_yunbu
+
+
+class CharYunbuView(Mapping):
+    """ToneTable 的 字 -> 韵部元组 只读视图，可代替 build_tone_dict 返回的 char_yunbu 字典。"""
+
+    __slots__ = ('_table',)
+
+    def __init__(self, table: ToneTable) -> None:
+        self._table = table
+
+    def __getitem__(self, char: str) -> Tuple[str, ...]:
+        i = self._table.index(char) if isinstance(char, str) else -1
+        if i < 0:
+            raise KeyError(char)
+        return self._table._yunbu_at(i)
+
+    def get(self, char: str, default: Optional[Tuple[str, ...]] = None) -> Optional[Tuple[str, ...]]:
+        table = self._table
+        i = table.index(char) if isinstance(char, str) else -1
+        return table._set_tuples[table._set_view[i]] if i >= 0 else default
+
+    def __iter__(self) -> Iterator[str]:
+        return (chr(code) for code in self._table.chars.tolist())
+
+    def __len__(self) -> int:
+        return len(self._table)
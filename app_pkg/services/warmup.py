@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from typing import Tuple, List, Dict, Any, Callable, Optional
+
+from .analysis import (
+    get_cipai_key_index,
+    get_cipai_summary_list,
+    get_fillword_frameworks,
+    load_cipai_intro,
+    load_cipai_patterns,
+    load_data_snapshot,
+    load_tone_table,
+    load_yunjiao,
+)
+from .candidates import get_candidate_index
+from .search import get_cipai_search_index
+
+
+WarmupStep = Tuple[str, Callable[[], Any]]
+
+WARMUP_PENDING = 'pending'
+WARMUP_RUNNING = 'warming'
+WARMUP_READY = 'ready'
+WARMUP_FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def default_warmup_steps() -> List[WarmupStep]:
+    """分析接口依赖的全部加载函数与索引，按依赖顺序排列。"""
+    return [
+        ('data_snapshot', load_data_snapshot),
+        ('rhymebook_1', lambda: load_tone_table('1')),
+        ('rhymebook_2', lambda: load_tone_table('2')),
+        ('cipai_patterns', load_cipai_patterns),
+        ('shape_tree', lambda: load_cipai_patterns().shape_tree),
+        ('yunjiao', load_yunjiao),
+        ('cipai_intro', load_cipai_intro),
+        ('cipai_summary', get_cipai_summary_list),
+        ('cipai_key_index', get_cipai_key_index),
+        ('fillword_frameworks', get_fillword_frameworks),
+        ('cipai_search', get_cipai_search_index),
+        ('candidates_1', lambda: get_candidate_index('1')),
+        ('candidates_2', lambda: get_candidate_index('2')),
+    ]
+
+
+class Warmup:
+    """在后台线程中依次执行预热步骤，并记录每一步的耗时与错误。
+
+    加载函数本身是 single-flight 的，预热期间到达的请求会等待同一次加载，而不会重复解析数据。
+    """
+
+    def __init__(self, steps: List[WarmupStep]) -> None:
+        self.steps = steps
+        self.state = WARMUP_PENDING
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == WARMUP_READY
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='data-warmup', daemon=True)
+        self._thread.start()
+
+    def run(self) -> None:
+        with self._lock:
+            self.state = WARMUP_RUNNING
+            self.started_at = time.time()
+        start = time.perf_counter()
+        for name, step in self.steps:
+            step_start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.exception("预热步骤 %s 失败", name)
+                with self._lock:
+                    self.errors[name] = str(e)
+                continue
+            with self._lock:
+                self.timings[name] = round((time.perf_counter() - step_start) * 1000, 1)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.finished_at = time.time()
+            self.state = WARMUP_FAILED if self.errors else WARMUP_READY
+        if self.errors:
+            logger.error("数据预热结束，%d 个步骤失败，用时 %.0fms", len(self.errors), elapsed_ms)
+        else:
+            logger.info("数据预热完成，用时 %.0fms", elapsed_ms)
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待预热结束（无论成功与否），返回是否已就绪。"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.state == WARMUP_READY,
+                "completed_steps": len(self.timings),
+                "total_steps": len(self.steps),
+                "timings_ms": dict(self.timings),
+                "errors": dict(self.errors),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析热点路径的微基准测试
+用真实词牌谱按平仄随机填字生成合成语料，逐项计时后输出 JSON，可与上一次结果比较。
+
+用法示例：
+    python benchmark.py -o bench.json
+    python benchmark.py --compare bench.json --threshold 0.15    # 任一项 p50 变慢超过 15% 时退出码为 1
+    python benchmark.py --only analyze --quick
+
+结果中的耗时单位为微秒（每次调用）。
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app_pkg.services import analysis
+from app_pkg.services.cache import LRUCache
+from app_pkg.services.candidates import get_candidate_index, suggest_for_slot
+from app_pkg.services.layout import _scan
+from app_pkg.services.live import live_events, start_live_state
+from app_pkg.services.patterns import TONE_PING, TONE_ZE
+from app_pkg.services.sessions import create_session
+
+
+Case = Tuple[str, Callable[[Any], Any], List[Any]]
+
+PUNCTUATION = ('，', '。')
+
+
+def build_corpus(size: int, seed: int, rhymebook: str = '2') -> List[Dict[str, Any]]:
+    """按词牌谱的平仄逐字随机取字，分段处加标点；约十分之一去掉一字，覆盖近似匹配路径。"""
+    rng = random.Random(seed)
+    store = analysis.load_cipai_patterns()
+    tone_dict, _, _ = analysis.load_rhymebook_with_yunbu(rhymebook)
+    by_tone = {'平': sorted(c for c, t in tone_dict.items() if t == '平'),
+               '仄': sorted(c for c, t in tone_dict.items() if t == '仄')}
+    any_tone = by_tone['平'] + by_tone['仄']
+
+    corpus: List[Dict[str, Any]] = []
+    for _ in range(size):
+        row = rng.randrange(len(store))
+        tones = store.tones(row).tolist()
+        split = store.split_length(row) or (len(tones),)
+        chars = []
+        for code in tones:
+            pool = by_tone['平'] if code == TONE_PING else by_tone['仄'] if code == TONE_ZE else any_tone
+            chars.append(rng.choice(pool))
+        if rng.random() < 0.1 and len(chars) > 2:
+            del chars[rng.randrange(len(chars))]
+        parts: List[str] = []
+        start = 0
+        for i, n in enumerate(split):
+            parts.append(''.join(chars[start:start + n]) + PUNCTUATION[i % 2])
+            start += n
+        if start < len(chars):
+            parts.append(''.join(chars[start:]) + '。')
+        corpus.append({
+            "text": ''.join(parts),
+            "row": row,
+            "cipai_name": store.names[row],
+            "author": store.authors[row],
+            "rhymebook": rhymebook,
+        })
+    return corpus
+
+
+def time_case(fn: Callable[[Any], Any], inputs: List[Any], min_time: float, repeat: int) -> Dict[str, Any]:
+    """逐次计时：至少运行 min_time 秒且每个输入至少 repeat 轮，返回每次调用的统计（微秒）。"""
+    samples: List[float] = []
+    deadline = time.perf_counter() + min_time
+    rounds = 0
+    while rounds < repeat or time.perf_counter() < deadline:
+        for item in inputs:
+            start = time.perf_counter_ns()
+            fn(item)
+            samples.append((time.perf_counter_ns() - start) / 1000.0)
+        rounds += 1
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "mean_us": round(statistics.fmean(samples), 3),
+        "p50_us": round(samples[len(samples) // 2], 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_us": round(samples[0], 3),
+    }
+
+
+def build_cases(corpus: List[Dict[str, Any]]) -> List[Case]:
+    from app_pkg import create_app
+
+    store = analysis.load_cipai_patterns()
+    tone_table = analysis.load_tone_table('2')
+    char_yunbu = tone_table.char_yunbu
+    yunjiao_dict = analysis.load_yunjiao()
+    texts = [item["text"] for item in corpus]
+    layouts = [_scan(text) for text in texts]
+    marked = [tone_table.mark(layout.text_drop) for layout in layouts]
+    exact = [(m, item, layout) for m, item, layout in zip(marked, corpus, layouts)
+             if layout.length == len(store.tones(item["row"]))]
+
+    unique_keys = {item["row_index"]: item["unique_key"] for item in analysis.get_cipai_summary_list()[0]}
+    by_key, _ = analysis.get_cipai_key_index()
+    frameworks = analysis.get_fillword_frameworks()
+    candidate_index = get_candidate_index('2')
+
+    # 边写边查：在已开始检查的状态上改动中间一个字（分段不变），与 estimate_poetry 重新分析全文对照
+    live_cache = LRUCache(max_entries=0)
+    live_edits = []
+    for _, item, layout in exact:
+        if layout.length:
+            state, _ = start_live_state(create_session(item["text"], '2'), item["row"])
+            pos = layout.original_position(layout.length // 2)
+            replacement = '花' if item["text"][pos] != '花' else '月'
+            live_edits.append((state, item["text"][:pos] + replacement + item["text"][pos + 1:]))
+
+    app = create_app()
+    if 'warmup' in app.extensions:
+        app.extensions['warmup'].wait()
+    # 逐请求的访问日志会干扰计时；端到端计时也不经过结果缓存
+    app.logger.setLevel(logging.WARNING)
+    app.extensions['analyze_cache'].max_entries = 0
+    client = app.test_client()
+
+    def post(path: str, payload: Dict[str, Any]) -> None:
+        response = client.post(path, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} 返回 {response.status_code}")
+
+    return [
+        ('preprocess_text', _scan, texts),
+        ('find_matching_cipai', lambda layout: analysis.find_matching_cipai(layout.length, layout.split_length, store), layouts),
+        ('mark_tone', lambda layout: tone_table.mark(layout.text_drop), layouts),
+        ('get_score_tone', lambda e: analysis.get_score_tone(e[0], store.tone_list(e[1]["row"])), exact),
+        ('get_score_tone_codes', lambda e: analysis.get_score_tone_codes(e[0], store.tones(e[1]["row"])), exact),
+        ('yunjiao_options', lambda e: analysis.build_yunjiao_options(
+            e[2], e[1]["cipai_name"], e[1]["author"], char_yunbu, yunjiao_dict), exact),
+        ('get_cipai_summary_list', lambda _: analysis.get_cipai_summary_list.__wrapped__(), [None]),
+        ('create_fillword_framework', lambda item: analysis.create_fillword_framework(
+            store.tone_list(item["row"]), list(store.split_length(item["row"]))), corpus),
+        # 按 unique_key 直接取预先生成的框架，耗时与词牌谱行数及行号无关
+        ('fillword_framework_lookup', lambda item: frameworks[by_key[unique_keys[item["row"]]]], corpus),
+        ('suggest_for_slot', lambda item: suggest_for_slot(
+            candidate_index, char_yunbu, frameworks[item["row"]]["tone_pattern"], frameworks[item["row"]]["split_length"],
+            [len(frameworks[item["row"]]["tone_pattern"]) - 1], item["row"] % len(frameworks[item["row"]]["tone_pattern"])), corpus),
+        ('estimate_poetry', lambda text: analysis.estimate_poetry(text, '2'), texts),
+        ('live_edit', lambda e: list(live_events(live_cache, e[0], e[1])), live_edits),
+        ('http_analyze', lambda item: post('/analyze', {"text": item["text"], "rhymebook": '2'}), corpus),
+        ('http_analyze_with_selected_cipai', lambda item: post('/analyze_with_selected_cipai', {
+            "text": item["text"], "rhymebook": '2', "cipai_name": item["cipai_name"],
+            "author": item["author"], "rhythm": store.rhythm(item["row"]), "row_index": item["row"]}), corpus),
+        ('http_get_fillword_framework', lambda item: post('/get_fillword_framework', {
+            "cipai_name": item["cipai_name"], "author": item["author"]}), corpus),
+        ('http_suggest', lambda item: post('/suggest', {
+            "cipai_name": item["cipai_name"], "author": item["author"], "unique_key": unique_keys[item["row"]],
+            "position": 0}), corpus),
+    ]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """返回 p50 相对基线变慢超过 threshold 的条目说明；同时把对比打印到标准错误。"""
+    regressions: List[str] = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = result["p50_us"] / base["p50_us"] if base["p50_us"] else 1.0
+        line = f"{name:36s} {base['p50_us']:>12.1f} -> {result['p50_us']:>12.1f} us  ({ratio - 1:+.1%})"
+        if ratio > 1 + threshold:
+            regressions.append(line)
+            line += "  变慢"
+        print(line, file=sys.stderr)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="分析热点路径的微基准测试")
+    parser.add_argument('-o', '--output', help="结果 JSON 输出路径，默认标准输出")
+    parser.add_argument('--corpus-size', type=int, default=200, help="合成语料的条数")
+    parser.add_argument('--seed', type=int, default=20240813, help="合成语料的随机种子")
+    parser.add_argument('--min-time', type=float, default=1.0, help="每项至少运行的秒数")
+    parser.add_argument('--repeat', type=int, default=3, help="每项至少遍历语料的轮数")
+    parser.add_argument('--only', action='append', default=[], help="只运行名称包含该子串的条目，可重复")
+    parser.add_argument('--quick', action='store_true', help="快速模式：较小语料，每项只跑一轮")
+    parser.add_argument('--compare', help="基线结果 JSON；与之比较 p50")
+    parser.add_argument('--threshold', type=float, default=0.15, help="允许的 p50 变慢比例")
+    args = parser.parse_args()
+
+    # 数据文件使用相对路径，切换到项目根目录
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    if args.quick:
+        args.corpus_size, args.min_time, args.repeat = min(args.corpus_size, 50), 0.0, 1
+
+    corpus = build_corpus(args.corpus_size, args.seed)
+    results: Dict[str, Any] = {}
+    for name, fn, inputs in build_cases(corpus):
+        if args.only and not any(part in name for part in args.only):
+            continue
+        # 预跑一轮，排除首次调用的缓存填充
+        for item in inputs[:5]:
+            fn(item)
+        results[name] = time_case(fn, inputs, args.min_time, args.repeat)
+        print(f"{name:36s} p50 {results[name]['p50_us']:>10.1f} us  p95 {results[name]['p95_us']:>10.1f} us",
+              file=sys.stderr)
+
+    report = {
+        "meta": {
+            "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus_size": args.corpus_size,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} 项 p50 变慢超过 {args.threshold:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
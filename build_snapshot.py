@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据快照编译脚本
+把 data/ 下的词牌谱、韵书、韵脚与词牌介绍编译为一个可内存映射的快照文件，
+服务启动时直接映射读取，不再解析 CSV/JSON。数据文件更新后需重新运行。
+
+用法示例：
+    python build_snapshot.py
+    python build_snapshot.py -o /tmp/snapshot.bin --check
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from app_pkg.services.analysis import build_data_snapshot
+from app_pkg.services.datafiles import SNAPSHOT_PATH
+from app_pkg.services.snapshot import open_fresh_snapshot
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="编译数据快照")
+    parser.add_argument('-o', '--output', default=None,
+                        help="快照输出路径，默认为服务读取的位置（项目根目录下的 data/snapshot.bin）")
+    parser.add_argument('--check', action='store_true', help="编译后重新打开快照并报告加载耗时")
+    args = parser.parse_args()
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    # 指定的路径相对于调用者的当前目录；默认路径与服务一致，相对于项目根目录
+    if args.output is not None:
+        output = os.path.abspath(args.output)
+    else:
+        output = os.path.join(project_dir, SNAPSHOT_PATH or 'data/snapshot.bin')
+    # 数据文件使用相对路径，切换到项目根目录
+    os.chdir(project_dir)
+
+    start = time.perf_counter()
+    size = build_data_snapshot(output)
+    elapsed = time.perf_counter() - start
+    print(f"已写入 {output}（{size / 1024:.1f} KB），用时 {elapsed:.2f} 秒", file=sys.stderr)
+
+    if args.check:
+        start = time.perf_counter()
+        snapshot = open_fresh_snapshot(output)
+        if snapshot is None:
+            print("快照校验失败", file=sys.stderr)
+            return 1
+        store = snapshot.cipai_patterns()
+        for key in snapshot.meta["rhymebooks"]:
+            snapshot.tone_table(key)
+        elapsed = time.perf_counter() - start
+        print(f"校验通过：{len(store)} 条词牌，加载用时 {elapsed * 1000:.1f} 毫秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -96,20 +96,27 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // 词牌搜索相关变量
-    let cipaiList = [];
+    // 已从服务端取得的词牌记录，按 unique_key 索引
+    const cipaiByKey = new Map();
     let selectedCipai = null;
+    // 当前填词框架对应的词牌，供 /suggest 使用
+    let currentFillword = null;
+    let suggestSeq = 0;
     let currentSuggestionIndex = -1;
+    let searchSeq = 0;
 
     // 词牌搜索输入事件
-    if (cipaiSearch) cipaiSearch.addEventListener('input', function() {
+    if (cipaiSearch) cipaiSearch.addEventListener('input', async function() {
         const query = this.value.trim();
         if (query.length === 0) {
+            searchSeq++;
             hideCipaiSuggestions();
             hideStartFillwordBtn();
             return;
         }
         
-        const suggestions = searchCipai(query);
+        const suggestions = await searchCipai(query);
+        if (suggestions === null) return;  // 已有更新的输入
         showCipaiSuggestions(suggestions, query);
     });
 
@@ -144,19 +151,18 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 常用词牌按钮点击事件
     document.querySelectorAll('.common-cipai-btn').forEach(btn => {
-        btn.addEventListener('click', function() {
+        btn.addEventListener('click', async function() {
             const cipaiName = this.getAttribute('data-cipai');
             if (cipaiName && cipaiSearch) {
                 cipaiSearch.value = cipaiName;
-                // 触发搜索
-                cipaiSearch.dispatchEvent(new Event('input'));
-                // 自动选择第一个匹配的词牌
-                setTimeout(() => {
-                    const suggestions = document.querySelectorAll('.cipai-suggestion-item');
-                    if (suggestions.length > 0) {
-                        selectCipaiSuggestion(suggestions[0]);
-                    }
-                }, 100);
+                // 搜索并自动选择第一个匹配的词牌
+                const suggestions = await searchCipai(cipaiName);
+                if (suggestions === null) return;
+                showCipaiSuggestions(suggestions, cipaiName);
+                const items = cipaiSuggestions.querySelectorAll('.cipai-suggestion-item');
+                if (items.length > 0) {
+                    selectCipaiSuggestion(items[0]);
+                }
             }
         });
     });
@@ -185,19 +191,17 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // 加载词牌列表
+    // 加载默认词牌（词牌列表改为按需搜索，不再整体下载）
     async function loadCipaiList() {
         try {
-            const response = await fetch('/get_cipai_list');
+            const response = await fetch('/search_cipai?q=');
             const result = await response.json();
             
             if (result.success) {
-                // 保存词牌列表到全局变量
-                cipaiList = result.data.cipai_list;
-                
                 // 设置默认选项（竹枝+皇甫松+14）
-                if (result.data.default_index >= 0 && result.data.default_index < result.data.cipai_list.length) {
-                    const defaultCipai = result.data.cipai_list[result.data.default_index];
+                const defaultCipai = result.data.default;
+                if (defaultCipai) {
+                    rememberCipai(defaultCipai);
                     selectCipai(defaultCipai);
                     cipaiSearch.value = defaultCipai.cipai_name;
                 }
@@ -211,22 +215,30 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // 搜索词牌
-    function searchCipai(query) {
-        if (!cipaiList || cipaiList.length === 0) {
-            return [];
+    function rememberCipai(cipai) {
+        if (cipai && cipai.unique_key) {
+            cipaiByKey.set(cipai.unique_key, cipai);
+        }
+    }
+
+    // 搜索词牌（服务端按词牌名、别名、作者、拼音首字母或全拼检索）
+    // 返回 null 表示结果已过期（期间又有新的输入）
+    async function searchCipai(query) {
+        const seq = ++searchSeq;
+        try {
+            const response = await fetch(`/search_cipai?q=${encodeURIComponent(query)}&limit=10`);
+            const result = await response.json();
+            if (seq !== searchSeq) return null;
+            if (!result.success) {
+                console.error('搜索词牌失败:', result.error);
+                return [];
+            }
+            result.data.results.forEach(rememberCipai);
+            return result.data.results;
+        } catch (error) {
+            console.error('Error:', error);
+            return seq === searchSeq ? [] : null;
         }
-        
-        const lowerQuery = query.toLowerCase();
-        return cipaiList.filter(cipai => {
-            const displayName = cipai.display_name || `${cipai.cipai_name} - ${cipai.author} (${cipai.total_chars}字)`;
-            return cipai.cipai_name.toLowerCase().includes(lowerQuery) ||
-                   cipai.author.toLowerCase().includes(lowerQuery) ||
-                   displayName.toLowerCase().includes(lowerQuery) ||
-                   cipai.cipai_name.includes(query) ||
-                   cipai.author.includes(query) ||
-                   displayName.includes(query);
-        }).slice(0, 10); // 限制显示前10个结果
     }
 
     // 显示词牌建议
@@ -284,11 +296,11 @@ document.addEventListener('DOMContentLoaded', function() {
         // 找到对应的词牌对象，优先使用unique_key进行匹配
         let cipai;
         if (uniqueKey) {
-            cipai = cipaiList.find(c => c.unique_key === uniqueKey);
+            cipai = cipaiByKey.get(uniqueKey);
         }
         // 如果unique_key匹配失败，回退到原来的匹配方式
         if (!cipai) {
-            cipai = cipaiList.find(c => c.cipai_name === cipaiName && c.author === author);
+            cipai = Array.from(cipaiByKey.values()).find(c => c.cipai_name === cipaiName && c.author === author);
         }
         
         if (cipai) {
@@ -331,6 +343,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 加载填词框架
     async function loadFillwordFramework(cipaiName, author, uniqueKey) {
+        currentFillword = { cipai_name: cipaiName, author: author, unique_key: uniqueKey || '' };
         try {
             const requestData = {
                 cipai_name: cipaiName,
@@ -427,6 +440,9 @@ document.addEventListener('DOMContentLoaded', function() {
         });
         
         html += '</div>'; // 结束框架
+
+        // 当前输入框的候选字与双字词
+        html += '<div class="fillword-suggestions" id="fillword-suggestions" style="display: none;"></div>';
         
         // 添加图例容器（紧贴下阕外部）
         html += `
@@ -524,6 +540,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 // 每次输入后检查是否所有字都填好，更新最终分析按钮状态
                 updateFinalAnalysisButtonState();
             });
+
+            input.addEventListener('focus', function() {
+                loadFillwordSuggestions(this);
+            });
             
             input.addEventListener('keydown', function(e) {
                 // 支持退格键跳转到上一个输入框
@@ -553,6 +573,76 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // 为获得焦点的输入框取候选字（及从该字起的双字词），韵脚处按已填韵脚字的韵部筛选
+    async function loadFillwordSuggestions(input) {
+        const container = document.getElementById('fillword-suggestions');
+        if (!container || !currentFillword) return;
+        const seq = ++suggestSeq;
+        const inputs = Array.from(document.querySelectorAll('.fillword-char-input'));
+        const base = {
+            ...currentFillword,
+            rhymebook: document.getElementById('rhymebook-select').value,
+            position: parseInt(input.getAttribute('data-global-index')),
+            filled: inputs.map(item => item.value.trim()),
+            limit: 12
+        };
+
+        const fetchSuggest = async (length) => {
+            try {
+                const response = await fetch('/suggest', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({ ...base, length })
+                });
+                const result = await response.json();
+                return result.success ? result.data : null;
+            } catch (error) {
+                console.log('获取候选失败:', error);
+                return null;
+            }
+        };
+
+        const [single, phrase] = await Promise.all([fetchSuggest(1), fetchSuggest(2)]);
+        // 焦点已移到其他输入框时丢弃过期结果
+        if (seq !== suggestSeq) return;
+
+        const renderRow = (label, data) => {
+            if (!data || data.candidates.length === 0) return '';
+            const rhyme = data.rhyme ? `<span class="fillword-suggestion-rhyme">韵${data.yunbu.length ? '·' + data.yunbu.join('、') : ''}</span>` : '';
+            return `
+                <div class="fillword-suggestion-row">
+                    <span class="fillword-suggestion-label">${label}${rhyme}</span>
+                    ${data.candidates.map(text => `<button type="button" class="fillword-suggestion-item" data-position="${data.position}" data-text="${text}">${text}</button>`).join('')}
+                </div>
+            `;
+        };
+        const html = renderRow('候选字', single) + renderRow('双字词', phrase);
+        container.innerHTML = html;
+        container.style.display = html ? 'block' : 'none';
+
+        container.querySelectorAll('.fillword-suggestion-item').forEach(button => {
+            // mousedown 时阻止默认行为，避免输入框先失去焦点
+            button.addEventListener('mousedown', e => e.preventDefault());
+            button.addEventListener('click', function() {
+                const start = parseInt(this.getAttribute('data-position'));
+                const text = this.getAttribute('data-text');
+                let last = null;
+                Array.from(text).forEach((char, offset) => {
+                    const target = inputs.find(item => parseInt(item.getAttribute('data-global-index')) === start + offset);
+                    if (target) {
+                        target.value = char;
+                        last = target;
+                    }
+                });
+                updateFinalAnalysisButtonState();
+                const next = last ? getNextFillwordInput(last) : null;
+                if (next) next.focus();
+            });
+        });
+    }
+
     // 获取下一个填词输入框
     function getNextFillwordInput(currentInput) {
         const allInputs = Array.from(document.querySelectorAll('.fillword-char-input'));
@@ -906,24 +996,17 @@ document.addEventListener('DOMContentLoaded', function() {
     // 处理韵脚模式选择
     async function handleYunjiaoSelection(selectedId, originalResult) {
         const formData = new FormData(form);
-        const data = {
-            text: formData.get('text'),
-            rhymebook: formData.get('rhymebook'),
+        const selection = {
             cipai_name: originalResult.cipai_name,
             author: originalResult.author,
             yunjiao_id: parseInt(selectedId)
         };
 
         try {
-            const response = await fetch('/select_yunjiao', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(data)
+            const result = await postWithSession('/select_yunjiao', originalResult.session_id, selection, {
+                text: formData.get('text'),
+                rhymebook: formData.get('rhymebook')
             });
-
-            const result = await response.json();
             
             if (result.success) {
                 // 更新韵脚标注显示
@@ -1430,6 +1513,19 @@ function showCipaiSelectionInterface(result) {
         return;
     }
     
+    // 近似匹配时提示用户检查标点
+    const selectionTitle = document.getElementById('cipai-selection-title');
+    const selectionHint = document.getElementById('cipai-selection-hint');
+    if (selectionTitle && selectionHint) {
+        if (result.approximate) {
+            selectionTitle.textContent = '未能精确匹配词牌';
+            selectionHint.textContent = '文本的分段与词谱不完全一致（可能多了或少了标点），以下是最接近的词牌，请选择一个进行分析：';
+        } else {
+            selectionTitle.textContent = '发现多个匹配的词牌';
+            selectionHint.textContent = '根据您输入的文本字数和分段，识别出多个可能的词牌。请选择一个进行分析：';
+        }
+    }
+
     // 清空现有选项
     cipaiOptions.innerHTML = '';
     
@@ -1455,6 +1551,14 @@ function showCipaiSelectionInterface(result) {
                 <div class="cipai-option-stat">
                     <span>仄声：${cipai.ze}</span>
                 </div>
+                ${typeof cipai.distance === 'number' ? `
+                <div class="cipai-option-stat">
+                    <span>分段差异：${cipai.distance}</span>
+                </div>` : ''}
+                ${typeof cipai.score === 'number' ? `
+                <div class="cipai-option-stat">
+                    <span>平仄得分：${cipai.score}%</span>
+                </div>` : ''}
             </div>
         `;
         
@@ -1505,6 +1609,32 @@ function showCipaiSelectButton(originalResult, selectedCipai) {
     });
 }
 
+// 带 session_id 的后续请求：附上原文与韵书，处理请求的进程中没有该会话时（多进程部署）按原文重建；
+// 服务端仍无法使用会话（410）时改为附带完整参数重发
+async function postWithSession(url, sessionId, selection, fullPayload) {
+    const post = (body) => fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(body)
+    });
+
+    if (sessionId) {
+        const response = await post({
+            session_id: sessionId,
+            text: fullPayload.text,
+            rhymebook: fullPayload.rhymebook,
+            ...selection
+        });
+        if (response.status !== 410) {
+            return response.json();
+        }
+    }
+    const response = await post({ ...fullPayload, ...selection });
+    return response.json();
+}
+
 async function analyzeWithSelectedCipai(originalResult, selectedCipai) {
     const confirmBtn = document.getElementById('confirm-cipai-btn');
     const btnText = confirmBtn.querySelector('.btn-text');
@@ -1514,20 +1644,14 @@ async function analyzeWithSelectedCipai(originalResult, selectedCipai) {
     btnText.textContent = '分析中...';
     
     try {
-        const response = await fetch('/analyze_with_selected_cipai', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                text: originalResult.original_text,
-                rhymebook: document.getElementById('rhymebook-select').value,
-                selected_cipai: selectedCipai
-            })
+        const result = await postWithSession('/analyze_with_selected_cipai', originalResult.session_id, {
+            row_index: selectedCipai.row_index
+        }, {
+            text: originalResult.original_text,
+            rhymebook: document.getElementById('rhymebook-select').value,
+            selected_cipai: selectedCipai
         });
         
-        const result = await response.json();
-        
         if (!result.success) {
             showToast(result.error || '分析失败', 'error');
             return;